@@ -0,0 +1,4 @@
+"""
+Benchmarks for the Harvester clients, run against FakeHarvester, a local
+stand-in for the Authentic8 API. Run with `python -m benchmarks.run`.
+"""
@@ -0,0 +1,270 @@
+import base64
+import binascii
+import io
+import json
+import random
+import re
+import time
+import uuid
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import List, Optional
+from urllib.parse import parse_qs
+
+
+class Protocol(object):
+    """
+    Command, key and archive names of the Harvester API. Spelled out here
+    rather than taken from the library, so the fake runs against any
+    version of it.
+    """
+    CREATE_TASK_COMMAND = 'create_harvest_task'
+    DELETE_FILE_COMMAND = 'deletefile'
+    DELETE_TASK_COMMAND = 'delete_harvest_task'
+    FIND_TASK_COMMAND = 'find_harvest_task'
+    SET_AUTH_COMMAND = 'setauth'
+    TASK_STATUS_DONE = 'done'
+    ALREADY_DELETED_ERROR = 'KeyError: Did not find any matching records'
+    MHTML_ARCHIVE_PATH = 'contents/output.mhtml'
+    PNG_ARCHIVE_PATH = 'contents/output.png'
+
+    KEY_COMMAND = 'command'
+    KEY_CREATED = 'created'
+    KEY_DELETED = 'deleted'
+    KEY_ERROR = 'error'
+    KEY_FILE_ID = 'file_id'
+    KEY_FINISHED = 'finished'
+    KEY_ID = 'id'
+    KEY_RESULT = 'result'
+    KEY_RESULT_FILE_ID = 'result_file_id'
+    KEY_STATUS = 'status'
+    KEY_TASK_ID = 'task_id'
+    KEY_TASK_PARAMS = 'task_params'
+    KEY_URLS = 'urls'
+
+
+_RANGE = re.compile(r'bytes=(\d+)-(\d*)')
+_BOUNDARY = '----MultipartBoundary--benchmark----'
+
+
+def build_mhtml(size: int, url: str = 'https://example.com/', seed: int = 0) -> bytes:
+    """
+    A Blink style MHTML document of roughly size bytes: a quoted-printable
+    page followed by base64 encoded resources.
+    """
+    rng = random.Random(seed)
+    page = ('<html><head><meta charset="utf-8"><title>Benchmark</title></head><body>'
+            + '<p>Lorem ipsum dolor sit amet = consectetur</p>' * 64 + '</body></html>').encode('utf-8')
+    parts = [
+        f'From: <Saved by Blink>\r\nSnapshot-Content-Location: {url}\r\nSubject: Benchmark\r\n'
+        f'MIME-Version: 1.0\r\nContent-Type: multipart/related;\r\n\ttype="text/html";\r\n'
+        f'\tboundary="{_BOUNDARY}"\r\n\r\n\r\n'.encode('ascii'),
+        f'--{_BOUNDARY}\r\nContent-Type: text/html\r\nContent-ID: <frame-0@mhtml.blink>\r\n'
+        f'Content-Transfer-Encoding: quoted-printable\r\nContent-Location: {url}\r\n\r\n'.encode('ascii'),
+        binascii.b2a_qp(page).replace(b'\n', b'\r\n'),
+        b'\r\n',
+    ]
+    written = sum(len(part) for part in parts)
+    i = 0
+    while written < size:
+        chunk = rng.randbytes(min(64 * 1024, max(1, (size - written) * 3 // 4)))
+        body = base64.encodebytes(chunk).replace(b'\n', b'\r\n')
+        header = (f'--{_BOUNDARY}\r\nContent-Type: image/png\r\nContent-Transfer-Encoding: base64\r\n'
+                  f'Content-Location: {url}resource-{i}.png\r\n\r\n').encode('ascii')
+        parts += [header, body, b'\r\n']
+        written += len(header) + len(body) + 2
+        i += 1
+    parts.append(f'--{_BOUNDARY}--\r\n'.encode('ascii'))
+    return b''.join(parts)
+
+
+def build_archive(image_size: int, mhtml_size: int, seed: int = 0) -> bytes:
+    """
+    A Harvester capture archive holding a random (incompressible)
+    screenshot of image_size bytes and an MHTML document of about
+    mhtml_size bytes.
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+        z.writestr(Protocol.PNG_ARCHIVE_PATH, random.Random(seed).randbytes(image_size))
+        z.writestr(Protocol.MHTML_ARCHIVE_PATH, build_mhtml(mhtml_size, seed=seed))
+    return buffer.getvalue()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; without this, delayed ACKs add ~40ms to every keep-alive request.
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: bytes = b'', headers: Optional[dict] = None) -> None:
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        fake = self.server.fake
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        fake._count(self.path)
+        if fake.latency:
+            time.sleep(fake.latency)
+        if fake.error_rate and fake._random() < fake.error_rate:
+            self._send(503, b'injected error')
+            return
+        if self.path == '/api/':
+            self._send(200, json.dumps(fake._api(json.loads(body))).encode('utf-8'),
+                       {'Content-Type': 'application/json'})
+        elif self.path == '/getfile/':
+            self._getfile(parse_qs(body.decode('ascii')))
+        else:
+            self._send(404)
+
+    def _getfile(self, params: dict) -> None:
+        fake = self.server.fake
+        file_id = params.get(Protocol.KEY_ID, [None])[0]
+        with fake._lock:
+            exists = file_id in fake.files
+        if not exists:
+            self._send(404)
+            return
+        archive = fake.archive
+        match = _RANGE.match(self.headers.get('Range') or '')
+        if not fake.ranges or not match:
+            self._send(200, archive)
+            return
+        start = int(match.group(1))
+        end = min(int(match.group(2)) if match.group(2) else len(archive) - 1, len(archive) - 1)
+        if start >= len(archive):
+            self._send(416)
+            return
+        self._send(206, archive[start:end + 1], {'Content-Range': f'bytes {start}-{end}/{len(archive)}'})
+
+
+class FakeHarvester(object):
+    """
+    In-process stand-in for the Authentic8 Harvester API, serving /api/
+    (setauth, create_harvest_task, find_harvest_task, delete_harvest_task and
+    deletefile) and /getfile/ over HTTP on a local port.
+
+    Every request is delayed by latency seconds and fails with a 503 with
+    probability error_rate. Tasks finish task_duration seconds after they
+    are created and every result file is the same archive, built once with
+    an image_size byte screenshot and a mhtml_size byte MHTML document.
+    getfile honours Range requests unless ranges is False.
+    """
+    PROTOCOL = Protocol
+    STATUS_RUNNING = 'running'
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, task_duration: float = 0.0,
+                 image_size: int = 1024 * 1024, mhtml_size: int = 256 * 1024, ranges: bool = True,
+                 seed: int = 0) -> None:
+        self.latency = latency
+        self.error_rate = error_rate
+        self.task_duration = task_duration
+        self.ranges = ranges
+        self.archive = build_archive(image_size, mhtml_size, seed)
+        self.tasks = {}
+        self.files = set()
+        self.requests = {}
+        self._rng = random.Random(seed)
+        self._lock = Lock()
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self._server.server_address[1]}'
+
+    def start(self) -> 'FakeHarvester':
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        Thread(target=self._server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> 'FakeHarvester':
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def add_tasks(self, count: int, finished: bool = True, age: float = 0.0) -> List[str]:
+        """
+        Create count tasks directly, created age seconds ago, e.g. to
+        measure the cost of polling a large task list. Returns their IDs.
+        """
+        created = time.time() - age
+        finishes = created if finished else float('inf')
+        with self._lock:
+            return [self._add_task([], finishes, created) for _ in range(count)]
+
+    def _random(self) -> float:
+        with self._lock:
+            return self._rng.random()
+
+    def _count(self, path: str) -> None:
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def _add_task(self, urls: list, finishes: float, created: Optional[float] = None) -> str:
+        task_id = uuid.uuid4().hex
+        file_id = uuid.uuid4().hex
+        self.tasks[task_id] = {
+            'urls': urls, 'finishes': finishes, 'file_id': file_id,
+            'created': created if created is not None else time.time()
+        }
+        self.files.add(file_id)
+        return task_id
+
+    def _record(self, task_id: str, task: dict, now: float) -> dict:
+        c = self.PROTOCOL
+        done = task['finishes'] <= now
+        return {
+            c.KEY_TASK_ID: task_id,
+            c.KEY_STATUS: c.TASK_STATUS_DONE if done else self.STATUS_RUNNING,
+            c.KEY_RESULT_FILE_ID: task['file_id'] if done else None,
+            c.KEY_CREATED: task['created'],
+        }
+
+    def _api(self, payload: list) -> list:
+        c = self.PROTOCOL
+        results = []
+        now = time.time()
+        with self._lock:
+            for command in payload:
+                name = command.get(c.KEY_COMMAND)
+                if name == c.SET_AUTH_COMMAND:
+                    results.append({c.KEY_RESULT: True})
+                elif name == c.CREATE_TASK_COMMAND:
+                    urls = command.get(c.KEY_TASK_PARAMS, {}).get(c.KEY_URLS, [])
+                    task_id = self._add_task(urls, now + self.task_duration)
+                    results.append({c.KEY_RESULT: {c.KEY_TASK_ID: task_id}})
+                elif name == c.FIND_TASK_COMMAND:
+                    records = [self._record(task_id, task, now) for task_id, task in self.tasks.items()]
+                    if command.get(c.KEY_FINISHED):
+                        records = [record for record in records if record[c.KEY_STATUS] == c.TASK_STATUS_DONE]
+                    results.append({c.KEY_RESULT: records})
+                elif name == c.DELETE_TASK_COMMAND:
+                    deleted = self.tasks.pop(command.get(c.KEY_TASK_ID), None) is not None
+                    results.append({c.KEY_RESULT: {c.KEY_DELETED: deleted}})
+                elif name == c.DELETE_FILE_COMMAND:
+                    file_id = command.get(c.KEY_FILE_ID)
+                    if file_id in self.files:
+                        self.files.discard(file_id)
+                        results.append({c.KEY_RESULT: f'deleted file {file_id}'})
+                    else:
+                        results.append({c.KEY_ERROR: c.ALREADY_DELETED_ERROR})
+                else:
+                    results.append({c.KEY_ERROR: f'Unknown command {name}'})
+        return results
@@ -0,0 +1,404 @@
+"""
+Run the benchmark suite against a local FakeHarvester and write the results
+as JSON, one record per benchmark and parameter set:
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --quick --compare results.json
+    python -m benchmarks.run download --error-rate 0.05 --download-size 256
+
+Each record holds the benchmark name, its parameters, the per iteration
+timings in seconds (min, median, mean and max), the number of failed
+operations and, where it applies, a throughput. --compare prints the change
+in median time against a previous results file, e.g. one produced by an
+older version of the library.
+
+Only the original client API is required. Benchmarks of APIs the installed
+version of the library lacks are recorded as skipped, with the reason,
+instead of failing the run.
+"""
+import argparse
+import importlib
+import inspect
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from importlib import metadata
+from typing import Callable, Iterator, List, Optional
+
+from harvester import CountryCode, HarvesterAsyncClient
+
+from .fake_server import FakeHarvester, build_archive, build_mhtml
+
+MB = 1024 * 1024
+
+
+class MissingApi(Exception):
+    """
+    The installed version of the library does not provide an API a
+    benchmark needs.
+    """
+
+
+def _api(obj, name: str):
+    """
+    The attribute name of obj, raising MissingApi if there is none.
+    """
+    try:
+        return getattr(obj, name)
+    except AttributeError:
+        raise MissingApi(f'{type(obj).__name__}.{name} is not available') from None
+
+
+def _module_api(module: str, name: str):
+    try:
+        return _api(importlib.import_module(module), name)
+    except ImportError:
+        raise MissingApi(f'{module} is not available') from None
+
+
+def _accepts(func: Callable, *names: str) -> bool:
+    parameters = inspect.signature(func).parameters
+    return all(name in parameters for name in names)
+
+
+def _failures(func: Callable, *args, **kwargs) -> int:
+    """
+    Call func, returning 1 if it raised and 0 otherwise, so one failed call
+    does not end the iteration it belongs to.
+    """
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        return 1
+    return 0
+
+
+def _measure(func: Callable[[], object], repeat: int, setup: Optional[Callable[[], object]] = None,
+             counts_failures: bool = False) -> dict:
+    """
+    Time repeat calls of func. With counts_failures, func returns the number
+    of its operations that failed; an iteration that raises counts as one
+    failure.
+    """
+    times = []
+    failures = 0
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        try:
+            result = func()
+        except Exception:
+            failures += 1
+        else:
+            if counts_failures:
+                failures += result
+        times.append(time.perf_counter() - started)
+    return {
+        'iterations': repeat,
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.fmean(times),
+        'max': max(times),
+        'failures': failures,
+    }
+
+
+def _record(name: str, params: dict, seconds: dict, unit: Optional[str] = None,
+            amount: Optional[float] = None) -> dict:
+    record = {'name': name, 'params': params, 'seconds': seconds}
+    if unit is not None:
+        record['throughput'] = {'unit': unit, 'value': amount / seconds['median'] if seconds['median'] else None}
+    return record
+
+
+def _skipped(name: str, params: dict, reason: str) -> dict:
+    return {'name': name, 'params': params, 'skipped': reason}
+
+
+def _run(results: List[dict], name: str, params: dict, bench: Callable[[], dict], unit: Optional[str] = None,
+         amount: Optional[float] = None) -> None:
+    """
+    Append the record of bench, which returns the result of _measure, or a
+    skipped record if it needs an API the library does not have.
+    """
+    try:
+        seconds = bench()
+    except MissingApi as e:
+        results.append(_skipped(name, params, str(e)))
+    else:
+        results.append(_record(name, params, seconds, unit, amount))
+
+
+@contextmanager
+def _client(fake: Optional[FakeHarvester] = None, **kwargs) -> Iterator[HarvesterAsyncClient]:
+    """
+    A client for fake, passing on only the keyword arguments this version
+    of the client accepts, and closed afterwards if it can be.
+    """
+    kwargs = {name: value for name, value in kwargs.items() if _accepts(HarvesterAsyncClient, name)}
+    url = fake.url if fake is not None else 'http://127.0.0.1'
+    client = HarvesterAsyncClient('bench auth', 'bench file auth', 'bench bucket', '/bench', url, **kwargs)
+    try:
+        yield client
+    finally:
+        close = getattr(client, 'close', None)
+        if close is not None:
+            close()
+
+
+def _fake(config: dict, **kwargs) -> FakeHarvester:
+    kwargs.setdefault('latency', config['latency'])
+    return FakeHarvester(error_rate=config['error_rate'], **kwargs)
+
+
+def bench_submit(config: dict) -> List[dict]:
+    """
+    Task submission rate, one create_harvest_task per URL and packed into
+    bulk multi-URL tasks.
+    """
+    results = []
+    count = config['submit_count']
+    latency = config['latency']
+    urls = [f'https://{i}.example.com/' for i in range(count)]
+    with _fake(config) as fake, _client(fake, pool_maxsize=32) as client:
+        _run(results, 'submit.sequential', {'urls': count, 'latency': latency},
+             lambda: _measure(lambda: sum(_failures(client.create_capture_task, url, CountryCode.US) for url in urls),
+                              config['repeat'], counts_failures=True),
+             'tasks/s', count)
+
+        def bulk(**kwargs) -> dict:
+            create_capture_tasks = _api(client, 'create_capture_tasks')
+            return _measure(lambda: len(create_capture_tasks(urls, CountryCode.US, **kwargs).errors), config['repeat'],
+                            counts_failures=True)
+
+        for workers in (8, 32):
+            _run(results, 'submit.concurrent', {'urls': count, 'workers': workers, 'latency': latency},
+                 lambda: bulk(urls_per_task=1, max_workers=workers), 'tasks/s', count)
+        _run(results, 'submit.bulk', {'urls': count, 'urls_per_task': 25, 'latency': latency},
+             lambda: bulk(urls_per_task=25), 'urls/s', count)
+    return results
+
+
+def bench_poll(config: dict) -> List[dict]:
+    """
+    Cost of listing N tasks, materialized with get_tasks and streamed with
+    iter_tasks.
+    """
+    results = []
+    for count in config['poll_tasks']:
+        with _fake(config, latency=0.0) as fake, _client(fake) as client:
+            fake.add_tasks(count)
+            _run(results, 'poll.get_tasks', {'tasks': count},
+                 lambda: _measure(lambda: client.get_tasks(finished=True), config['repeat']), 'tasks/s', count)
+
+            def stream() -> dict:
+                iter_tasks = _api(client, 'iter_tasks')
+                return _measure(lambda: sum(1 for _ in iter_tasks(finished=True)), config['repeat'])
+
+            _run(results, 'poll.iter_tasks', {'tasks': count}, stream, 'tasks/s', count)
+    return results
+
+
+def bench_download(config: dict) -> List[dict]:
+    """
+    Download throughput of download_file and save_file_to_disk.
+    """
+    results = []
+    size = config['download_size']
+    with _fake(config, latency=0.0, image_size=size, mhtml_size=64 * 1024) as fake, _client(fake) as client, \
+            tempfile.TemporaryDirectory() as tmp:
+        fake.add_tasks(1)
+        file_id = next(iter(fake.files))
+        archive_mb = len(fake.archive) / MB
+        dst = os.path.join(tmp, 'capture.zip')
+        _run(results, 'download.memory', {'mb': round(archive_mb, 2)},
+             lambda: _measure(lambda: client.download_file(file_id), config['repeat']), 'MB/s', archive_mb)
+
+        def to_disk(workers: int) -> dict:
+            kwargs = {}
+            if _accepts(client.save_file_to_disk, 'max_workers', 'segment_size'):
+                kwargs = {'max_workers': workers, 'segment_size': 8 * MB}
+            elif workers != 1:
+                raise MissingApi('save_file_to_disk does not support parallel downloads')
+            return _measure(lambda: client.save_file_to_disk(file_id, dst, **kwargs), config['repeat'],
+                            setup=lambda: os.path.exists(dst) and os.remove(dst))
+
+        for workers in (1, 4):
+            _run(results, 'download.disk', {'mb': round(archive_mb, 2), 'workers': workers},
+                 lambda: to_disk(workers), 'MB/s', archive_mb)
+    return results
+
+
+def bench_extract(config: dict) -> List[dict]:
+    """
+    Time to pull the screenshot and the html out of archives of increasing
+    size.
+    """
+    results = []
+    with _client() as client, tempfile.TemporaryDirectory() as tmp:
+        for size in config['archive_sizes']:
+            archive = build_archive(size, size // 4)
+            path = os.path.join(tmp, f'{size}.zip')
+            with open(path, 'wb') as f:
+                f.write(archive)
+            params = {'image_bytes': size, 'mhtml_bytes': size // 4}
+            # Archives are passed as bytes, the only form every version accepts.
+            _run(results, 'extract.image', params,
+                 lambda: _measure(lambda: client.image_from_zip(archive), config['repeat']), 'MB/s', size / MB)
+            _run(results, 'extract.html', params,
+                 lambda: _measure(lambda: client.html_from_zip(archive), config['repeat']), 'MB/s', size / 4 / MB)
+
+            def to_disk() -> dict:
+                extract_image = _api(client, 'extract_image')
+                dst = os.path.join(tmp, 'output.png')
+                return _measure(lambda: extract_image(path, dst), config['repeat'])
+
+            _run(results, 'extract.image_to_disk', params, to_disk, 'MB/s', size / MB)
+    return results
+
+
+def bench_mhtml(config: dict) -> List[dict]:
+    """
+    Time to find and decode the captured page in MHTML documents of
+    increasing size.
+    """
+    results = []
+    for size in config['mhtml_sizes']:
+        document = build_mhtml(size)
+
+        def parse() -> dict:
+            html_from_mhtml = _module_api('harvester.mhtml', 'html_from_mhtml')
+            return _measure(lambda: html_from_mhtml(document), config['repeat'])
+
+        _run(results, 'mhtml.parse', {'bytes': len(document)}, parse, 'MB/s', len(document) / MB)
+    return results
+
+
+BENCHMARKS = {
+    'submit': bench_submit,
+    'poll': bench_poll,
+    'download': bench_download,
+    'extract': bench_extract,
+    'mhtml': bench_mhtml,
+}
+
+DEFAULT_CONFIG = {
+    'repeat': 5,
+    'latency': 0.0,
+    'error_rate': 0.0,
+    'submit_count': 500,
+    'poll_tasks': [100, 10000, 50000],
+    'download_size': 64 * MB,
+    'archive_sizes': [MB, 16 * MB, 64 * MB],
+    'mhtml_sizes': [256 * 1024, 4 * MB, 32 * MB],
+}
+
+QUICK_CONFIG = {
+    'repeat': 2,
+    'latency': 0.0,
+    'error_rate': 0.0,
+    'submit_count': 50,
+    'poll_tasks': [100, 2000],
+    'download_size': 4 * MB,
+    'archive_sizes': [MB],
+    'mhtml_sizes': [256 * 1024],
+}
+
+
+def _version() -> str:
+    try:
+        return metadata.version('dcu-harvester-library')
+    except metadata.PackageNotFoundError:
+        return 'unknown'
+
+
+def run(config: dict, names: Optional[List[str]] = None) -> dict:
+    results = []
+    for name, bench in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        results.extend(bench(config))
+    return {
+        'library_version': _version(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'config': config,
+        'results': results,
+    }
+
+
+def _key(record: dict) -> str:
+    return f'{record["name"]} {json.dumps(record["params"], sort_keys=True)}'
+
+
+def compare(baseline: dict, current: dict) -> List[str]:
+    """
+    One line per benchmark that ran in both runs, with the relative change
+    in median time (negative is faster).
+    """
+    previous = {_key(record): record for record in baseline['results'] if 'seconds' in record}
+    lines = []
+    for record in current['results']:
+        old = previous.get(_key(record))
+        if old is None or 'seconds' not in record or not old['seconds']['median']:
+            continue
+        change = record['seconds']['median'] / old['seconds']['median'] - 1
+        lines.append(f'{_key(record)}: {old["seconds"]["median"]:.6f}s -> {record["seconds"]["median"]:.6f}s '
+                     f'({change:+.1%})')
+    return lines
+
+
+def _megabytes(value: str) -> int:
+    return int(float(value) * MB)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('benchmarks', nargs='*', help=f'benchmarks to run, of {", ".join(BENCHMARKS)} (all)')
+    parser.add_argument('--output', help='write the results to this file instead of stdout')
+    parser.add_argument('--quick', action='store_true', help='smaller sizes and fewer iterations')
+    parser.add_argument('--repeat', type=int, help='iterations per benchmark')
+    parser.add_argument('--latency', type=float, help='seconds of simulated latency per API request')
+    parser.add_argument('--error-rate', type=float, help='fraction of requests failed with a 503')
+    parser.add_argument('--submit-count', type=int, help='URLs submitted by the submit benchmarks')
+    parser.add_argument('--poll-tasks', type=int, nargs='+', help='task list sizes polled')
+    parser.add_argument('--download-size', type=_megabytes, help='MB of screenshot in the downloaded archive')
+    parser.add_argument('--archive-sizes', type=_megabytes, nargs='+', help='MB of screenshot in extracted archives')
+    parser.add_argument('--mhtml-sizes', type=_megabytes, nargs='+', help='MB of parsed MHTML documents')
+    parser.add_argument('--compare', help='results file to compare against')
+    args = parser.parse_args(argv)
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f'unknown benchmarks: {", ".join(sorted(unknown))}')
+    if args.error_rate is not None and not 0 <= args.error_rate <= 1:
+        parser.error('--error-rate must be between 0 and 1')
+
+    config = dict(QUICK_CONFIG if args.quick else DEFAULT_CONFIG)
+    for key in ('repeat', 'latency', 'error_rate', 'submit_count', 'poll_tasks', 'download_size', 'archive_sizes',
+                'mhtml_sizes'):
+        if getattr(args, key) is not None:
+            config[key] = getattr(args, key)
+    results = run(config, args.benchmarks)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    if args.compare:
+        with open(args.compare) as f:
+            for line in compare(json.load(f), results):
+                print(line, file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,34 @@
-from . import client
+from . import (archive, batch, cache, client, download, extraction, journal,
+               metrics, mhtml, pipeline, tasks, throttle)
 
+AdaptiveConcurrency = throttle.AdaptiveConcurrency
+BulkCaptureResult = client.BulkCaptureResult
+CaptureCache = cache.CaptureCache
+CapturePipeline = pipeline.CapturePipeline
+CaptureRequest = pipeline.CaptureRequest
+CaptureResult = pipeline.CaptureResult
 CountryCode = client.CountryCode
+DownloadResult = download.DownloadResult
+ExtractionExecutor = extraction.ExtractionExecutor
+ExtractionResult = extraction.ExtractionResult
+HarvesterArchive = archive.HarvesterArchive
 HarvesterAsyncClient = client.HarvesterAsyncClient
+HarvesterBatch = batch.HarvesterBatch
+HarvesterTask = tasks.HarvesterTask
+HistogramInstrumentation = metrics.HistogramInstrumentation
+HtmlContent = mhtml.HtmlContent
+Instrumentation = metrics.Instrumentation
+JournalEntry = journal.JournalEntry
+PurgeResult = client.PurgeResult
+TaskJournal = journal.TaskJournal
+Throttle = throttle.Throttle
+TokenBucket = throttle.TokenBucket
+
+
+def __getattr__(name: str):
+    # HarvesterAioClient needs aiohttp, an optional dependency (the 'aio'
+    # extra), so it is only imported when asked for.
+    if name == 'HarvesterAioClient':
+        from .aio_client import HarvesterAioClient
+        return HarvesterAioClient
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
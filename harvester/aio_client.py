@@ -0,0 +1,389 @@
+import asyncio
+import json
+import os
+import time
+from typing import AsyncIterator, Iterable, List, Optional
+
+import aiohttp
+
+from .cache import CaptureCache
+from .client import BulkCaptureResult, CountryCode, HarvesterClientBase
+from .download import DownloadResult, FileDownloader
+from .journal import TaskJournal
+from .metrics import (DECODE_SECONDS, ERRORS, GETFILE, NULL_INSTRUMENTATION,
+                      REQUEST_BYTES, RESPONSE_BYTES, ROUND_TRIP_SECONDS,
+                      Instrumentation)
+from .singleflight import AsyncSingleFlight
+from .tasks import HarvesterTask, TaskStreamParser
+from .throttle import Throttle
+from .watcher import AsyncTaskWatcher
+
+
+class HarvesterAioClient(HarvesterClientBase):
+    """
+    Provide a set of awaitable methods for interacting with Authentic8
+    Harvester. Mirrors HarvesterAsyncClient, but runs on a non-blocking
+    aiohttp session so a single event loop can drive many captures at once.
+    """
+    DEFAULT_MAX_CONCURRENCY = 64
+    DEFAULT_KEEPALIVE_TIMEOUT = 30
+
+    def __init__(self, token: str, storage_token: str, s3_bucket: str, path: str, url: str,
+                 pool_maxsize: int = HarvesterClientBase.DEFAULT_POOL_MAXSIZE,
+                 pool_maxsize_per_host: int = HarvesterClientBase.DEFAULT_POOL_MAXSIZE,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 timeout=HarvesterClientBase.DEFAULT_TIMEOUT,
+                 max_retries: int = HarvesterClientBase.DEFAULT_MAX_RETRIES,
+                 backoff_factor: float = HarvesterClientBase.DEFAULT_BACKOFF_FACTOR,
+                 keepalive_timeout: float = DEFAULT_KEEPALIVE_TIMEOUT,
+                 cache: Optional[CaptureCache] = None,
+                 lock_dir: Optional[str] = None,
+                 throttle: Optional[Throttle] = None,
+                 instrumentation: Optional[Instrumentation] = None,
+                 journal: Optional[TaskJournal] = None) -> None:
+        """
+        pool_maxsize caps the total number of open connections and
+        pool_maxsize_per_host the connections to a single host.
+        max_concurrency bounds the number of commands in flight, including
+        those waiting on a connection. timeout is either a single value or a
+        (connect, read) tuple in seconds. Requests that fail to connect or
+        with 429/5xx are retried max_retries times with exponential backoff,
+        except that task creation is only retried on 429. cache and lock_dir
+        configure capture, see there. Every call waits on throttle, if given,
+        before taking a max_concurrency slot.
+        Latencies, sizes and errors are reported to instrumentation. Tasks
+        are recorded in journal, if given, see HarvesterAsyncClient.
+        """
+        super().__init__(token, storage_token, s3_bucket, path, url)
+        self._metrics = instrumentation or NULL_INSTRUMENTATION
+        self._journal = journal
+        self._throttle = throttle or Throttle()
+        self._cache = cache
+        self._flights = AsyncSingleFlight(lock_dir)
+        self._pool_maxsize = pool_maxsize
+        self._pool_maxsize_per_host = pool_maxsize_per_host
+        self._keepalive_timeout = keepalive_timeout
+        self._max_retries = max_retries
+        self._backoff_factor = backoff_factor
+        if isinstance(timeout, tuple):
+            self._timeout = aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+        else:
+            self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._session = None
+        self._watcher = None
+
+    async def __aenter__(self) -> 'HarvesterAioClient':
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """
+        The session has to be created from within a running event loop, so it
+        is created on first use rather than in the constructor.
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self._pool_maxsize,
+                limit_per_host=self._pool_maxsize_per_host,
+                keepalive_timeout=self._keepalive_timeout
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self._timeout)
+        return self._session
+
+    async def close(self) -> None:
+        """
+        Release all pooled connections held by this client and cancel any
+        outstanding task waits.
+        """
+        if self._watcher is not None:
+            await self._watcher.stop()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @property
+    def watcher(self) -> AsyncTaskWatcher:
+        """
+        The AsyncTaskWatcher shared by every wait_for and watch_tasks call on
+        this client, created on first use.
+        """
+        if self._watcher is None:
+            self._watcher = AsyncTaskWatcher(self)
+        return self._watcher
+
+    async def wait_for(self, task_id: str, timeout: Optional[float] = None) -> dict:
+        """
+        Wait until the task is finished and return it, as a dict of its
+        HarvesterTask fields.
+        """
+        return self._journal_finished(await self.watcher.wait_for(task_id, timeout))
+
+    def watch_tasks(self, task_ids: Iterable[str], timeout: Optional[float] = None) -> AsyncIterator[dict]:
+        """
+        Yield each of the tasks as it finishes, in completion order.
+        """
+        tasks = self.watcher.watch(task_ids, timeout)
+        if self._journal is None:
+            return tasks
+        return self._journal_tasks(tasks)
+
+    async def _journal_tasks(self, tasks: AsyncIterator[dict]) -> AsyncIterator[dict]:
+        async for task in tasks:
+            yield self._journal_finished(task)
+
+    async def _post(self, url: str, retry_status_codes: tuple = HarvesterClientBase.RETRY_STATUS_CODES,
+                    **kwargs) -> aiohttp.ClientResponse:
+        """
+        POST with retry and exponential backoff. Only failures to connect and
+        retry_status_codes responses are retried; a request that was sent but
+        never answered is not, as it may already have run. The caller is
+        responsible for releasing the returned response, ideally via
+        `async with`.
+        """
+        session = self._get_session()
+        attempt = 0
+        while True:
+            try:
+                response = await session.post(url, **kwargs)
+            except aiohttp.ClientConnectorError:
+                if attempt >= self._max_retries:
+                    raise
+            else:
+                if response.status not in retry_status_codes or attempt >= self._max_retries:
+                    return response
+                response.release()
+            await asyncio.sleep(self._backoff_factor * (2 ** attempt))
+            attempt += 1
+
+    async def _run_api_commands(self, commands: list, token: str) -> list:
+        """
+        Internal member class to execute a list of API commands against
+        Authentic8 Harvester in a single round trip. Returns one response
+        object per command, in the order the commands were supplied.
+        """
+        # Serialized here rather than by aiohttp so the payload size is known.
+        body = json.dumps(self._api_payload(commands, token)).encode('utf-8')
+        metrics, command = self._metrics, self._command_name(commands)
+        retry_status_codes = self.RETRY_STATUS_CODES
+        if any(c.get(self.KEY_COMMAND) == self.CREATE_TASK_COMMAND for c in commands):
+            retry_status_codes = self.CREATE_RETRY_STATUS_CODES
+        try:
+            async with self._throttle.limit_async(*self._command_kinds(commands)) as call:
+                async with self._semaphore:
+                    started = time.perf_counter()
+                    async with await self._post(self._api_url, retry_status_codes, data=body,
+                                                headers={'Content-Type': 'application/json'}) as response:
+                        # Still overloaded once the retries ran out.
+                        call.failed = response.status in self.RETRY_STATUS_CODES
+                        content = await response.read()
+                    metrics.observe(ROUND_TRIP_SECONDS, command, time.perf_counter() - started)
+            with metrics.timer(DECODE_SECONDS, command):
+                data = json.loads(content)
+            metrics.observe(REQUEST_BYTES, command, len(body))
+            metrics.observe(RESPONSE_BYTES, command, len(content))
+            # Skip the first object, as it will be the auth result.
+            if len(data) != len(commands) + 1:
+                raise Exception(f'Did not receive {len(commands) + 1} response objects for Harvester Task {data}')
+        except Exception:
+            metrics.increment(ERRORS, command)
+            raise
+        return data[1:]
+
+    async def __run_api_command(self, command: dict, token: str) -> dict:
+        return (await self._run_api_commands([command], token))[0]
+
+    async def create_capture_task(self, url: str, proxy: CountryCode, image=True, html=True, note: Optional[str] = None) -> str:  # noqa: E501
+        """
+        Attempt to run a Harvester Authentic8 capture task against the
+        supplied URL, via the specified proxy location. Returns the task ID
+        that was spawned.
+        """
+        return await self._create_task([url], proxy, image, html, note)
+
+    async def _create_task(self, urls: List[str], proxy: CountryCode, image: bool, html: bool,
+                           note: Optional[str]) -> str:
+        cmd = self._create_task_command(urls, proxy, image, html, note)
+        result = await self.__run_api_command(cmd, self._api_token)
+        return self._parse_created_task(result, urls, proxy, note)
+
+    async def capture(self, url: str, proxy: CountryCode, image=True, html=True, note: Optional[str] = None,
+                      timeout: Optional[float] = None) -> bytes:
+        """
+        Capture the URL end to end and return the archive, see
+        HarvesterAsyncClient.capture. Concurrent calls with the same
+        arguments share a single task, and cancelling one of them does not
+        cancel the capture for the others.
+        """
+        return await self._flights.do(self._capture_key(url, proxy, image, html, note),
+                                      lambda: self._capture(url, proxy, image, html, note, timeout))
+
+    async def _capture(self, url: str, proxy: CountryCode, image: bool, html: bool, note: Optional[str],
+                       timeout: Optional[float]) -> bytes:
+        key = self._cache.key(url, proxy, image, html) if self._cache is not None else None
+        if key is not None:
+            path = self._cache.get(key)
+            if path is not None:
+                try:
+                    with open(path, 'rb') as f:
+                        return f.read()
+                except FileNotFoundError:
+                    pass
+
+        task_id = await self.create_capture_task(url, proxy, image=image, html=html, note=note)
+        try:
+            file_id = self._parse_finished_task(await self.wait_for(task_id, timeout))
+            try:
+                archive = await self.download_file(file_id)
+            finally:
+                await self.delete_file(file_id)
+        finally:
+            await self.delete_task(task_id)
+        if key is not None:
+            self._cache.put(key, archive)
+        return archive
+
+    async def create_capture_tasks(self, urls: Iterable[str], proxy: CountryCode, image=True, html=True,
+                                   note: Optional[str] = None,
+                                   urls_per_task: int = HarvesterClientBase.DEFAULT_URLS_PER_TASK
+                                   ) -> BulkCaptureResult:
+        """
+        Capture many URLs via the specified proxy location. URLs are packed
+        into multi-URL Harvester tasks of at most urls_per_task URLs, and all
+        tasks are submitted concurrently, bounded by max_concurrency. A failed
+        submission only affects the URLs in that task.
+        """
+        chunks = self._chunk_urls(urls, urls_per_task)
+        outcomes = await asyncio.gather(
+            *[self._create_task(chunk, proxy, image, html, note) for chunk in chunks],
+            return_exceptions=True
+        )
+        result = BulkCaptureResult({}, {})
+        for chunk, outcome in zip(chunks, outcomes):
+            if isinstance(outcome, Exception):
+                result.errors.update(dict.fromkeys(chunk, outcome))
+            else:
+                result.task_ids.update(dict.fromkeys(chunk, outcome))
+        return result
+
+    async def get_tasks(self, finished: bool = False) -> list:
+        """
+        Retrieve all Harvester tasks, filtered by finished status if supplied.
+        """
+        result = await self.__run_api_command(self._find_tasks_command(finished), self._api_token)
+        return self._parse_get_tasks_result(result)
+
+    async def iter_tasks(self, finished: bool = False, status: Optional[str] = None,
+                         task_ids: Optional[Iterable[str]] = None,
+                         chunk_size: int = HarvesterClientBase.DEFAULT_STREAM_CHUNK_SIZE
+                         ) -> AsyncIterator[HarvesterTask]:
+        """
+        Stream Harvester tasks, filtered by finished status if supplied. The
+        response is parsed incrementally and tasks are yielded one at a time
+        as HarvesterTask tuples, optionally filtered by status and task ID.
+        """
+        body = json.dumps(self._api_payload([self._find_tasks_command(finished)], self._api_token)).encode('utf-8')
+        metrics, command = self._metrics, self.FIND_TASK_COMMAND
+        task_ids = set(task_ids) if task_ids is not None else None
+        parser = TaskStreamParser()
+        size = 0
+        try:
+            # The limit, the semaphore and the timer only cover the wait for
+            # the response headers, not the time spent by the caller between
+            # tasks, which may itself need a slot.
+            async with self._throttle.limit_async(Throttle.FIND) as call:
+                async with self._semaphore:
+                    started = time.perf_counter()
+                    response = await self._post(self._api_url, data=body, headers={'Content-Type': 'application/json'})
+                    metrics.observe(ROUND_TRIP_SECONDS, command, time.perf_counter() - started)
+                # Still overloaded once the retries ran out.
+                call.failed = response.status in self.RETRY_STATUS_CODES
+            async with response:
+                response.raise_for_status()
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    size += len(chunk)
+                    for task in self._filter_tasks(parser.feed(chunk), status, task_ids):
+                        yield task
+                for task in self._filter_tasks(parser.close(), status, task_ids):
+                    yield task
+            metrics.observe(REQUEST_BYTES, command, len(body))
+            metrics.observe(RESPONSE_BYTES, command, size)
+        except Exception:
+            metrics.increment(ERRORS, command)
+            raise
+
+    async def delete_task(self, task_id: str) -> bool:
+        """
+        Delete Harvester Authentic8 task by ID.
+        """
+        result = await self.__run_api_command(self._delete_task_command(task_id), self._api_token)
+        return self._parse_delete_task_result(result, task_id)
+
+    async def download_file(self, file_id: str) -> bytes:
+        """
+        Requires the S3 file ID of the file stored in the Authentic8 permenant
+        storage pool. Does not work with file path.
+        """
+        params = {
+            self.KEY_ID: file_id,
+            self.KEY_AUTH: self._storage_token
+        }
+        started = time.monotonic()
+        try:
+            async with self._throttle.limit_async(Throttle.GETFILE), self._semaphore:
+                async with await self._post(self._getfile_url, data=params) as response:
+                    response.raise_for_status()
+                    content = await response.read()
+        except Exception:
+            self._metrics.increment(ERRORS, GETFILE)
+            raise
+        if self._metrics.enabled:
+            self._observe_download(DownloadResult(None, len(content), time.monotonic() - started, 0, 1))
+        return content
+
+    async def save_file_to_disk(self, file_id: str, file_dst: str, chunk_size: int = None) -> DownloadResult:
+        """
+        Requires the S3 file ID of the file stored in the Authentic8 permenant
+        storage pool. Streams the file to the disk location the caller
+        specified, via a `.part` file that is moved into place once complete.
+        Unlike HarvesterAsyncClient.save_file_to_disk, the file is fetched in
+        a single request rather than in parallel ranges, and a failed download
+        starts over rather than resuming. Returns the size and throughput of
+        the download.
+        """
+        params = {
+            self.KEY_ID: file_id,
+            self.KEY_AUTH: self._storage_token
+        }
+
+        if not chunk_size:
+            chunk_size = self.ONE_MB_CHUNK_SIZE
+
+        part_path = file_dst + FileDownloader.PART_SUFFIX
+        started = time.monotonic()
+        size = 0
+        try:
+            async with self._throttle.limit_async(Throttle.GETFILE), self._semaphore:
+                async with await self._post(self._getfile_url, data=params) as response:
+                    response.raise_for_status()
+                    with open(part_path, 'wb') as f:
+                        async for chunk in response.content.iter_chunked(chunk_size):
+                            f.write(chunk)
+                            size += len(chunk)
+            os.replace(part_path, file_dst)
+        except Exception:
+            self._metrics.increment(ERRORS, GETFILE)
+            raise
+        result = DownloadResult(file_dst, size, time.monotonic() - started, 0, 1)
+        self._observe_download(result)
+        return result
+
+    async def delete_file(self, file_id: str) -> str:
+        """
+        Requires the S3 file ID of the file stored in the Authentic8 permenant
+        storage pool. Does not work with file path.
+        """
+        result = await self.__run_api_command(self._delete_file_command(file_id), self._storage_token)
+        return self._parse_delete_file_result(result, file_id)
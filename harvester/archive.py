@@ -0,0 +1,183 @@
+import io
+import mmap
+import shutil
+from functools import cached_property
+from typing import BinaryIO, Dict, Optional, Union
+from zipfile import ZipFile, ZipInfo
+
+from .mhtml import (HTML_CONTENT_TYPE, HtmlContent, find_html_content,
+                    iter_resources)
+
+# Size of the reusable buffer used when copying archive members.
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# A Harvester archive can be supplied as its raw bytes, a path on disk (as
+# written by save_file_to_disk), a seekable binary file object or an mmap.
+ArchiveSource = Union[bytes, bytearray, memoryview, str, BinaryIO, mmap.mmap]
+
+
+class _MappedFile(io.RawIOBase):
+    """
+    Seekable file view over an mmap. ZipFile cannot use an mmap directly, and
+    wrapping it in BytesIO would copy the whole archive into memory.
+    """
+
+    def __init__(self, mapped: mmap.mmap) -> None:
+        super().__init__()
+        self._mapped = mapped
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        n = max(0, min(len(buffer), len(self._mapped) - self._pos))
+        buffer[:n] = self._mapped[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._mapped)
+        if offset < 0:
+            raise ValueError('negative seek position')
+        self._pos = offset
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+
+def open_archive(archive: ArchiveSource) -> ZipFile:
+    """
+    Open a Harvester archive for reading without loading it into memory
+    unless it was supplied as bytes in the first place.
+    """
+    if isinstance(archive, (bytes, bytearray, memoryview)):
+        return ZipFile(io.BytesIO(archive), 'r')
+    if isinstance(archive, mmap.mmap):
+        return ZipFile(_MappedFile(archive), 'r')
+    return ZipFile(archive, 'r')
+
+
+def copy_member(zip: ZipFile, member: str, dst: Union[str, BinaryIO], buffer_size: int = COPY_BUFFER_SIZE) -> int:
+    """
+    Decompress a member of an open archive into dst (a path or a writable
+    binary file object) in buffer_size chunks. Returns the number of bytes
+    written.
+    """
+    with zip.open(member, 'r') as src:
+        if isinstance(dst, str):
+            with open(dst, 'wb') as f:
+                shutil.copyfileobj(src, f, buffer_size)
+        else:
+            shutil.copyfileobj(src, dst, buffer_size)
+        return zip.getinfo(member).file_size
+
+
+def extract_member(archive: ArchiveSource, member: str, dst: Union[str, BinaryIO],
+                   buffer_size: int = COPY_BUFFER_SIZE) -> Optional[int]:
+    """
+    Stream a single member of a Harvester archive to dst. Memory use is
+    bounded by buffer_size regardless of the size of the member. Returns the
+    number of bytes written, or None if the archive has no such member.
+    """
+    with open_archive(archive) as zip:
+        try:
+            zip.getinfo(member)
+        except KeyError:
+            return None
+        return copy_member(zip, member, dst, buffer_size)
+
+
+class HarvesterArchive(object):
+    """
+    A Harvester capture archive, opened once. Members are indexed by name on
+    open and the screenshot, mhtml, html and mhtml resources are each read
+    and parsed at most once, on first access.
+    """
+    MHTML_ARCHIVE_PATH = 'contents/output.mhtml'
+    MHTML_CONTENT_LOCATION = 'Content-Location'
+    MHTML_HTML_CONTENT_TYPE = HTML_CONTENT_TYPE
+    MHTML_ORIGINAL_SOURCE_HEADER = 'Snapshot-Content-Location'
+    PNG_ARCHIVE_PATH = 'contents/output.png'
+
+    def __init__(self, archive: ArchiveSource) -> None:
+        self._zip = open_archive(archive)
+        self.members: Dict[str, ZipInfo] = {info.filename: info for info in self._zip.infolist()}
+
+    def __enter__(self) -> 'HarvesterArchive':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._zip.close()
+
+    def read(self, member: str) -> Optional[bytes]:
+        """
+        Read a member into memory, or return None if there is no such member.
+        """
+        if member not in self.members:
+            return None
+        return self._zip.read(self.members[member])
+
+    def extract(self, member: str, dst: Union[str, BinaryIO], buffer_size: int = COPY_BUFFER_SIZE) -> Optional[int]:
+        """
+        Stream a member to dst, see extract_member.
+        """
+        if member not in self.members:
+            return None
+        return copy_member(self._zip, member, dst, buffer_size)
+
+    @cached_property
+    def image(self) -> Optional[bytes]:
+        """
+        The captured screenshot.
+        """
+        return self.read(self.PNG_ARCHIVE_PATH)
+
+    @cached_property
+    def mhtml(self) -> Optional[bytes]:
+        """
+        The raw captured mhtml archive.
+        """
+        return self.read(self.MHTML_ARCHIVE_PATH)
+
+    @cached_property
+    def html_content(self) -> Optional[HtmlContent]:
+        """
+        The html part of the mhtml archive whose content location matches the
+        captured URL, i.e. the page itself rather than a frame or stylesheet.
+        Returned as transfer decoded bytes along with their detected
+        character encoding.
+        """
+        if self.mhtml is None:
+            return None
+        return find_html_content(self.mhtml)
+
+    @cached_property
+    def html(self) -> Optional[str]:
+        """
+        The captured page as clean text, see html_content.
+        """
+        content = self.html_content
+        return content.text() if content is not None else None
+
+    @cached_property
+    def resources(self) -> Dict[str, bytes]:
+        """
+        Every other part of the mhtml archive (stylesheets, images, frames and
+        so on), decoded and keyed by content location.
+        """
+        if self.mhtml is None:
+            return {}
+        return {
+            part.content_location: part.decode() for part in iter_resources(self.mhtml) if part.content_location
+        }
@@ -0,0 +1,112 @@
+from concurrent.futures import Future
+from threading import Lock
+from typing import Optional
+
+
+class HarvesterBatch(object):
+    """
+    Collects Harvester commands and ships them to the API with a single
+    setauth per round trip. Each queued call returns a Future which resolves to
+    the same value (or raises the same exception) as the equivalent call on
+    HarvesterAsyncClient once the batch is executed.
+
+    Commands authenticated with different tokens (e.g. delete_file uses the
+    storage token) are sent in separate round trips, and no single round trip
+    carries more than max_batch_size commands.
+    """
+    DEFAULT_MAX_BATCH_SIZE = 100
+
+    def __init__(self, client, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE) -> None:
+        if max_batch_size < 1:
+            raise ValueError('max_batch_size must be at least 1')
+        self._client = client
+        self._max_batch_size = max_batch_size
+        self._pending = []
+        self._lock = Lock()
+
+    def __enter__(self) -> 'HarvesterBatch':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.execute()
+        else:
+            self.cancel()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def _queue(self, token: str, command: dict, parser) -> Future:
+        future = Future()
+        with self._lock:
+            self._pending.append((token, command, parser, future))
+        return future
+
+    def create_capture_task(self, url: str, proxy, image=True, html=True, note: Optional[str] = None) -> Future:
+        """
+        Queue a capture task. The Future resolves to the spawned task ID.
+        """
+        cmd = self._client._create_task_command([url], proxy, image, html, note)
+        return self._queue(self._client._api_token, cmd,
+                           lambda result: self._client._parse_created_task(result, [url], proxy, note))
+
+    def delete_task(self, task_id: str) -> Future:
+        """
+        Queue a task deletion. The Future resolves to True if the task was
+        deleted.
+        """
+        return self._queue(
+            self._client._api_token,
+            self._client._delete_task_command(task_id),
+            lambda result: self._client._parse_delete_task_result(result, task_id)
+        )
+
+    def delete_file(self, file_id: str) -> Future:
+        """
+        Queue a file deletion. Already deleted files resolve successfully.
+        """
+        return self._queue(
+            self._client._storage_token,
+            self._client._delete_file_command(file_id),
+            lambda result: self._client._parse_delete_file_result(result, file_id)
+        )
+
+    def cancel(self) -> None:
+        """
+        Drop every queued command without sending it.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for _, _, _, future in pending:
+            future.cancel()
+
+    def execute(self) -> list:
+        """
+        Send every queued command and resolve their Futures. Returns the
+        Futures in the order the commands were queued.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+
+        by_token = {}
+        for item in pending:
+            by_token.setdefault(item[0], []).append(item)
+
+        for token, items in by_token.items():
+            for i in range(0, len(items), self._max_batch_size):
+                self._send(token, items[i:i + self._max_batch_size])
+        return [item[3] for item in pending]
+
+    def _send(self, token: str, items: list) -> None:
+        try:
+            results = self._client._run_api_commands([item[1] for item in items], token)
+        except Exception as e:
+            for _, _, _, future in items:
+                future.set_exception(e)
+            return
+
+        for (_, _, parser, future), result in zip(items, results):
+            try:
+                future.set_result(parser(result))
+            except Exception as e:
+                future.set_exception(e)
@@ -0,0 +1,235 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Union
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+if TYPE_CHECKING:
+    from .client import CountryCode
+
+
+class CaptureCache(object):
+    """
+    Local, on-disk cache of Harvester capture archives and the artifacts
+    extracted from them, shared safely by any number of threads and
+    processes pointing at the same directory.
+
+    Entries are addressed by a hash of the capture request (URL, egress
+    region and image/html flags) and stored as `<key>.zip` alongside
+    `<key>.<artifact>` files. Every file is written to a temporary name and
+    renamed into place, so readers never see a partial entry. An entry
+    expires ttl seconds after it was stored (its modification time), and
+    once the directory grows past max_size the least recently used entries
+    (by access time, which get refreshes explicitly) are evicted.
+    """
+    DEFAULT_TTL = 60 * 60
+    DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+    ARCHIVE_SUFFIX = '.zip'
+    LOCK_FILE = '.lock'
+    TMP_PREFIX = '.tmp-'
+
+    def __init__(self, directory: str, ttl: float = DEFAULT_TTL, max_size: int = DEFAULT_MAX_SIZE) -> None:
+        if ttl <= 0 or max_size < 0:
+            raise ValueError('ttl must be positive and max_size must not be negative')
+        self.directory = directory
+        self.ttl = ttl
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(url: str, proxy: 'CountryCode', image: bool = True, html: bool = True) -> str:
+        """
+        The cache key of a capture request. CountryCode aliases of the same
+        region (e.g. US and USA) share a key.
+        """
+        request = json.dumps([url, proxy.value, bool(image), bool(html)], separators=(',', ':'))
+        return hashlib.sha256(request.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.directory, key[:2], key + suffix)
+
+    def _fresh(self, path: str, now: float) -> bool:
+        try:
+            return now - os.stat(path).st_mtime < self.ttl
+        except FileNotFoundError:
+            return False
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        The path of the cached archive, or None if there is no fresh entry.
+        The entry is marked as recently used. Another process may evict it
+        at any time, so open the path straight away and treat
+        FileNotFoundError as a miss; an already open file stays readable.
+        """
+        path = self._path(key, self.ARCHIVE_SUFFIX)
+        now = time.time()
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        if now - stat.st_mtime >= self.ttl:
+            self.delete(key)
+            return None
+        try:
+            # Record the access explicitly, mount options such as noatime make st_atime unreliable.
+            os.utime(path, (now, stat.st_mtime))
+        except FileNotFoundError:
+            return None
+        return path
+
+    def _write(self, path: str, data: Union[bytes, str], move: bool) -> None:
+        """
+        Atomically place data (bytes, or the path of a file to copy or move)
+        at path.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=self.TMP_PREFIX, dir=os.path.dirname(path))
+        try:
+            if isinstance(data, str) and move:
+                os.close(fd)
+                os.replace(data, tmp_path)
+            else:
+                with os.fdopen(fd, 'wb') as f:
+                    if isinstance(data, str):
+                        with open(data, 'rb') as src:
+                            while True:
+                                chunk = src.read(1024 * 1024)
+                                if not chunk:
+                                    break
+                                f.write(chunk)
+                    else:
+                        f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def put(self, key: str, archive: Union[bytes, str], move: bool = False) -> str:
+        """
+        Store an archive, given as bytes or as the path of a downloaded file,
+        and return its cached path. With move=True the file is moved into the
+        cache rather than copied, which is free on the same filesystem.
+        Storing an archive drops any artifacts extracted from a previous one.
+        """
+        for name in self._artifacts(key):
+            self._remove(self._path(key, '.' + name))
+        path = self._path(key, self.ARCHIVE_SUFFIX)
+        self._write(path, archive, move)
+        self.evict()
+        return path
+
+    def get_artifact(self, key: str, name: str) -> Optional[bytes]:
+        """
+        An artifact (e.g. 'png' or 'html') stored for a fresh entry, or None.
+        """
+        if not self._fresh(self._path(key, self.ARCHIVE_SUFFIX), time.time()):
+            return None
+        try:
+            with open(self._path(key, '.' + name), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put_artifact(self, key: str, name: str, data: bytes) -> None:
+        """
+        Store an artifact extracted from the entry's archive, so later hits
+        skip the extraction too.
+        """
+        if not name.isalnum():
+            raise ValueError(f'Invalid artifact name {name}')
+        self._write(self._path(key, '.' + name), data, False)
+
+    def _artifacts(self, key: str) -> List[str]:
+        try:
+            names = os.listdir(os.path.dirname(self._path(key, '')))
+        except FileNotFoundError:
+            return []
+        suffixes = [name[len(key) + 1:] for name in names if name.startswith(key + '.')]
+        return [suffix for suffix in suffixes if suffix != self.ARCHIVE_SUFFIX[1:]]
+
+    def _remove(self, path: str) -> int:
+        try:
+            size = os.stat(path).st_size
+            os.remove(path)
+            return size
+        except FileNotFoundError:
+            return 0
+
+    def delete(self, key: str) -> None:
+        """
+        Remove an entry and its artifacts.
+        """
+        self._remove(self._path(key, self.ARCHIVE_SUFFIX))
+        for name in self._artifacts(key):
+            self._remove(self._path(key, '.' + name))
+
+    def _entries(self) -> Dict[str, list]:
+        """
+        Map each key to [archive atime, archive mtime, total size of its
+        files]. Keys whose archive is missing are reported with no times.
+        """
+        entries = {}
+        for shard in os.listdir(self.directory):
+            shard_path = os.path.join(self.directory, shard)
+            if not os.path.isdir(shard_path):
+                continue
+            for name in os.listdir(shard_path):
+                if name.startswith(self.TMP_PREFIX):
+                    continue
+                key, _, suffix = name.partition('.')
+                try:
+                    stat = os.stat(os.path.join(shard_path, name))
+                except FileNotFoundError:
+                    continue
+                entry = entries.setdefault(key, [None, None, 0])
+                entry[2] += stat.st_size
+                if '.' + suffix == self.ARCHIVE_SUFFIX:
+                    entry[0], entry[1] = stat.st_atime, stat.st_mtime
+        return entries
+
+    def size(self) -> int:
+        """
+        Total size in bytes of every entry in the cache.
+        """
+        return sum(entry[2] for entry in self._entries().values())
+
+    def evict(self) -> int:
+        """
+        Remove expired entries, then the least recently used entries until
+        the cache fits in max_size. Only one process evicts at a time, others
+        skip the pass. Returns the number of bytes freed.
+        """
+        with open(os.path.join(self.directory, self.LOCK_FILE), 'a') as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return 0
+            now = time.time()
+            entries = self._entries()
+            total = sum(entry[2] for entry in entries.values())
+            freed = 0
+            # Orphaned artifacts and expired entries go first, then the least recently used.
+            for key, (atime, mtime, size) in sorted(entries.items(), key=lambda item: (
+                item[1][1] is not None and now - item[1][1] < self.ttl, item[1][0] or 0
+            )):
+                fresh = mtime is not None and now - mtime < self.ttl
+                if fresh and total - freed <= self.max_size:
+                    break
+                self.delete(key)
+                freed += size
+            return freed
+
+    def clear(self) -> None:
+        """
+        Remove every entry.
+        """
+        for key in self._entries():
+            self.delete(key)
@@ -1,10 +1,30 @@
-from email.parser import Parser
+import time
+from concurrent.futures import (FIRST_COMPLETED, ThreadPoolExecutor,
+                                as_completed, wait)
 from enum import Enum
-from io import BytesIO
-from typing import Optional
-from zipfile import ZipFile
+from threading import Lock
+from typing import (BinaryIO, Dict, Iterable, Iterator, List, NamedTuple,
+                    Optional, Tuple, Union)
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .archive import (COPY_BUFFER_SIZE, ArchiveSource, HarvesterArchive,
+                      extract_member)
+from .batch import HarvesterBatch
+from .cache import CaptureCache
+from .download import DownloadResult, FileDownloader
+from .journal import TaskJournal
+from .metrics import (DECODE_SECONDS, DOWNLOAD_BYTES_PER_SECOND,
+                      DOWNLOAD_SECONDS, ERRORS, EXTRACT_HTML, EXTRACT_IMAGE,
+                      EXTRACT_MHTML, EXTRACT_SECONDS, GETFILE,
+                      NULL_INSTRUMENTATION, REQUEST_BYTES, RESPONSE_BYTES,
+                      ROUND_TRIP_SECONDS, Instrumentation)
+from .singleflight import SingleFlight
+from .tasks import HarvesterTask, TaskStreamParser
+from .throttle import Throttle
+from .watcher import TaskWatcher
 
 
 class CountryCode(Enum):
@@ -27,31 +47,84 @@ class CountryCode(Enum):
         return key in cls.__members__
 
 
-class HarvesterAsyncClient(object):
+class BulkCaptureResult(NamedTuple):
     """
-    Provide a set of async methods for interacting with Authentic8 Harvester.
+    Outcome of a bulk capture submission. Every URL appears in exactly one of
+    the two mappings: task_ids maps a URL to the (possibly shared) Harvester
+    task capturing it, errors maps a URL to the exception raised while
+    submitting its task.
+    """
+    task_ids: Dict[str, str]
+    errors: Dict[str, Exception]
+
+
+class PurgeResult(NamedTuple):
+    """
+    Summary of a purge. scanned counts every task listed, task_ids holds
+    the tasks selected for deletion. undated counts the tasks skipped by an
+    older_than selection because their record has no parsable creation
+    time; if it equals scanned, the records are not dated the way purge
+    expects. Tasks and files that were already gone count as deleted.
+    errors maps the ID of each task that could not be deleted (with its
+    file) to the exception raised.
+    """
+    scanned: int
+    undated: int
+    task_ids: List[str]
+    tasks_deleted: int
+    files_deleted: int
+    errors: Dict[str, Exception]
+    dry_run: bool
+
+
+class HarvesterClientBase(object):
+    """
+    Shared constants, command construction and response parsing for the
+    Harvester clients. Subclasses supply the transport.
     """
     # Harvester will replace these values with the information derived from
     # the submitted task.
     HUNDRED_MB_CHUNK_SIZE = 1024 * 1024 * 100
+    ONE_MB_CHUNK_SIZE = 1024 * 1024
     CREATE_TASK_COMMAND = 'create_harvest_task'
     DELETE_FILE_COMMAND = 'deletefile'
     DELETE_TASK_COMMAND = 'delete_harvest_task'
     FIND_TASK_COMMAND = 'find_harvest_task'
     HARVEST_TASK_DEST_STR = '<taskid>.<auto-ext>'
     IMAGE_OUTPUT = 'output_image'
-    MHTML_ARCHIVE_PATH = 'contents/output.mhtml'
-    MHTML_CONTENT_LOCATION = 'Content-Location'
-    MHTML_HTML_CONTENT_TYPE = 'text/html'
-    MHTML_ORIGINAL_SOURCE_HEADER = 'Snapshot-Content-Location'
+    MHTML_ARCHIVE_PATH = HarvesterArchive.MHTML_ARCHIVE_PATH
+    MHTML_CONTENT_LOCATION = HarvesterArchive.MHTML_CONTENT_LOCATION
+    MHTML_HTML_CONTENT_TYPE = HarvesterArchive.MHTML_HTML_CONTENT_TYPE
+    MHTML_ORIGINAL_SOURCE_HEADER = HarvesterArchive.MHTML_ORIGINAL_SOURCE_HEADER
     MIME_HTML_OUTPUT = 'output_mhtml'
-    PNG_ARCHIVE_PATH = 'contents/output.png'
+    PNG_ARCHIVE_PATH = HarvesterArchive.PNG_ARCHIVE_PATH
     SET_AUTH_COMMAND = 'setauth'
+    TASK_STATUS_DONE = 'done'
     VISUAL_REQUEST_TYPE = 'visual'
     ALREADY_DELETED_ERROR = 'KeyError: Did not find any matching records'
 
+    # Connection pool defaults. The pool is shared by every command issued by
+    # this client, so size it to the number of threads using the client.
+    DEFAULT_POOL_CONNECTIONS = 4
+    DEFAULT_POOL_MAXSIZE = 16
+    DEFAULT_TIMEOUT = (10, 120)
+    DEFAULT_MAX_RETRIES = 3
+    DEFAULT_BACKOFF_FACTOR = 0.5
+    RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+    # create_harvest_task is not idempotent, so it is only retried when
+    # Harvester rejected it without running it.
+    CREATE_RETRY_STATUS_CODES = (429,)
+
+    # Number of URLs packed into a single multi-URL task by the bulk APIs.
+    DEFAULT_URLS_PER_TASK = 25
+    # Read size used when streaming the task list.
+    DEFAULT_STREAM_CHUNK_SIZE = 1024 * 64
+    # Threads deleting batches of stale tasks in purge.
+    DEFAULT_PURGE_WORKERS = 4
+
     # Key definitions.
     KEY_AUTH = 'auth'
+    KEY_CREATED = 'created'
     KEY_COMMAND = 'command'
     KEY_DATA = 'data'
     KEY_DELETED = 'deleted'
@@ -67,6 +140,8 @@ class HarvesterAsyncClient(object):
     KEY_NAME = 'name'
     KEY_REQUEST_TYPE = 'request_type'
     KEY_RESULT = 'result'
+    KEY_RESULT_FILE_ID = 'result_file_id'
+    KEY_STATUS = 'status'
     KEY_TASK_ID = 'task_id'
     KEY_TASK_PARAMS = 'task_params'
     KEY_URLS = 'urls'
@@ -81,33 +156,45 @@ class HarvesterAsyncClient(object):
         self._dest_path = path
         self._api_url = f'{url}/api/'
         self._getfile_url = f'{url}/getfile/'
+        self._metrics: Instrumentation = NULL_INSTRUMENTATION
+        self._journal: Optional[TaskJournal] = None
 
-    def __run_api_command(self, command: dict, token: str) -> dict:
+    def _command_kinds(self, commands: list) -> List[str]:
         """
-        Internal member class to execute API commands against Authentic8
-        Harvester.
+        The Throttle kind of each command.
+        """
+        kinds = {
+            self.CREATE_TASK_COMMAND: Throttle.CREATE,
+            self.FIND_TASK_COMMAND: Throttle.FIND,
+            self.DELETE_TASK_COMMAND: Throttle.DELETE,
+            self.DELETE_FILE_COMMAND: Throttle.DELETE,
+        }
+        return [kinds.get(command.get(self.KEY_COMMAND), command.get(self.KEY_COMMAND)) for command in commands]
+
+    def _command_name(self, commands: list) -> str:
         """
+        The metrics label of a request: its command name, or the sorted,
+        comma separated names of a batch mixing several commands.
+        """
+        return ','.join(sorted({command.get(self.KEY_COMMAND, '') for command in commands}))
+
+    def _observe_download(self, result: DownloadResult) -> None:
+        self._metrics.observe(DOWNLOAD_SECONDS, GETFILE, result.elapsed)
+        self._metrics.observe(RESPONSE_BYTES, GETFILE, result.size - result.resumed_bytes)
+        self._metrics.observe(DOWNLOAD_BYTES_PER_SECOND, GETFILE, result.bytes_per_second)
+
+    def _api_payload(self, commands: list, token: str) -> list:
         data = [
             {
                 self.KEY_COMMAND: self.SET_AUTH_COMMAND,
                 self.KEY_DATA: token
-            },
-            command
+            }
         ]
-        response = requests.post(url=self._api_url, json=data)
-        # return the second object, as the first will be the auth result.
-        data = response.json()
-        if len(data) != 2:
-            raise Exception(f'Did not receive two response objects for Harvester Task {data}')
-        return data[1]
+        data.extend(commands)
+        return data
 
-    def create_capture_task(self, url: str, proxy: CountryCode, image=True, html=True, note: Optional[str] = None) -> str:  # noqa: E501
-        """
-        Attempt to run a Harvester Authentic8 capture task against the
-        supplied URL, via the specified proxy location. Optionally specify if
-        the caller wants just the image or just the HTML. Returns the task ID
-        that was spawned.
-        """
+    def _create_task_command(self, urls: list, proxy: CountryCode, image: bool, html: bool,
+                             note: Optional[str]) -> dict:
         cmd = {
             self.KEY_COMMAND: self.CREATE_TASK_COMMAND,
             self.KEY_DEST_PATH: self._dest_path,
@@ -116,7 +203,7 @@ class HarvesterAsyncClient(object):
             self.KEY_DEST_BUCKET: self._s3_bucket,
             self.KEY_EGRESS: proxy.value,
             self.KEY_TASK_PARAMS: {
-                self.KEY_URLS: [url],
+                self.KEY_URLS: list(urls),
                 self.KEY_REQUEST_TYPE: self.VISUAL_REQUEST_TYPE,
                 self.KEY_VIS_PARAMS: []
             }
@@ -129,42 +216,537 @@ class HarvesterAsyncClient(object):
         if note:
             for x in cmd[self.KEY_TASK_PARAMS][self.KEY_VIS_PARAMS]:
                 x[self.KEY_NOTES] = note
+        return cmd
 
-        result = self.__run_api_command(cmd, self._api_token)
+    def _parse_create_task_result(self, result: dict) -> str:
         result_dict = result.get(self.KEY_RESULT)
         if not result_dict or not result_dict.get(self.KEY_TASK_ID):
             raise Exception('Task ID not returned from Harvester task')
         return result_dict.get(self.KEY_TASK_ID)
 
-    def get_tasks(self, finished: bool = False) -> list:
+    def _parse_created_task(self, result: dict, urls: List[str], proxy: CountryCode, note: Optional[str]) -> str:
         """
-        Retrieve all Harvester tasks, filtered by finished status if supplied.
+        The ID of a created task, journalled with the request that created it.
+        """
+        task_id = self._parse_create_task_result(result)
+        if self._journal is not None:
+            self._journal.record_created(task_id, urls, proxy.name, note)
+        return task_id
+
+    def _journal_finished(self, task: dict) -> dict:
+        """
+        Journal a task returned by wait_for or watch_tasks.
         """
+        if self._journal is not None:
+            file_id = task.get(self.KEY_RESULT_FILE_ID)
+            done = task.get(self.KEY_STATUS) == self.TASK_STATUS_DONE and bool(file_id)
+            self._journal.record(task.get(self.KEY_TASK_ID), TaskJournal.FINISHED if done else TaskJournal.FAILED,
+                                 file_id)
+        return task
+
+    def _chunk_urls(self, urls: Iterable[str], urls_per_task: int) -> List[List[str]]:
+        """
+        Split the URLs into task sized chunks, dropping duplicates so each URL
+        maps to a single task.
+        """
+        if urls_per_task < 1:
+            raise ValueError('urls_per_task must be at least 1')
+        unique = list(dict.fromkeys(urls))
+        return [unique[i:i + urls_per_task] for i in range(0, len(unique), urls_per_task)]
+
+    def _capture_key(self, url: str, proxy: CountryCode, image: bool, html: bool, note: Optional[str]) -> tuple:
+        return url, proxy.value, bool(image), bool(html), note
+
+    def _parse_finished_task(self, task: dict) -> str:
+        """
+        The result file ID of a finished task, raising if it did not succeed.
+        """
+        file_id = task.get(self.KEY_RESULT_FILE_ID)
+        if task.get(self.KEY_STATUS) != self.TASK_STATUS_DONE or not file_id:
+            raise Exception(f'Harvester task {task.get(self.KEY_TASK_ID)} finished with status '
+                            f'{task.get(self.KEY_STATUS)}')
+        return file_id
+
+    def _find_tasks_command(self, finished: bool) -> dict:
         cmd = {
             self.KEY_COMMAND: self.FIND_TASK_COMMAND
         }
         if finished:
             cmd[self.KEY_FINISHED] = finished
+        return cmd
 
-        result = self.__run_api_command(cmd, self._api_token)
+    def _parse_get_tasks_result(self, result: dict) -> list:
         result_dict = result.get(self.KEY_RESULT)
         if not isinstance(result_dict, list):
             raise Exception('Malformed Harvester response when fetching all tasks')
         return result_dict
 
-    def delete_task(self, task_id: str) -> bool:
-        """
-        Delete Harvester Authentic8 task by ID.
-        """
-        cmd = {
+    def _filter_tasks(self, tasks: list, status: Optional[str], task_ids: Optional[set]) -> Iterator[HarvesterTask]:
+        for task in tasks:
+            if status is not None and task.get(self.KEY_STATUS) != status:
+                continue
+            if task_ids is not None and task.get(self.KEY_TASK_ID) not in task_ids:
+                continue
+            yield HarvesterTask.from_dict(task)
+
+    def _delete_task_command(self, task_id: str) -> dict:
+        return {
             self.KEY_COMMAND: self.DELETE_TASK_COMMAND,
             self.KEY_TASK_ID: task_id
         }
+
+    def _parse_delete_task_result(self, result: dict, task_id: str) -> bool:
+        already_deleted = result.get(self.KEY_ERROR, '') == self.ALREADY_DELETED_ERROR
+        if already_deleted:
+            deleted = False
+        else:
+            result_dict = result.get(self.KEY_RESULT)
+            if not result_dict or result_dict.get(self.KEY_DELETED) is None:
+                raise Exception(f'Malformed Harvester response when deleting task {task_id}')
+            deleted = result_dict.get(self.KEY_DELETED) is True
+        # A plain "not deleted" leaves the task outstanding so it is retried.
+        if self._journal is not None and (deleted or already_deleted):
+            self._journal.record(task_id, TaskJournal.DELETED)
+        return deleted
+
+    def _delete_file_command(self, file_id: str) -> dict:
+        return {
+            self.KEY_COMMAND: self.DELETE_FILE_COMMAND,
+            self.KEY_FILE_ID: file_id
+        }
+
+    def _parse_delete_file_result(self, result: dict, file_id: str) -> str:
+        if result.get(self.KEY_ERROR, '') == self.ALREADY_DELETED_ERROR:
+            result_dict = f'deleted file {file_id}'
+        else:
+            result_dict = result.get(self.KEY_RESULT)
+            if not result_dict:
+                raise Exception(f'Malformed Harvester response when deleting file {file_id}')
+        if self._journal is not None:
+            self._journal.record_file_deleted(file_id)
+        return result_dict
+
+    def image_from_zip(self, ziparchive: ArchiveSource) -> Optional[bytes]:
+        """
+        Expects a zip archive in the format created by Harvester, either as
+        bytes or as a path/file object/mmap. Will extract the captured
+        screenshot. Use HarvesterArchive to extract several artifacts from the
+        same archive.
+        """
+        with self._metrics.timer(EXTRACT_SECONDS, EXTRACT_IMAGE):
+            with HarvesterArchive(ziparchive) as archive:
+                return archive.image
+
+    def html_from_zip(self, ziparchive: ArchiveSource) -> Optional[str]:
+        """
+        Expects a zip archive in the format created by Harvester, either as
+        bytes or as a path/file object/mmap. Will extract the captured mhtml
+        archive and parse out the html file, decoded from its transfer and
+        character encodings. Use HarvesterArchive to extract several
+        artifacts from the same archive, or for the undecoded bytes.
+        """
+        try:
+            with self._metrics.timer(EXTRACT_SECONDS, EXTRACT_HTML):
+                with HarvesterArchive(ziparchive) as archive:
+                    return archive.html
+        except Exception:
+            self._metrics.increment(ERRORS, EXTRACT_HTML)
+            # Not a huge fan of surpression these, but we don't have a ton of options. The missing HTML will trigger
+            # the needed investigation.
+            pass
+
+    def extract_image(self, ziparchive: ArchiveSource, dst: Union[str, BinaryIO],
+                      buffer_size: int = COPY_BUFFER_SIZE) -> Optional[int]:
+        """
+        Stream the captured screenshot out of a Harvester archive into dst, a
+        path or writable binary file object, without holding it in memory.
+        Returns the number of bytes written, or None if there is no
+        screenshot.
+        """
+        with self._metrics.timer(EXTRACT_SECONDS, EXTRACT_IMAGE):
+            return extract_member(ziparchive, self.PNG_ARCHIVE_PATH, dst, buffer_size)
+
+    def extract_mhtml(self, ziparchive: ArchiveSource, dst: Union[str, BinaryIO],
+                      buffer_size: int = COPY_BUFFER_SIZE) -> Optional[int]:
+        """
+        Stream the captured mhtml archive out of a Harvester archive into dst,
+        a path or writable binary file object, without holding it in memory.
+        Returns the number of bytes written, or None if there is no mhtml.
+        """
+        with self._metrics.timer(EXTRACT_SECONDS, EXTRACT_MHTML):
+            return extract_member(ziparchive, self.MHTML_ARCHIVE_PATH, dst, buffer_size)
+
+
+class HarvesterAsyncClient(HarvesterClientBase):
+    """
+    Provide a set of async methods for interacting with Authentic8 Harvester.
+    """
+    def __init__(self, token: str, storage_token: str, s3_bucket: str, path: str, url: str,
+                 pool_connections: int = HarvesterClientBase.DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize: int = HarvesterClientBase.DEFAULT_POOL_MAXSIZE,
+                 pool_block: bool = False,
+                 timeout=HarvesterClientBase.DEFAULT_TIMEOUT,
+                 max_retries: int = HarvesterClientBase.DEFAULT_MAX_RETRIES,
+                 backoff_factor: float = HarvesterClientBase.DEFAULT_BACKOFF_FACTOR,
+                 cache: Optional[CaptureCache] = None,
+                 lock_dir: Optional[str] = None,
+                 throttle: Optional[Throttle] = None,
+                 instrumentation: Optional[Instrumentation] = None,
+                 journal: Optional[TaskJournal] = None) -> None:
+        """
+        The pool settings map onto requests' HTTPAdapter: pool_connections is
+        the number of per-host pools kept alive, pool_maxsize is the number of
+        keep-alive connections per host and pool_block makes callers wait for a
+        free connection instead of opening extra ones. timeout is either a
+        single value or a (connect, read) tuple in seconds. Requests that fail
+        to connect or with 429/5xx are retried max_retries times with
+        exponential backoff, except that task creation is only retried on 429.
+        cache and lock_dir configure capture, see there. Every call waits on
+        throttle, if given; share one Throttle between clients to share its
+        budget. Latencies, sizes and errors are reported to instrumentation,
+        which defaults to a no-op. Every task created, finished and deleted
+        through this client is recorded in journal, if given.
+        """
+        super().__init__(token, storage_token, s3_bucket, path, url)
+        self._timeout = timeout
+        self._metrics = instrumentation or NULL_INSTRUMENTATION
+        self._journal = journal
+        self._throttle = throttle or Throttle()
+        self._cache = cache
+        self._flights = SingleFlight(lock_dir)
+        self._session = self._create_session(pool_connections, pool_maxsize, pool_block, max_retries,
+                                             backoff_factor, self.RETRY_STATUS_CODES)
+        self._create_task_session = self._create_session(pool_connections, pool_maxsize, pool_block, max_retries,
+                                                         backoff_factor, self.CREATE_RETRY_STATUS_CODES)
+        self._watcher = None
+        self._watcher_lock = Lock()
+
+    def __enter__(self) -> 'HarvesterAsyncClient':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def _create_session(self, pool_connections: int, pool_maxsize: int, pool_block: bool, max_retries: int,
+                        backoff_factor: float, status_forcelist: Tuple[int, ...]) -> requests.Session:
+        """
+        Build a keep-alive session. Every Harvester call is a POST, so POST
+        has to be explicitly allowed for retries. Only failures to connect
+        and the status_forcelist responses are retried; a request that was
+        sent but never answered is not, as it may already have run.
+        """
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=0,
+            other=0,
+            backoff_factor=backoff_factor,
+            status_forcelist=status_forcelist,
+            allowed_methods=frozenset(['POST']),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry,
+                              pool_block=pool_block)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def close(self) -> None:
+        """
+        Release all pooled connections held by this client and cancel any
+        outstanding task waits.
+        """
+        if self._watcher is not None:
+            self._watcher.stop()
+        self._session.close()
+        self._create_task_session.close()
+
+    @property
+    def watcher(self) -> TaskWatcher:
+        """
+        The TaskWatcher shared by every wait_for and watch_tasks call on this
+        client, created on first use.
+        """
+        with self._watcher_lock:
+            if self._watcher is None:
+                self._watcher = TaskWatcher(self)
+            return self._watcher
+
+    def wait_for(self, task_id: str, timeout: Optional[float] = None) -> dict:
+        """
+        Block until the task is finished and return it, as a dict of its
+        HarvesterTask fields.
+        """
+        return self._journal_finished(self.watcher.wait_for(task_id, timeout))
+
+    def watch_tasks(self, task_ids: Iterable[str], timeout: Optional[float] = None) -> Iterator[dict]:
+        """
+        Yield each of the tasks as it finishes, in completion order.
+        """
+        tasks = self.watcher.watch(task_ids, timeout)
+        if self._journal is None:
+            return tasks
+        return map(self._journal_finished, tasks)
+
+    def _run_api_commands(self, commands: list, token: str) -> list:
+        """
+        Internal member class to execute a list of API commands against
+        Authentic8 Harvester in a single round trip. Returns one response
+        object per command, in the order the commands were supplied.
+        """
+        data = self._api_payload(commands, token)
+        metrics, command = self._metrics, self._command_name(commands)
+        session = self._session
+        if any(c.get(self.KEY_COMMAND) == self.CREATE_TASK_COMMAND for c in commands):
+            session = self._create_task_session
+        try:
+            with self._throttle.limit(*self._command_kinds(commands)) as call:
+                with metrics.timer(ROUND_TRIP_SECONDS, command):
+                    response = session.post(url=self._api_url, json=data, timeout=self._timeout)
+                # Still overloaded once the transport level retries ran out.
+                call.failed = response.status_code in self.RETRY_STATUS_CODES
+            with metrics.timer(DECODE_SECONDS, command):
+                data = response.json()
+            if metrics.enabled:
+                metrics.observe(REQUEST_BYTES, command, len(response.request.body or b''))
+                metrics.observe(RESPONSE_BYTES, command, len(response.content))
+            # Skip the first object, as it will be the auth result.
+            if len(data) != len(commands) + 1:
+                raise Exception(f'Did not receive {len(commands) + 1} response objects for Harvester Task {data}')
+        except Exception:
+            metrics.increment(ERRORS, command)
+            raise
+        return data[1:]
+
+    def __run_api_command(self, command: dict, token: str) -> dict:
+        """
+        Internal member class to execute API commands against Authentic8
+        Harvester.
+        """
+        return self._run_api_commands([command], token)[0]
+
+    def batch(self, max_batch_size: int = HarvesterBatch.DEFAULT_MAX_BATCH_SIZE) -> HarvesterBatch:
+        """
+        Returns a HarvesterBatch which collects create_capture_task,
+        delete_task and delete_file calls and sends them in as few round trips
+        as possible when the batch is executed.
+        """
+        return HarvesterBatch(self, max_batch_size=max_batch_size)
+
+    def create_capture_task(self, url: str, proxy: CountryCode, image=True, html=True, note: Optional[str] = None) -> str:  # noqa: E501
+        """
+        Attempt to run a Harvester Authentic8 capture task against the
+        supplied URL, via the specified proxy location. Optionally specify if
+        the caller wants just the image or just the HTML. Returns the task ID
+        that was spawned.
+        """
+        return self._create_task([url], proxy, image, html, note)
+
+    def _create_task(self, urls: List[str], proxy: CountryCode, image: bool, html: bool,
+                     note: Optional[str]) -> str:
+        cmd = self._create_task_command(urls, proxy, image, html, note)
         result = self.__run_api_command(cmd, self._api_token)
-        result_dict = result.get(self.KEY_RESULT)
-        if not result_dict or result_dict.get(self.KEY_DELETED) is None:
-            raise Exception(f'Malformed Harvester response when deleting task {task_id}')
-        return result_dict.get(self.KEY_DELETED) is True
+        return self._parse_created_task(result, urls, proxy, note)
+
+    def capture(self, url: str, proxy: CountryCode, image=True, html=True, note: Optional[str] = None,
+                timeout: Optional[float] = None) -> bytes:
+        """
+        Capture the URL end to end and return the archive: create the task,
+        wait for it, download its file and delete both from Harvester.
+        Concurrent calls with the same arguments share a single task and
+        archive, and all of them raise if it fails. With a cache the archive
+        is served from, and stored in, the cache. With a lock_dir only one
+        process at a time captures a given request, so together with a
+        shared cache directory the other processes pick up its archive.
+        """
+        return self._flights.do(self._capture_key(url, proxy, image, html, note),
+                                lambda: self._capture(url, proxy, image, html, note, timeout))
+
+    def _capture(self, url: str, proxy: CountryCode, image: bool, html: bool, note: Optional[str],
+                 timeout: Optional[float]) -> bytes:
+        key = self._cache.key(url, proxy, image, html) if self._cache is not None else None
+        if key is not None:
+            path = self._cache.get(key)
+            if path is not None:
+                try:
+                    with open(path, 'rb') as f:
+                        return f.read()
+                except FileNotFoundError:
+                    pass
+
+        task_id = self.create_capture_task(url, proxy, image=image, html=html, note=note)
+        try:
+            file_id = self._parse_finished_task(self.wait_for(task_id, timeout))
+            try:
+                archive = self.download_file(file_id)
+            finally:
+                self.delete_file(file_id)
+        finally:
+            self.delete_task(task_id)
+        if key is not None:
+            self._cache.put(key, archive)
+        return archive
+
+    def create_capture_tasks(self, urls: Iterable[str], proxy: CountryCode, image=True, html=True,
+                             note: Optional[str] = None, urls_per_task: int = HarvesterClientBase.DEFAULT_URLS_PER_TASK,
+                             max_workers: int = HarvesterClientBase.DEFAULT_POOL_MAXSIZE) -> BulkCaptureResult:
+        """
+        Capture many URLs via the specified proxy location. URLs are packed
+        into multi-URL Harvester tasks of at most urls_per_task URLs, and the
+        tasks are submitted concurrently on up to max_workers threads. A
+        failed submission only affects the URLs in that task.
+        """
+        chunks = self._chunk_urls(urls, urls_per_task)
+        result = BulkCaptureResult({}, {})
+        if not chunks:
+            return result
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+            futures = {
+                executor.submit(self._create_task, chunk, proxy, image, html, note): chunk for chunk in chunks
+            }
+            for future in as_completed(futures):
+                try:
+                    task_id = future.result()
+                except Exception as e:
+                    result.errors.update(dict.fromkeys(futures[future], e))
+                else:
+                    result.task_ids.update(dict.fromkeys(futures[future], task_id))
+        return result
+
+    def get_tasks(self, finished: bool = False) -> list:
+        """
+        Retrieve all Harvester tasks, filtered by finished status if supplied.
+        """
+        result = self.__run_api_command(self._find_tasks_command(finished), self._api_token)
+        return self._parse_get_tasks_result(result)
+
+    def iter_tasks(self, finished: bool = False, status: Optional[str] = None,
+                   task_ids: Optional[Iterable[str]] = None,
+                   chunk_size: int = HarvesterClientBase.DEFAULT_STREAM_CHUNK_SIZE) -> Iterator[HarvesterTask]:
+        """
+        Stream Harvester tasks, filtered by finished status if supplied. The
+        response is parsed incrementally and tasks are yielded one at a time
+        as HarvesterTask tuples, optionally filtered by status and task ID, so
+        the full task list is never materialized.
+        """
+        data = self._api_payload([self._find_tasks_command(finished)], self._api_token)
+        metrics, command = self._metrics, self.FIND_TASK_COMMAND
+        task_ids = set(task_ids) if task_ids is not None else None
+        parser = TaskStreamParser()
+        size = 0
+        try:
+            # The limit and the timer only cover the wait for the response
+            # headers, not the time spent by the caller between tasks, which
+            # may itself need a slot, e.g. to delete the tasks it reads.
+            with self._throttle.limit(Throttle.FIND) as call:
+                with metrics.timer(ROUND_TRIP_SECONDS, command):
+                    response = self._session.post(url=self._api_url, json=data, stream=True, timeout=self._timeout)
+                # Still overloaded once the transport level retries ran out.
+                call.failed = response.status_code in self.RETRY_STATUS_CODES
+            with response:
+                response.raise_for_status()
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    size += len(chunk)
+                    yield from self._filter_tasks(parser.feed(chunk), status, task_ids)
+                yield from self._filter_tasks(parser.close(), status, task_ids)
+            if metrics.enabled:
+                metrics.observe(REQUEST_BYTES, command, len(response.request.body or b''))
+                metrics.observe(RESPONSE_BYTES, command, size)
+        except Exception:
+            metrics.increment(ERRORS, command)
+            raise
+
+    def purge(self, older_than: Optional[float] = None, status: Optional[str] = None, dry_run: bool = False,
+              all_tasks: bool = False, batch_size: int = HarvesterBatch.DEFAULT_MAX_BATCH_SIZE,
+              max_workers: int = HarvesterClientBase.DEFAULT_PURGE_WORKERS) -> PurgeResult:
+        """
+        Delete stale tasks and their result files, e.g. those left behind by
+        workers that crashed before cleaning up. Selects tasks created more
+        than older_than seconds ago and, if given, with the status. Tasks
+        without a parsable creation time are never selected by older_than,
+        see PurgeResult.undated. Without older_than every task on the account
+        is selected, including running captures, so that requires
+        all_tasks=True. The task list is streamed and the selected tasks are
+        deleted in batches of batch_size on up to max_workers threads while
+        it is read. Each file is deleted before its task, so a failure never
+        orphans a file. With dry_run nothing is deleted and the result lists
+        what would be.
+        """
+        if older_than is None and not all_tasks:
+            raise ValueError('purge requires older_than, or all_tasks=True to select every task')
+        cutoff = time.time() - older_than if older_than is not None else None
+        task_ids, errors = [], {}
+        scanned = undated = tasks_deleted = files_deleted = 0
+        pending = set()
+
+        def collect(done) -> None:
+            nonlocal tasks_deleted, files_deleted
+            for future in done:
+                batch_tasks, batch_files, batch_errors = future.result()
+                tasks_deleted += batch_tasks
+                files_deleted += batch_files
+                errors.update(batch_errors)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            batch = []
+            for task in self.iter_tasks(status=status):
+                scanned += 1
+                if cutoff is not None:
+                    created = task.created_at
+                    if created is None:
+                        undated += 1
+                        continue
+                    if created >= cutoff:
+                        continue
+                task_ids.append(task.task_id)
+                if dry_run:
+                    continue
+                batch.append(task)
+                if len(batch) >= batch_size:
+                    pending.add(executor.submit(self._purge_batch, batch))
+                    batch = []
+                    # Bound the work queued ahead of the deletes.
+                    if len(pending) >= max_workers * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+            if batch:
+                pending.add(executor.submit(self._purge_batch, batch))
+            collect(pending)
+        return PurgeResult(scanned, undated, task_ids, tasks_deleted, files_deleted, errors, dry_run)
+
+    def _purge_batch(self, tasks: List[HarvesterTask]) -> Tuple[int, int, Dict[str, Exception]]:
+        """
+        Delete the files, then the tasks whose file is gone, in one round
+        trip each. Returns the number of tasks and files deleted and the
+        errors by task ID.
+        """
+        errors = {}
+        with self.batch(len(tasks)) as batch:
+            files = {task.task_id: batch.delete_file(task.result_file_id) for task in tasks if task.result_file_id}
+        with self.batch(len(tasks)) as batch:
+            deletes = {}
+            for task in tasks:
+                future = files.get(task.task_id)
+                if future is not None and future.exception() is not None:
+                    errors[task.task_id] = future.exception()
+                else:
+                    deletes[task.task_id] = batch.delete_task(task.task_id)
+        for task_id, future in deletes.items():
+            if future.exception() is not None:
+                errors[task_id] = future.exception()
+        tasks_deleted = sum(1 for task_id in deletes if task_id not in errors)
+        files_deleted = sum(1 for future in files.values() if future.exception() is None)
+        return tasks_deleted, files_deleted, errors
+
+    def delete_task(self, task_id: str) -> bool:
+        """
+        Delete Harvester Authentic8 task by ID.
+        """
+        result = self.__run_api_command(self._delete_task_command(task_id), self._api_token)
+        return self._parse_delete_task_result(result, task_id)
 
     def download_file(self, file_id: str) -> bytes:
         """
@@ -175,15 +757,29 @@ class HarvesterAsyncClient(object):
             self.KEY_ID: file_id,
             self.KEY_AUTH: self._storage_token
         }
-        response = requests.post(url=self._getfile_url, data=params)
-        response.raise_for_status()
-        return response.content
+        started = time.monotonic()
+        try:
+            with self._throttle.limit(Throttle.GETFILE):
+                response = self._session.post(url=self._getfile_url, data=params, timeout=self._timeout)
+                response.raise_for_status()
+                content = response.content
+        except Exception:
+            self._metrics.increment(ERRORS, GETFILE)
+            raise
+        if self._metrics.enabled:
+            self._observe_download(DownloadResult(None, len(content), time.monotonic() - started, 0, 1))
+        return content
 
-    def save_file_to_disk(self, file_id: str, file_dst: str, chunk_size: int = None) -> None:
+    def save_file_to_disk(self, file_id: str, file_dst: str, chunk_size: int = None,
+                          max_workers: int = FileDownloader.DEFAULT_MAX_WORKERS,
+                          segment_size: int = FileDownloader.DEFAULT_SEGMENT_SIZE) -> DownloadResult:
         """
         Requires the S3 file ID of the file stored in the Authentic8 permenant
         storage pool. Saves the resulting file to the disk location the caller
-        specified.
+        specified, downloading up to max_workers ranges of segment_size bytes
+        in parallel when the endpoint supports it. An interrupted download
+        resumes from its `.part` file when called again. Returns the size and
+        throughput of the download.
         """
         params = {
             self.KEY_ID: file_id,
@@ -191,62 +787,23 @@ class HarvesterAsyncClient(object):
         }
 
         if not chunk_size:
-            chunk_size = self.HUNDRED_MB_CHUNK_SIZE
+            chunk_size = self.ONE_MB_CHUNK_SIZE
 
-        # Stream the download to ensure we don't need to hold the whole file in memory at once.
-        with requests.post(url=self._getfile_url, data=params, stream=True) as response:
-            response.raise_for_status()
-            with open(file_dst, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=chunk_size):
-                    f.write(chunk)
+        downloader = FileDownloader(self._session, self._getfile_url, params, file_id=file_id, timeout=self._timeout,
+                                    buffer_size=chunk_size, segment_size=segment_size, max_workers=max_workers,
+                                    throttle=self._throttle)
+        try:
+            result = downloader.download(file_dst)
+        except Exception:
+            self._metrics.increment(ERRORS, GETFILE)
+            raise
+        self._observe_download(result)
+        return result
 
     def delete_file(self, file_id: str) -> str:
         """
         Requires the S3 file ID of the file stored in the Authentic8 permenant
         storage pool. Does not work with file path.
         """
-        cmd = {
-            self.KEY_COMMAND: self.DELETE_FILE_COMMAND,
-            self.KEY_FILE_ID: file_id
-        }
-        result = self.__run_api_command(cmd, self._storage_token)
-
-        if result.get(self.KEY_ERROR, '') == self.ALREADY_DELETED_ERROR:
-            return f'deleted file {file_id}'
-
-        result_dict = result.get(self.KEY_RESULT)
-        if not result_dict:
-            raise Exception(f'Malformed Harvester response when deleting file {file_id}')
-        return result_dict
-
-    def image_from_zip(self, ziparchive: bytes) -> Optional[bytes]:
-        """
-        Expects a zip archive in the format created by Harvester. Will extract
-        the captured screenshot.
-        """
-        with ZipFile(BytesIO(ziparchive), 'r') as zip:
-            if self.PNG_ARCHIVE_PATH in zip.namelist():
-                return zip.read(self.PNG_ARCHIVE_PATH)
-
-    def html_from_zip(self, ziparchive: bytes) -> Optional[str]:
-        """
-        Expects a zip archive in the format created by Harvester. Will extract
-        the captured mhtml archive and parse out the html file.
-        """
-        try:
-            with ZipFile(BytesIO(ziparchive), 'r') as zip:
-                if self.MHTML_ARCHIVE_PATH in zip.namelist():
-                    mhtml = zip.read(self.MHTML_ARCHIVE_PATH).decode('utf-8')
-                    # MHTML can be parsed like an email - see https://datatracker.ietf.org/doc/html/rfc2557
-                    email = Parser().parsestr(mhtml)
-                    original_source = email.get(self.MHTML_ORIGINAL_SOURCE_HEADER)
-                    # Find the portion of the email which has a content type of HTML(ignoring CSS for example). The
-                    # content location should match the one that triggered this capture in the first place.
-                    for portion in email.get_payload():
-                        if portion.get_content_type() == self.MHTML_HTML_CONTENT_TYPE:
-                            if portion.get(self.MHTML_CONTENT_LOCATION) == original_source:
-                                return portion.get_payload()
-        except Exception:
-            # Not a huge fan of surpression these, but we don't have a ton of options. The missing HTML will trigger
-            # the needed investigation.
-            pass
+        result = self.__run_api_command(self._delete_file_command(file_id), self._storage_token)
+        return self._parse_delete_file_result(result, file_id)
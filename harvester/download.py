@@ -0,0 +1,229 @@
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import List, NamedTuple, Optional
+
+import requests
+
+from .throttle import Throttle
+
+_CONTENT_RANGE = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+)')
+
+
+class DownloadResult(NamedTuple):
+    """
+    Summary of a finished download. resumed_bytes counts the bytes recovered
+    from a previous, interrupted attempt rather than transferred this time.
+    """
+    path: str
+    size: int
+    elapsed: float
+    resumed_bytes: int
+    segments: int
+
+    @property
+    def bytes_per_second(self) -> float:
+        transferred = self.size - self.resumed_bytes
+        return transferred / self.elapsed if self.elapsed > 0 else float(transferred)
+
+
+class FileDownloader(object):
+    """
+    Downloads a file from the Harvester getfile endpoint into a preallocated
+    `<dst>.part` file using small reusable buffers.
+
+    The first request asks for a byte range. If the endpoint honours it, the
+    rest of the file is split into segment_size ranges fetched on up to
+    max_workers threads, and progress is recorded in `<dst>.part.json` so an
+    interrupted download of the same file_id resumes where each segment left
+    off; a part file left by a different file is discarded. Otherwise the
+    file is streamed sequentially. Failed ranges are retried max_retries
+    times, and the final size is verified before the part file is moved into
+    place. Every request waits on throttle, if given, for its own getfile
+    token and concurrency slot.
+    """
+    DEFAULT_BUFFER_SIZE = 1024 * 1024
+    DEFAULT_SEGMENT_SIZE = 1024 * 1024 * 16
+    DEFAULT_MAX_WORKERS = 4
+    DEFAULT_MAX_RETRIES = 3
+    PART_SUFFIX = '.part'
+    STATE_SUFFIX = '.part.json'
+
+    def __init__(self, session: requests.Session, url: str, data: dict, file_id: Optional[str] = None, timeout=None,
+                 buffer_size: int = DEFAULT_BUFFER_SIZE, segment_size: int = DEFAULT_SEGMENT_SIZE,
+                 max_workers: int = DEFAULT_MAX_WORKERS, max_retries: int = DEFAULT_MAX_RETRIES,
+                 throttle: Optional[Throttle] = None) -> None:
+        if buffer_size < 1 or segment_size < 1 or max_workers < 1:
+            raise ValueError('buffer_size, segment_size and max_workers must be at least 1')
+        self._session = session
+        self._url = url
+        self._data = data
+        self._file_id = file_id
+        self._timeout = timeout
+        self._buffer_size = buffer_size
+        self._segment_size = segment_size
+        self._max_workers = max_workers
+        self._max_retries = max_retries
+        self._throttle = throttle or Throttle()
+        self._lock = Lock()
+
+    def download(self, dst: str) -> DownloadResult:
+        started = time.monotonic()
+        part_path = dst + self.PART_SUFFIX
+        state_path = dst + self.STATE_SUFFIX
+
+        state = self._load_state(part_path, state_path)
+        if state is None:
+            state = self._start(part_path, state_path)
+        resumed_bytes = 0 if state.get('fresh') else sum(segment[2] for segment in state['segments'])
+
+        if state['segments'] is not None:
+            self._fetch_segments(part_path, state_path, state)
+
+        size = os.path.getsize(part_path)
+        if state['size'] is not None and size != state['size']:
+            raise Exception(f'Downloaded {size} bytes to {dst}, expected {state["size"]}')
+        os.replace(part_path, dst)
+        if os.path.exists(state_path):
+            os.remove(state_path)
+        segments = len(state['segments']) if state['segments'] is not None else 1
+        return DownloadResult(dst, size, time.monotonic() - started, resumed_bytes, segments)
+
+    def _load_state(self, part_path: str, state_path: str) -> Optional[dict]:
+        if not os.path.exists(part_path) or not os.path.exists(state_path):
+            return None
+        try:
+            with open(state_path, 'r') as f:
+                state = json.load(f)
+        except ValueError:
+            return None
+        if state.get('file_id') != self._file_id or os.path.getsize(part_path) != state.get('size'):
+            return None
+        return state
+
+    def _save_state(self, state_path: str, state: dict) -> None:
+        tmp_path = state_path + '.tmp'
+        with self._lock:
+            with open(tmp_path, 'w') as f:
+                json.dump({'file_id': self._file_id, 'size': state['size'], 'segments': state['segments']}, f)
+        os.replace(tmp_path, state_path)
+
+    def _post(self, headers: Optional[dict] = None) -> requests.Response:
+        response = self._session.post(url=self._url, data=self._data, headers=headers, stream=True,
+                                      timeout=self._timeout)
+        response.raise_for_status()
+        return response
+
+    def _start(self, part_path: str, state_path: str) -> dict:
+        """
+        Issue the first request for the leading segment. If the endpoint
+        honours ranges, plan the remaining segments; otherwise stream the
+        whole file sequentially.
+        """
+        with self._throttle.limit(Throttle.GETFILE):
+            return self._start_request(part_path, state_path)
+
+    def _start_request(self, part_path: str, state_path: str) -> dict:
+        response = self._session.post(url=self._url, data=self._data, stream=True, timeout=self._timeout,
+                                      headers={'Range': f'bytes=0-{self._segment_size - 1}',
+                                               'Accept-Encoding': 'identity'})
+        if response.status_code == 416:
+            # Range not satisfiable, e.g. an empty file. Fall back to a plain request.
+            response.close()
+            response = self._post()
+        response.raise_for_status()
+        with response:
+            match = _CONTENT_RANGE.match(response.headers.get('Content-Range', ''))
+            if response.status_code != 206 or not match:
+                size = response.headers.get('Content-Length')
+                size = int(size) if size is not None and not response.headers.get('Content-Encoding') else None
+                with open(part_path, 'wb') as f:
+                    if size:
+                        self._preallocate(f, size)
+                    written = self._copy(response, f, None)
+                    f.truncate(written)
+                return {'size': size, 'segments': None, 'fresh': True}
+
+            size = int(match.group(3))
+            segments = [
+                [start, min(start + self._segment_size, size), 0] for start in range(0, size, self._segment_size)
+            ]
+            state = {'size': size, 'segments': segments, 'fresh': True}
+            with open(part_path, 'wb') as f:
+                self._preallocate(f, size)
+                try:
+                    if segments:
+                        self._copy(response, f, segments[0])
+                except Exception:
+                    # Whatever is missing from the first segment is retried with the others.
+                    pass
+            self._save_state(state_path, state)
+            return state
+
+    def _preallocate(self, f, size: int) -> None:
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+        except (AttributeError, OSError):
+            f.truncate(size)
+
+    def _copy(self, response: requests.Response, f, segment: Optional[List[int]]) -> int:
+        """
+        Copy the response body into f through a single reusable buffer. For
+        a segment, writes start at its current offset, stop at its end and
+        progress is tracked in the segment.
+        """
+        # Undo any content encoding the server applied despite asking for identity.
+        response.raw.decode_content = True
+        buffer = bytearray(self._buffer_size)
+        view = memoryview(buffer)
+        written = 0
+        if segment is not None:
+            f.seek(segment[0] + segment[2])
+        while True:
+            if segment is not None:
+                remaining = segment[1] - segment[0] - segment[2]
+                if remaining <= 0:
+                    break
+                n = response.raw.readinto(view[:min(remaining, len(view))])
+            else:
+                n = response.raw.readinto(view)
+            if not n:
+                break
+            f.write(view[:n])
+            written += n
+            if segment is not None:
+                with self._lock:
+                    segment[2] += n
+        return written
+
+    def _fetch_segments(self, part_path: str, state_path: str, state: dict) -> None:
+        pending = [segment for segment in state['segments'] if segment[2] < segment[1] - segment[0]]
+        if not pending:
+            return
+        try:
+            with ThreadPoolExecutor(max_workers=min(self._max_workers, len(pending))) as executor:
+                for future in [executor.submit(self._fetch_segment, part_path, segment) for segment in pending]:
+                    future.result()
+        finally:
+            self._save_state(state_path, state)
+
+    def _fetch_segment(self, part_path: str, segment: List[int]) -> None:
+        attempt = 0
+        while segment[2] < segment[1] - segment[0]:
+            start = segment[0] + segment[2]
+            headers = {'Range': f'bytes={start}-{segment[1] - 1}', 'Accept-Encoding': 'identity'}
+            try:
+                with self._throttle.limit(Throttle.GETFILE), self._post(headers) as response:
+                    if response.status_code != 206:
+                        raise Exception(f'Range request for bytes {start}-{segment[1] - 1} was not honoured')
+                    with open(part_path, 'r+b') as f:
+                        self._copy(response, f, segment)
+                if segment[2] < segment[1] - segment[0]:
+                    raise Exception(f'Connection closed early for bytes {start}-{segment[1] - 1}')
+            except Exception:
+                attempt += 1
+                if attempt > self._max_retries:
+                    raise
@@ -0,0 +1,143 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+from typing import Dict, NamedTuple, Optional
+
+from .archive import HarvesterArchive
+from .mhtml import SNAPSHOT_CONTENT_LOCATION, iter_resources, read_root
+
+
+class ExtractionResult(NamedTuple):
+    """
+    What was extracted from an archive. image is None if it was not
+    requested, was written to image_dst instead or is missing, and likewise
+    for html. metadata holds the archive member sizes under 'members' and,
+    for captures with an mhtml, the captured 'url', the html 'encoding' and
+    the number of 'resources'.
+    """
+    path: str
+    image: Optional[bytes]
+    html: Optional[str]
+    metadata: Optional[dict]
+
+
+def _metadata(archive: HarvesterArchive) -> dict:
+    metadata = {'members': {name: info.file_size for name, info in archive.members.items()}}
+    if archive.mhtml is not None:
+        root, _, _ = read_root(archive.mhtml)
+        metadata['url'] = root.get(SNAPSHOT_CONTENT_LOCATION)
+        content = archive.html_content
+        metadata['encoding'] = content.encoding if content is not None else None
+        metadata['resources'] = sum(1 for _ in iter_resources(archive.mhtml))
+    return metadata
+
+
+def extract_archive(path: str, image: bool = True, html: bool = True, metadata: bool = False,
+                    image_dst: Optional[str] = None) -> ExtractionResult:
+    """
+    Extract the requested artifacts from the archive at path. Runs in the
+    worker processes of ExtractionExecutor, but works just as well inline.
+    With image_dst, the screenshot is streamed to that path rather than
+    returned, which saves sending it back from the worker.
+    """
+    with HarvesterArchive(path) as archive:
+        image_data = None
+        if image_dst is not None:
+            archive.extract(HarvesterArchive.PNG_ARCHIVE_PATH, image_dst)
+        elif image:
+            image_data = archive.image
+        return ExtractionResult(
+            path,
+            image_data,
+            archive.html if html else None,
+            _metadata(archive) if metadata else None
+        )
+
+
+class ExtractionExecutor(object):
+    """
+    Runs archive extraction in a pool of worker processes, so unzipping and
+    MHTML parsing use every core instead of contending for the GIL with the
+    threads doing I/O. Archives are passed by path and opened in the worker,
+    so only the path and the extracted artifacts cross the process boundary.
+
+    Every method returns a concurrent.futures.Future, usable from threads
+    directly and from asyncio through the *_async variants.
+    """
+    DEFAULT_MAX_WORKERS = os.cpu_count() or 1
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS, mp_context=None) -> None:
+        """
+        Workers are started with forkserver where available, as forking a
+        process that is already running I/O threads is unsafe; pass
+        mp_context to override.
+        """
+        if mp_context is None:
+            methods = multiprocessing.get_all_start_methods()
+            mp_context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        self._executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context)
+
+    def __enter__(self) -> 'ExtractionExecutor':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.shutdown()
+
+    def shutdown(self, wait: bool = True, cancel_futures: bool = False) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+    def submit(self, path: str, image: bool = True, html: bool = True, metadata: bool = False,
+               image_dst: Optional[str] = None) -> 'Future[ExtractionResult]':
+        """
+        Extract the requested artifacts in a worker, see extract_archive.
+        """
+        return self._executor.submit(extract_archive, os.fspath(path), image, html, metadata, image_dst)
+
+    def image(self, path: str) -> 'Future[Optional[bytes]]':
+        return _chain(self.submit(path, html=False), lambda result: result.image)
+
+    def html(self, path: str) -> 'Future[Optional[str]]':
+        return _chain(self.submit(path, image=False), lambda result: result.html)
+
+    def metadata(self, path: str) -> 'Future[Dict]':
+        return _chain(self.submit(path, image=False, html=False, metadata=True), lambda result: result.metadata)
+
+    async def extract_async(self, path: str, image: bool = True, html: bool = True, metadata: bool = False,
+                            image_dst: Optional[str] = None) -> ExtractionResult:
+        return await asyncio.wrap_future(self.submit(path, image, html, metadata, image_dst))
+
+    async def image_async(self, path: str) -> Optional[bytes]:
+        return await asyncio.wrap_future(self.image(path))
+
+    async def html_async(self, path: str) -> Optional[str]:
+        return await asyncio.wrap_future(self.html(path))
+
+    async def metadata_async(self, path: str) -> Dict:
+        return await asyncio.wrap_future(self.metadata(path))
+
+
+def _chain(future: Future, transform) -> Future:
+    """
+    A Future resolving to transform(result) of future, or to its exception.
+    The chained future is already running, so it cannot be cancelled itself;
+    if future is cancelled it raises CancelledError instead.
+    """
+    chained = Future()
+
+    def done(source: Future) -> None:
+        if source.cancelled():
+            chained.set_exception(CancelledError())
+            return
+        error = source.exception()
+        if error is not None:
+            chained.set_exception(error)
+            return
+        try:
+            chained.set_result(transform(source.result()))
+        except Exception as e:
+            chained.set_exception(e)
+
+    chained.set_running_or_notify_cancel()
+    future.add_done_callback(done)
+    return chained
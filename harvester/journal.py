@@ -0,0 +1,193 @@
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+from threading import Lock
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+
+class JournalEntry(NamedTuple):
+    """
+    The journalled state of a task: the request that created it, its latest
+    status and, once it finished, its result file ID. Times are epoch
+    seconds.
+    """
+    task_id: str
+    urls: List[str]
+    proxy: Optional[str]
+    note: Optional[str]
+    status: str
+    file_id: Optional[str]
+    created: float
+    updated: float
+
+
+class TaskJournal(object):
+    """
+    Local, crash-safe record of the tasks a client created and what has
+    happened to them since, so a restarted worker can pick up its own
+    in-flight captures without scanning (and guessing at) the whole account.
+
+    Backed by SQLite in WAL mode: every change is committed before the call
+    that made it returns, readers never block the writer, and any number of
+    threads and processes can share one journal file. Each task has a row
+    holding its current status, indexed by status, and every change is also
+    appended to an event log. A task moves through created, finished (or
+    failed), file_deleted and deleted; everything before deleted is
+    outstanding.
+    """
+    CREATED = 'created'
+    FINISHED = 'finished'
+    FAILED = 'failed'
+    FILE_DELETED = 'file_deleted'
+    DELETED = 'deleted'
+    OUTSTANDING = (CREATED, FINISHED, FAILED, FILE_DELETED)
+    DEFAULT_TIMEOUT = 30.0
+
+    _SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS tasks (
+            task_id TEXT PRIMARY KEY,
+            urls TEXT NOT NULL,
+            proxy TEXT,
+            note TEXT,
+            status TEXT NOT NULL,
+            file_id TEXT,
+            created REAL NOT NULL,
+            updated REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, created);
+        CREATE INDEX IF NOT EXISTS tasks_file_id ON tasks (file_id);
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id TEXT NOT NULL,
+            status TEXT NOT NULL,
+            file_id TEXT,
+            at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS events_task_id ON events (task_id);
+    '''
+    _COLUMNS = 'task_id, urls, proxy, note, status, file_id, created, updated'
+
+    def __init__(self, path: str, timeout: float = DEFAULT_TIMEOUT) -> None:
+        """
+        Open (or create) the journal at path. timeout is how long a write
+        waits for another process holding the write lock.
+        """
+        self.path = path
+        self._lock = Lock()
+        self._conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        # With WAL, NORMAL only risks the latest commits on power loss, never on a process crash.
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        with self._lock:
+            self._conn.executescript(self._SCHEMA)
+
+    def __enter__(self) -> 'TaskJournal':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _entry(self, row: tuple) -> JournalEntry:
+        return JournalEntry(row[0], json.loads(row[1]), *row[2:])
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Hold the write lock for the body and commit it as one transaction.
+        """
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def record_created(self, task_id: str, urls: List[str], proxy: Optional[str] = None,
+                       note: Optional[str] = None) -> None:
+        """
+        Journal a newly created task, before anything else can happen to it.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(f'INSERT OR REPLACE INTO tasks ({self._COLUMNS}) VALUES (?, ?, ?, ?, ?, NULL, ?, ?)',
+                         (task_id, json.dumps(urls), proxy, note, self.CREATED, now, now))
+            conn.execute('INSERT INTO events (task_id, status, file_id, at) VALUES (?, ?, NULL, ?)',
+                         (task_id, self.CREATED, now))
+
+    def _update(self, conn: sqlite3.Connection, task_id: str, status: str, file_id: Optional[str]) -> bool:
+        now = time.time()
+        changed = conn.execute(
+            'UPDATE tasks SET status = ?, file_id = COALESCE(?, file_id), updated = ? WHERE task_id = ?',
+            (status, file_id, now, task_id)
+        ).rowcount
+        if changed:
+            conn.execute('INSERT INTO events (task_id, status, file_id, at) VALUES (?, ?, ?, ?)',
+                         (task_id, status, file_id, now))
+        return bool(changed)
+
+    def record(self, task_id: str, status: str, file_id: Optional[str] = None) -> bool:
+        """
+        Move a journalled task to status, keeping its file ID unless one is
+        given. Tasks that are not in the journal, e.g. other workers' tasks
+        deleted by a purge, are ignored. Returns whether the task was found.
+        """
+        with self._transaction() as conn:
+            return self._update(conn, task_id, status, file_id)
+
+    def record_file_deleted(self, file_id: str) -> bool:
+        """
+        Mark the task owning the result file as file_deleted, unless the task
+        itself is already deleted. Returns whether such a task was found.
+        """
+        with self._transaction() as conn:
+            row = conn.execute('SELECT task_id FROM tasks WHERE file_id = ? AND status != ?',
+                               (file_id, self.DELETED)).fetchone()
+            return row is not None and self._update(conn, row[0], self.FILE_DELETED, None)
+
+    def get(self, task_id: str) -> Optional[JournalEntry]:
+        with self._lock:
+            row = self._conn.execute(f'SELECT {self._COLUMNS} FROM tasks WHERE task_id = ?', (task_id,)).fetchone()
+        return self._entry(row) if row is not None else None
+
+    def find(self, *statuses: str) -> List[JournalEntry]:
+        """
+        Every task with one of the statuses, oldest first.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT {self._COLUMNS} FROM tasks WHERE status IN ({", ".join("?" * len(statuses))}) '
+                f'ORDER BY created', statuses
+            ).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def outstanding(self) -> List[JournalEntry]:
+        """
+        Every task that has not been deleted yet, oldest first.
+        """
+        return self.find(*self.OUTSTANDING)
+
+    def history(self, task_id: str) -> List[Tuple[str, Optional[str], float]]:
+        """
+        The (status, file_id, time) of every change to the task, in order.
+        """
+        with self._lock:
+            return self._conn.execute('SELECT status, file_id, at FROM events WHERE task_id = ? ORDER BY id',
+                                      (task_id,)).fetchall()
+
+    def compact(self, older_than: float = 0.0) -> int:
+        """
+        Forget deleted tasks last changed more than older_than seconds ago,
+        along with their events. Returns the number of tasks forgotten.
+        """
+        cutoff = time.time() - older_than
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM events WHERE task_id IN (SELECT task_id FROM tasks WHERE status = ? AND '
+                         'updated <= ?)', (self.DELETED, cutoff))
+            return conn.execute('DELETE FROM tasks WHERE status = ? AND updated <= ?', (self.DELETED, cutoff)).rowcount
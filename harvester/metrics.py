@@ -0,0 +1,167 @@
+import bisect
+import time
+from contextlib import contextmanager, nullcontext
+from threading import Lock
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Metric names. Each observation is further labelled with the command it
+# belongs to (e.g. create_harvest_task, getfile or image).
+ROUND_TRIP_SECONDS = 'round_trip_seconds'
+DECODE_SECONDS = 'decode_seconds'
+REQUEST_BYTES = 'request_bytes'
+RESPONSE_BYTES = 'response_bytes'
+DOWNLOAD_SECONDS = 'download_seconds'
+DOWNLOAD_BYTES_PER_SECOND = 'download_bytes_per_second'
+EXTRACT_SECONDS = 'extract_seconds'
+ERRORS = 'errors'
+
+# Command labels of calls that are not Harvester API commands.
+GETFILE = 'getfile'
+EXTRACT_IMAGE = 'image'
+EXTRACT_HTML = 'html'
+EXTRACT_MHTML = 'mhtml'
+
+
+class Instrumentation(object):
+    """
+    Receives the metrics recorded by the clients. This base class discards
+    everything and is the default; subclass it and override observe and
+    increment to export metrics elsewhere. Clients skip the bookkeeping
+    that only serves metrics (such as measuring payload sizes) unless
+    enabled is True.
+    """
+    enabled = False
+
+    def observe(self, metric: str, command: str, value: float) -> None:
+        """
+        Record a sample, e.g. a duration in seconds or a size in bytes.
+        """
+
+    def increment(self, metric: str, command: str, value: int = 1) -> None:
+        """
+        Add to a counter.
+        """
+
+    def timer(self, metric: str, command: str):
+        """
+        Context manager observing the duration of its body in seconds.
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return self._timer(metric, command)
+
+    @contextmanager
+    def _timer(self, metric: str, command: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(metric, command, time.perf_counter() - started)
+
+
+_NULL_TIMER = nullcontext()
+NULL_INSTRUMENTATION = Instrumentation()
+
+
+class Histogram(object):
+    """
+    Fixed bucket histogram. Buckets grow geometrically from 1e-6 by a factor
+    of 2, which spans microsecond timings up to multi-gigabyte sizes in 64
+    buckets with a relative error of at most 2x per percentile.
+    """
+    BOUNDS = [1e-6 * 2 ** i for i in range(64)]
+
+    def __init__(self) -> None:
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value: float) -> None:
+        self.buckets[bisect.bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        Upper bound of the bucket holding the q-th percentile (0-100),
+        clamped to the observed min and max.
+        """
+        if not self.count:
+            return None
+        rank = max(1, q / 100 * self.count)
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                bound = self.BOUNDS[i] if i < len(self.BOUNDS) else self.max
+                return min(max(bound, self.min), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.sum / self.count if self.count else None,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+        }
+
+
+class HistogramInstrumentation(Instrumentation):
+    """
+    Thread safe, in-memory Instrumentation keeping a Histogram per metric and
+    command, and a total per counter. snapshot() returns plain dicts suitable
+    for logging or pushing to a dashboard.
+    """
+    enabled = True
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._histograms: Dict[Tuple[str, str], Histogram] = {}
+        self._counters: Dict[Tuple[str, str], int] = {}
+
+    def observe(self, metric: str, command: str, value: float) -> None:
+        with self._lock:
+            histogram = self._histograms.get((metric, command))
+            if histogram is None:
+                histogram = self._histograms[(metric, command)] = Histogram()
+            histogram.add(value)
+
+    def increment(self, metric: str, command: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[(metric, command)] = self._counters.get((metric, command), 0) + value
+
+    def histogram(self, metric: str, command: str) -> Optional[Histogram]:
+        return self._histograms.get((metric, command))
+
+    def counter(self, metric: str, command: str) -> int:
+        return self._counters.get((metric, command), 0)
+
+    def commands(self) -> List[str]:
+        with self._lock:
+            return sorted({command for _, command in list(self._histograms) + list(self._counters)})
+
+    def snapshot(self) -> dict:
+        """
+        {'histograms': {metric: {command: summary}}, 'counters': {metric:
+        {command: total}}}
+        """
+        with self._lock:
+            histograms, counters = {}, {}
+            for (metric, command), histogram in self._histograms.items():
+                histograms.setdefault(metric, {})[command] = histogram.summary()
+            for (metric, command), value in self._counters.items():
+                counters.setdefault(metric, {})[command] = value
+            return {'histograms': histograms, 'counters': counters}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
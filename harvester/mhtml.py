@@ -0,0 +1,259 @@
+"""
+Minimal MHTML (RFC 2557) reader for Harvester captures.
+
+Blink saves a page as a multipart/related document whose root headers name
+the captured URL in Snapshot-Content-Location. Rather than building a full
+email object tree, the reader scans the raw bytes for part boundaries, parses
+only the (small) part headers and slices out a part body only once it is
+needed.
+"""
+import binascii
+import codecs
+import re
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple
+
+CONTENT_LOCATION = 'content-location'
+CONTENT_TRANSFER_ENCODING = 'content-transfer-encoding'
+CONTENT_TYPE = 'content-type'
+HTML_CONTENT_TYPE = 'text/html'
+SNAPSHOT_CONTENT_LOCATION = 'snapshot-content-location'
+
+DEFAULT_CHARSET = 'utf-8'
+
+_BOUNDARY = re.compile(r'boundary\s*=\s*(?:"([^"]+)"|([^;\s]+))', re.IGNORECASE)
+_CHARSET = re.compile(r'charset\s*=\s*["\']?([\w.:-]+)', re.IGNORECASE)
+_META_CHARSET = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?([\w.:-]+)', re.IGNORECASE)
+_HEADER_ENCODING = 'utf-8'
+# HTML requires a meta charset declaration to appear within the first 1024 bytes.
+_META_SNIFF_SIZE = 1024
+
+
+class MhtmlPart(NamedTuple):
+    """
+    A single part of an MHTML document. headers are keyed by lower cased
+    header name and body holds the still transfer-encoded content.
+    """
+    headers: Dict[str, str]
+    body: bytes
+
+    @property
+    def content_type(self) -> str:
+        return self.headers.get(CONTENT_TYPE, '').split(';', 1)[0].strip().lower()
+
+    @property
+    def content_location(self) -> Optional[str]:
+        return self.headers.get(CONTENT_LOCATION)
+
+    @property
+    def transfer_encoding(self) -> str:
+        return self.headers.get(CONTENT_TRANSFER_ENCODING, '').strip().lower()
+
+    @property
+    def charset(self) -> Optional[str]:
+        """
+        The charset declared in the part's Content-Type, if any.
+        """
+        match = _CHARSET.search(self.headers.get(CONTENT_TYPE, ''))
+        return match.group(1) if match else None
+
+    def decode(self) -> bytes:
+        """
+        The body with its quoted-printable or base64 transfer encoding
+        removed.
+        """
+        return _transfer_decode(self.body, self.transfer_encoding)
+
+
+class HtmlContent(NamedTuple):
+    """
+    Transfer decoded html along with the character encoding it is written
+    in.
+    """
+    content: bytes
+    encoding: str
+
+    def text(self) -> str:
+        return self.content.decode(self.encoding, 'replace')
+
+
+def _transfer_decode(body, transfer_encoding: str) -> bytes:
+    """
+    Remove the transfer encoding from a bytes-like body. binascii reads
+    memoryviews directly, so slicing the document does not cost a copy.
+    """
+    if transfer_encoding == 'quoted-printable':
+        return binascii.a2b_qp(body)
+    if transfer_encoding == 'base64':
+        return binascii.a2b_base64(body)
+    return bytes(body)
+
+
+def detect_charset(content: bytes, declared: Optional[str] = None) -> str:
+    """
+    Pick the encoding of an html document: the charset declared by the
+    MHTML part, then a <meta> charset declaration, then utf-8. Unknown
+    charset names are ignored.
+    """
+    candidates = [declared]
+    match = _META_CHARSET.search(content, 0, _META_SNIFF_SIZE)
+    if match:
+        candidates.append(match.group(1).decode('ascii'))
+    for candidate in candidates:
+        if not candidate:
+            continue
+        try:
+            return codecs.lookup(candidate).name
+        except LookupError:
+            continue
+    return DEFAULT_CHARSET
+
+
+def _line_end(data, pos: int) -> int:
+    """
+    Index just past the end of the line containing pos.
+    """
+    end = data.find(b'\n', pos)
+    return len(data) if end == -1 else end + 1
+
+
+def parse_headers(data, pos: int = 0) -> Tuple[Dict[str, str], int]:
+    """
+    Parse a header block starting at pos, unfolding continuation lines.
+    Returns the headers keyed by lower cased name and the offset of the
+    body that follows the blank line.
+    """
+    headers = {}
+    name = None
+    while pos < len(data):
+        end = _line_end(data, pos)
+        line = bytes(data[pos:end]).rstrip(b'\r\n')
+        pos = end
+        if not line:
+            break
+        if line[:1] in (b' ', b'\t'):
+            if name is not None:
+                headers[name] += line.decode(_HEADER_ENCODING, 'surrogateescape')
+            continue
+        key, sep, value = line.partition(b':')
+        if not sep:
+            continue
+        name = key.strip().decode(_HEADER_ENCODING, 'surrogateescape').lower()
+        headers[name] = value.strip().decode(_HEADER_ENCODING, 'surrogateescape')
+    return headers, pos
+
+
+def read_root(data) -> Tuple[Dict[str, str], Optional[bytes], int]:
+    """
+    Parse the root headers of an MHTML document. Returns the headers, the
+    multipart delimiter (None if the document is not multipart) and the
+    offset of the first byte after the headers.
+    """
+    headers, pos = parse_headers(data)
+    match = _BOUNDARY.search(headers.get(CONTENT_TYPE, ''))
+    if not match or not headers.get(CONTENT_TYPE, '').lower().startswith('multipart/'):
+        return headers, None, pos
+    boundary = match.group(1) or match.group(2)
+    return headers, b'--' + boundary.encode(_HEADER_ENCODING), pos
+
+
+def _iter_parts(data, delimiter: bytes, pos: int) -> Iterator[Tuple[Dict[str, str], int, int]]:
+    """
+    Yield (headers, body start, body end) for each part, without copying any
+    part body.
+    """
+    # The first delimiter must start a line; anything before it is preamble.
+    pos = data.find(delimiter, pos)
+    while pos != -1:
+        after = pos + len(delimiter)
+        if data[after:after + 2] == b'--':
+            return
+        headers, body_start = parse_headers(data, _line_end(data, after))
+        if body_start >= len(data) and not headers:
+            return
+        next_pos = data.find(b'\n' + delimiter, body_start - 1)
+        if next_pos == -1:
+            body_end = len(data)
+        else:
+            # The line break before the delimiter belongs to the delimiter.
+            body_end = next_pos - 1 if next_pos > body_start and data[next_pos - 1:next_pos] == b'\r' else next_pos
+            next_pos += 1
+        yield headers, body_start, max(body_start, body_end)
+        pos = next_pos
+
+
+def iter_parts(data) -> Iterator[MhtmlPart]:
+    """
+    Yield every part of an MHTML document held in bytes or an mmap.
+    """
+    _, delimiter, pos = read_root(data)
+    if delimiter is None:
+        return
+    for headers, start, end in _iter_parts(data, delimiter, pos):
+        yield MhtmlPart(headers, bytes(data[start:end]))
+
+
+def _find_html_part(data) -> Optional[Tuple[MhtmlPart, int, int]]:
+    root, delimiter, pos = read_root(data)
+    if delimiter is None:
+        return None
+    original_source = root.get(SNAPSHOT_CONTENT_LOCATION)
+    for headers, start, end in _iter_parts(data, delimiter, pos):
+        part = MhtmlPart(headers, b'')
+        if part.content_type == HTML_CONTENT_TYPE and part.content_location == original_source:
+            return part, start, end
+    return None
+
+
+def find_html_part(data) -> Optional[MhtmlPart]:
+    """
+    Find the text/html part whose Content-Location matches the document's
+    Snapshot-Content-Location, i.e. the captured page itself rather than a
+    frame. Parts before it are skipped without copying their bodies and
+    scanning stops at the first match.
+    """
+    found = _find_html_part(data)
+    if found is None:
+        return None
+    part, start, end = found
+    return part._replace(body=bytes(data[start:end]))
+
+
+def find_html_content(data) -> Optional[HtmlContent]:
+    """
+    Like find_html_part, but returns the captured page with its transfer
+    encoding removed and its character encoding detected. The body is
+    decoded straight out of the document, without an intermediate copy of
+    the still encoded body.
+    """
+    found = _find_html_part(data)
+    if found is None:
+        return None
+    part, start, end = found
+    with memoryview(data) as view:
+        content = _transfer_decode(view[start:end], part.transfer_encoding)
+    return HtmlContent(content, detect_charset(content, part.charset))
+
+
+def html_from_mhtml(data) -> Optional[str]:
+    """
+    The captured page as text, decoded from its transfer and character
+    encodings.
+    """
+    content = find_html_content(data)
+    return content.text() if content is not None else None
+
+
+def iter_resources(data) -> Iterator[MhtmlPart]:
+    """
+    Yield every part other than the captured page: stylesheets, images,
+    fonts, frames and so on.
+    """
+    root, delimiter, pos = read_root(data)
+    if delimiter is None:
+        return
+    original_source = root.get(SNAPSHOT_CONTENT_LOCATION)
+    for headers, start, end in _iter_parts(data, delimiter, pos):
+        part = MhtmlPart(headers, bytes(data[start:end]))
+        if part.content_type == HTML_CONTENT_TYPE and part.content_location == original_source:
+            continue
+        yield part
@@ -0,0 +1,273 @@
+import os
+import tempfile
+from concurrent.futures import CancelledError
+from queue import Queue
+from threading import Event, Lock, Thread
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+from .archive import HarvesterArchive
+from .cache import CaptureCache
+from .client import CountryCode
+from .extraction import ExtractionExecutor
+
+_DONE = object()
+
+
+class CaptureRequest(NamedTuple):
+    url: str
+    proxy: CountryCode
+    image: bool = True
+    html: bool = True
+    note: Optional[str] = None
+
+
+class CaptureResult(NamedTuple):
+    """
+    Outcome of a single capture. error is set if any stage up to extraction
+    failed; cleanup_error is set if deleting the task or its file failed.
+    """
+    request: CaptureRequest
+    task_id: Optional[str]
+    image: Optional[bytes]
+    html: Optional[str]
+    error: Optional[Exception]
+    cleanup_error: Optional[Exception]
+    cached: bool = False
+
+
+class _Capture(object):
+    """
+    Mutable state of a capture as it moves through the pipeline.
+    """
+    __slots__ = ('request', 'task_id', 'file_id', 'path', 'temporary', 'cache_key', 'cached', 'image', 'html', 'error',
+                 'cleanup_error')
+
+    def __init__(self, request: CaptureRequest) -> None:
+        self.request = request
+        self.task_id = None
+        self.file_id = None
+        self.path = None
+        # Whether path is a download owned by the pipeline rather than a cache entry.
+        self.temporary = False
+        self.cache_key = None
+        self.cached = False
+        self.image = None
+        self.html = None
+        self.error = None
+        self.cleanup_error = None
+
+    def result(self) -> CaptureResult:
+        return CaptureResult(self.request, self.task_id, self.image, self.html, self.error, self.cleanup_error,
+                             self.cached)
+
+
+class _Stage(object):
+    def __init__(self, name: str, func, workers: int, always: bool = False) -> None:
+        if workers < 1:
+            raise ValueError(f'{name} stage needs at least one worker')
+        self.name = name
+        self.func = func
+        self.workers = workers
+        # Whether the stage runs for captures that already failed, i.e. cleanup.
+        self.always = always
+
+
+class CapturePipeline(object):
+    """
+    Runs captures end to end: submit -> wait -> download -> extract ->
+    cleanup. Each stage has its own pool of worker threads, and stages are
+    joined by bounded queues, so a slow stage (or a slow consumer of the
+    results) applies backpressure all the way back to submission rather than
+    letting downloads pile up ahead of extraction.
+
+    Every capture that reaches Harvester has its file and task deleted, even
+    if a later stage fails or the caller stops consuming results early.
+    Archives are downloaded to work_dir and removed once extracted.
+
+    With a CaptureCache, requests with a fresh cache entry skip Harvester
+    entirely and are served from the cached artifacts or archive, and new
+    archives and their artifacts are stored in the cache instead of removed.
+
+    With an ExtractionExecutor, the extract stage hands archives to its
+    worker processes and extract_workers only bounds how many are in flight,
+    so it can be raised to the executor's worker count.
+    """
+    DEFAULT_SUBMIT_WORKERS = 4
+    DEFAULT_WAIT_WORKERS = 32
+    DEFAULT_DOWNLOAD_WORKERS = 4
+    DEFAULT_EXTRACT_WORKERS = 2
+    DEFAULT_CLEANUP_WORKERS = 2
+    DEFAULT_QUEUE_SIZE = 16
+    DEFAULT_WAIT_TIMEOUT = 600
+    HTML_ARTIFACT = 'html'
+    IMAGE_ARTIFACT = 'png'
+
+    def __init__(self, client, submit_workers: int = DEFAULT_SUBMIT_WORKERS,
+                 wait_workers: int = DEFAULT_WAIT_WORKERS, download_workers: int = DEFAULT_DOWNLOAD_WORKERS,
+                 extract_workers: int = DEFAULT_EXTRACT_WORKERS, cleanup_workers: int = DEFAULT_CLEANUP_WORKERS,
+                 queue_size: int = DEFAULT_QUEUE_SIZE, wait_timeout: Optional[float] = DEFAULT_WAIT_TIMEOUT,
+                 work_dir: Optional[str] = None, cache: Optional[CaptureCache] = None,
+                 extractor: Optional[ExtractionExecutor] = None) -> None:
+        self._client = client
+        self._cache = cache
+        self._extractor = extractor
+        self._queue_size = queue_size
+        self._wait_timeout = wait_timeout
+        self._work_dir = work_dir
+        self._stages = [
+            _Stage('submit', self._submit, submit_workers),
+            _Stage('wait', self._wait, wait_workers),
+            _Stage('download', self._download, download_workers),
+            _Stage('extract', self._extract, extract_workers),
+            _Stage('cleanup', self._cleanup, cleanup_workers, always=True),
+        ]
+
+    def _submit(self, capture: _Capture) -> None:
+        request = capture.request
+        if self._cache is not None:
+            capture.cache_key = self._cache.key(request.url, request.proxy, request.image, request.html)
+            capture.path = self._cache.get(capture.cache_key)
+            if capture.path is not None:
+                capture.cached = True
+                return
+        capture.task_id = self._client.create_capture_task(
+            request.url, request.proxy, image=request.image, html=request.html, note=request.note
+        )
+
+    def _wait(self, capture: _Capture) -> None:
+        if capture.cached:
+            return
+        task = self._client.wait_for(capture.task_id, timeout=self._wait_timeout)
+        capture.file_id = task.get(self._client.KEY_RESULT_FILE_ID)
+        status = task.get(self._client.KEY_STATUS)
+        if status != self._client.TASK_STATUS_DONE or not capture.file_id:
+            raise Exception(f'Harvester task {capture.task_id} finished with status {status}')
+
+    def _download(self, capture: _Capture) -> None:
+        if capture.cached:
+            return
+        fd, capture.path = tempfile.mkstemp(suffix='.zip', dir=self._work_dir)
+        os.close(fd)
+        capture.temporary = True
+        self._client.save_file_to_disk(capture.file_id, capture.path)
+        if self._cache is not None:
+            capture.path = self._cache.put(capture.cache_key, capture.path, move=True)
+            capture.temporary = False
+
+    def _extract(self, capture: _Capture) -> None:
+        request = capture.request
+        if capture.cached:
+            capture.image = self._cache.get_artifact(capture.cache_key, self.IMAGE_ARTIFACT) if request.image else None
+            html = self._cache.get_artifact(capture.cache_key, self.HTML_ARTIFACT) if request.html else None
+            capture.html = html.decode('utf-8') if html is not None else None
+            if (capture.image is not None or not request.image) and (capture.html is not None or not request.html):
+                return
+        if self._extractor is not None:
+            result = self._extractor.submit(capture.path, image=request.image, html=request.html).result()
+            capture.image, capture.html = result.image, result.html
+        else:
+            with HarvesterArchive(capture.path) as archive:
+                if request.image:
+                    capture.image = archive.image
+                if request.html:
+                    capture.html = archive.html
+        if capture.cache_key is not None:
+            if capture.image is not None:
+                self._cache.put_artifact(capture.cache_key, self.IMAGE_ARTIFACT, capture.image)
+            if capture.html is not None:
+                self._cache.put_artifact(capture.cache_key, self.HTML_ARTIFACT, capture.html.encode('utf-8'))
+        self._remove(capture)
+
+    def _remove(self, capture: _Capture) -> None:
+        if capture.temporary and capture.path is not None:
+            if os.path.exists(capture.path):
+                os.remove(capture.path)
+            capture.path = None
+
+    def _cleanup(self, capture: _Capture) -> None:
+        for cleanup in (
+            lambda: self._remove(capture),
+            lambda: capture.file_id and self._client.delete_file(capture.file_id),
+            lambda: capture.task_id and self._client.delete_task(capture.task_id),
+        ):
+            try:
+                cleanup()
+            except Exception as e:
+                capture.cleanup_error = capture.cleanup_error or e
+
+    def _work(self, stage: _Stage, remaining: list, lock: Lock, in_queue: Queue, out_queue: Queue,
+              next_workers: int, cancelled: Event) -> None:
+        while True:
+            capture = in_queue.get()
+            if capture is _DONE:
+                # The last worker of a stage to finish tells every worker of the next stage to finish.
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    for _ in range(next_workers):
+                        out_queue.put(_DONE)
+                return
+            if capture.error is None and cancelled.is_set() and not stage.always:
+                capture.error = CancelledError('Capture pipeline was closed')
+            if capture.error is None or stage.always:
+                try:
+                    stage.func(capture)
+                except Exception as e:
+                    capture.error = e
+            out_queue.put(capture)
+
+    def _feed(self, requests: Iterable[CaptureRequest], queue: Queue, workers: int, cancelled: Event,
+              errors: list) -> None:
+        try:
+            for request in requests:
+                if cancelled.is_set():
+                    break
+                queue.put(_Capture(request))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            for _ in range(workers):
+                queue.put(_DONE)
+
+    def run(self, requests: Iterable[CaptureRequest]) -> Iterator[CaptureResult]:
+        """
+        Capture every request and yield a CaptureResult for each as soon as
+        it has been cleaned up, in completion order. Requests are consumed
+        lazily, as capacity frees up. Closing the generator early stops
+        submission, skips the remaining work for in-flight captures and
+        blocks until they have been cleaned up.
+        """
+        cancelled = Event()
+        errors = []
+        queues = [Queue(maxsize=self._queue_size) for _ in range(len(self._stages) + 1)]
+        threads = [Thread(target=self._feed, args=(requests, queues[0], self._stages[0].workers, cancelled, errors),
+                          name='harvester-pipeline-feed', daemon=True)]
+        for i, stage in enumerate(self._stages):
+            next_workers = self._stages[i + 1].workers if i + 1 < len(self._stages) else 1
+            remaining, lock = [stage.workers], Lock()
+            for n in range(stage.workers):
+                threads.append(Thread(
+                    target=self._work, args=(stage, remaining, lock, queues[i], queues[i + 1], next_workers, cancelled),
+                    name=f'harvester-pipeline-{stage.name}-{n}', daemon=True
+                ))
+        for thread in threads:
+            thread.start()
+
+        results = queues[-1]
+        finished = False
+        try:
+            while True:
+                capture = results.get()
+                if capture is _DONE:
+                    finished = True
+                    break
+                yield capture.result()
+        finally:
+            cancelled.set()
+            while not finished:
+                finished = results.get() is _DONE
+            for thread in threads:
+                thread.join()
+        if errors:
+            raise errors[0]
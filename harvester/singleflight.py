@@ -0,0 +1,158 @@
+import asyncio
+import hashlib
+import json
+import os
+from concurrent.futures import Future
+from contextlib import contextmanager
+from threading import Lock
+from typing import Awaitable, Callable, Dict, Hashable, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+
+def _lock_path(lock_dir: str, key: Hashable) -> str:
+    name = hashlib.sha256(json.dumps(key, default=str).encode('utf-8')).hexdigest()
+    return os.path.join(lock_dir, f'{name}.lock')
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """
+    Hold an exclusive advisory lock on path, blocking until it is free. The
+    lock is released if the process dies, so a crashed holder never blocks
+    the others for good. The file is removed on release so a directory of
+    locks only holds the ones in use. A no-op where fcntl is unavailable.
+    """
+    while True:
+        f = open(path, 'a')
+        if fcntl is None:
+            break
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            # The previous holder may have removed the file while we waited,
+            # in which case we hold a lock nobody else will see: start over.
+            try:
+                current = os.path.samestat(os.fstat(f.fileno()), os.stat(path))
+            except FileNotFoundError:
+                current = False
+        except BaseException:
+            f.close()
+            raise
+        if current:
+            break
+        f.close()
+    try:
+        yield
+    finally:
+        if fcntl is not None:
+            os.unlink(path)
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        f.close()
+
+
+def _release_acquired(lock, acquire: asyncio.Future) -> None:
+    if not acquire.cancelled() and acquire.exception() is None:
+        lock.__exit__(None, None, None)
+
+
+class SingleFlight(object):
+    """
+    Collapses concurrent calls for the same key into one: the first caller
+    runs the function and every caller that arrives while it is running
+    gets the same result, or the same exception, instead of running it
+    again. Once the call finishes the key is forgotten, so results are never
+    cached.
+
+    With a lock_dir, the call also holds a lock file for the key, so only one
+    process runs it at a time. Processes do not share results, so the
+    function should check a shared store (such as a CaptureCache) first.
+    """
+
+    def __init__(self, lock_dir: Optional[str] = None) -> None:
+        self._lock_dir = lock_dir
+        self._lock = Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        if lock_dir is not None:
+            os.makedirs(lock_dir, exist_ok=True)
+
+    def do(self, key: Hashable, func: Callable[[], object]):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            if self._lock_dir is None:
+                result = func()
+            else:
+                with file_lock(_lock_path(self._lock_dir, key)):
+                    result = func()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def in_flight(self) -> int:
+        """
+        Number of calls currently running.
+        """
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight(object):
+    """
+    asyncio counterpart of SingleFlight. The shared call runs as its own
+    task, so cancelling one of the callers does not cancel it for the
+    others. The lock file, if any, is acquired on a worker thread so the
+    event loop is never blocked waiting for another process.
+    """
+
+    def __init__(self, lock_dir: Optional[str] = None) -> None:
+        self._lock_dir = lock_dir
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        if lock_dir is not None:
+            os.makedirs(lock_dir, exist_ok=True)
+
+    async def _run(self, key: Hashable, func: Callable[[], Awaitable]):
+        try:
+            if self._lock_dir is None:
+                return await func()
+            lock = file_lock(_lock_path(self._lock_dir, key))
+            # The thread cannot be interrupted, so if we are cancelled while
+            # it waits, release the lock as soon as it does get it.
+            acquire = asyncio.ensure_future(asyncio.to_thread(lock.__enter__))
+            try:
+                await asyncio.shield(acquire)
+            except asyncio.CancelledError:
+                acquire.add_done_callback(lambda _: _release_acquired(lock, acquire))
+                raise
+            try:
+                return await func()
+            finally:
+                lock.__exit__(None, None, None)
+        finally:
+            del self._calls[key]
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable]):
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.ensure_future(self._run(key, func))
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        """
+        Number of calls currently running.
+        """
+        return len(self._calls)
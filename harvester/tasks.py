@@ -0,0 +1,213 @@
+import codecs
+import json
+from datetime import datetime, timezone
+from typing import List, NamedTuple, Optional, Union
+
+
+class HarvesterTask(NamedTuple):
+    """
+    Compact, immutable view of a task record returned by find_harvest_task.
+    Field names match the keys of the raw record.
+    """
+    task_id: str
+    status: Optional[str] = None
+    result_file_id: Optional[str] = None
+    created: Optional[Union[float, str]] = None
+
+    @classmethod
+    def from_dict(cls, task: dict) -> 'HarvesterTask':
+        return cls._make(task.get(field) for field in cls._fields)
+
+    @property
+    def created_at(self) -> Optional[float]:
+        """
+        The creation time as a UNIX timestamp, or None if the record has no
+        (parsable) creation time.
+        """
+        return parse_timestamp(self.created)
+
+
+def parse_timestamp(value) -> Optional[float]:
+    """
+    Convert a record timestamp, given either as seconds since the epoch or as
+    an ISO 8601 string (naive times are taken to be UTC), to seconds since
+    the epoch.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+# Parser states, in the order they are normally visited.
+_OPEN_LIST, _AUTH, _AUTH_SEP, _OPEN_OBJECT, _KEY, _COLON, _VALUE, _OBJECT_SEP, _ITEM_FIRST, _ITEM, _ITEM_SEP, \
+    _CLOSE_LIST, _DONE = range(13)
+_WHITESPACE = ' \t\n\r'
+_MORE = object()
+
+
+class TaskStreamParser(object):
+    """
+    Incremental parser for find_harvest_task API responses. The response body
+    is fed in chunks and each record of the result list is returned as soon
+    as it has been fully received, so the complete list is never held in
+    memory. Expects the usual [<setauth result>, {"result": [...]}] layout.
+    """
+    MALFORMED_ERROR = 'Malformed Harvester response when fetching all tasks'
+    KEY_RESULT = 'result'
+
+    def __init__(self) -> None:
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+        self._state = _OPEN_LIST
+        self._key = None
+        self._found_result = False
+
+    def feed(self, data: bytes) -> List[dict]:
+        """
+        Feed the next chunk of the response body. Returns the task records
+        completed by this chunk.
+        """
+        self._buf = self._buf[self._pos:] + self._decoder.decode(data)
+        self._pos = 0
+        return self._drain(final=False)
+
+    def close(self) -> List[dict]:
+        """
+        Signal the end of the response body. Returns any remaining task
+        records and raises if the response was incomplete or malformed.
+        """
+        self._buf = self._buf[self._pos:] + self._decoder.decode(b'', final=True)
+        self._pos = 0
+        items = self._drain(final=True)
+        if self._state != _DONE:
+            raise Exception(self.MALFORMED_ERROR)
+        return items
+
+    def _char(self) -> Optional[str]:
+        """
+        Skip whitespace and return the next character without consuming it,
+        or None if the buffer is exhausted.
+        """
+        buf, pos = self._buf, self._pos
+        while pos < len(buf) and buf[pos] in _WHITESPACE:
+            pos += 1
+        self._pos = pos
+        return buf[pos] if pos < len(buf) else None
+
+    def _value(self, final: bool):
+        """
+        Decode the next complete JSON value, or return _MORE if the buffer
+        does not hold all of it yet.
+        """
+        if self._char() is None:
+            if final:
+                raise Exception(self.MALFORMED_ERROR)
+            return _MORE
+        try:
+            value, end = self._json.raw_decode(self._buf, self._pos)
+        except json.JSONDecodeError:
+            if final:
+                raise Exception(self.MALFORMED_ERROR)
+            return _MORE
+        # A number at the very end of the buffer may continue in the next chunk.
+        if end == len(self._buf) and not final:
+            return _MORE
+        self._pos = end
+        return value
+
+    def _expect(self, expected: str) -> Optional[str]:
+        c = self._char()
+        if c is None:
+            return None
+        if c not in expected:
+            raise Exception(self.MALFORMED_ERROR)
+        self._pos += 1
+        return c
+
+    def _drain(self, final: bool) -> List[dict]:
+        items = []
+        while self._state != _DONE:
+            state = self._state
+            if state in (_AUTH, _KEY, _VALUE, _ITEM):
+                if state == _KEY and self._char() == '}':
+                    self._pos += 1
+                    self._state = _CLOSE_LIST
+                    continue
+                if state == _VALUE and self._key == self.KEY_RESULT and self._char() == '[':
+                    self._pos += 1
+                    self._found_result = True
+                    self._state = _ITEM_FIRST
+                    continue
+                value = self._value(final)
+                if value is _MORE:
+                    break
+                if state == _AUTH:
+                    self._state = _AUTH_SEP
+                elif state == _KEY:
+                    if not isinstance(value, str):
+                        raise Exception(self.MALFORMED_ERROR)
+                    self._key = value
+                    self._state = _COLON
+                elif state == _VALUE:
+                    if self._key == self.KEY_RESULT:
+                        # The result was present but was not a list.
+                        raise Exception(self.MALFORMED_ERROR)
+                    self._state = _OBJECT_SEP
+                else:
+                    items.append(value)
+                    self._state = _ITEM_SEP
+                continue
+
+            if state == _ITEM_FIRST:
+                if self._char() == ']':
+                    self._pos += 1
+                    self._state = _OBJECT_SEP
+                    continue
+                if self._char() is None:
+                    break
+                self._state = _ITEM
+                continue
+
+            c = self._expect({
+                _OPEN_LIST: '[',
+                _AUTH_SEP: ',',
+                _OPEN_OBJECT: '{',
+                _COLON: ':',
+                _OBJECT_SEP: ',}',
+                _ITEM_SEP: ',]',
+                _CLOSE_LIST: ']',
+            }[state])
+            if c is None:
+                break
+            if state == _OPEN_LIST:
+                self._state = _AUTH
+            elif state == _AUTH_SEP:
+                self._state = _OPEN_OBJECT
+            elif state == _OPEN_OBJECT or state == _OBJECT_SEP and c == ',':
+                self._state = _KEY
+            elif state == _COLON:
+                self._state = _VALUE
+            elif state == _OBJECT_SEP:
+                self._state = _CLOSE_LIST
+            elif state == _ITEM_SEP:
+                self._state = _ITEM if c == ',' else _OBJECT_SEP
+            else:
+                self._state = _DONE
+
+        if self._state == _DONE and not self._found_result:
+            raise Exception(self.MALFORMED_ERROR)
+        return items
@@ -0,0 +1,251 @@
+import asyncio
+import time
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+from threading import Condition, Lock
+from typing import AsyncIterator, Dict, Iterator, Optional, Tuple
+
+
+class TokenBucket(object):
+    """
+    Thread safe token bucket allowing rate acquisitions per second on
+    average and bursts of up to burst. Callers reserve their tokens up front
+    and then sleep until they are due, so waiters are served in order and
+    the bucket itself never blocks.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None) -> None:
+        if rate <= 0:
+            raise ValueError('rate must be positive')
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = Lock()
+
+    def reserve(self, tokens: float = 1) -> float:
+        """
+        Take tokens from the bucket, going into debt if there are not enough,
+        and return the number of seconds to wait before using them.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            return max(0.0, -self._tokens / self.rate)
+
+    def acquire(self, tokens: float = 1) -> None:
+        delay = self.reserve(tokens)
+        if delay:
+            time.sleep(delay)
+
+    async def acquire_async(self, tokens: float = 1) -> None:
+        delay = self.reserve(tokens)
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class AdaptiveConcurrency(object):
+    """
+    AIMD (additive increase, multiplicative decrease) limit on the number of
+    calls in flight, shared by threads and event loops alike.
+
+    Every successful call raises the limit by increase / limit, i.e. by about
+    `increase` per round of calls. A failed call, or one that took more than
+    latency_factor times the recent average latency of its kind of call,
+    multiplies the limit by decrease. Calls released without a latency are
+    not judged on it. Calls that were already in flight when the limit was
+    cut do not cut it again, so one burst of errors only backs off once.
+    """
+    DEFAULT_INITIAL = 8
+    DEFAULT_MIN_LIMIT = 1
+    DEFAULT_MAX_LIMIT = 64
+    DEFAULT_INCREASE = 1.0
+    DEFAULT_DECREASE = 0.5
+    DEFAULT_LATENCY_FACTOR = 3.0
+    # Weight of the newest sample in the moving latency average.
+    LATENCY_SMOOTHING = 0.1
+
+    def __init__(self, initial: float = DEFAULT_INITIAL, min_limit: float = DEFAULT_MIN_LIMIT,
+                 max_limit: float = DEFAULT_MAX_LIMIT, increase: float = DEFAULT_INCREASE,
+                 decrease: float = DEFAULT_DECREASE, latency_factor: Optional[float] = DEFAULT_LATENCY_FACTOR) -> None:
+        if not 1 <= min_limit <= initial <= max_limit:
+            raise ValueError('Expected 1 <= min_limit <= initial <= max_limit')
+        if not 0 < decrease < 1:
+            raise ValueError('decrease must be between 0 and 1')
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.in_flight = 0
+        self._latency: Dict[str, float] = {}
+        # Bumped on every decrease, see release.
+        self._generation = 0
+        self._cond = Condition()
+        self._async_waiters = []
+
+    def _try_acquire(self) -> Optional[int]:
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return self._generation
+        return None
+
+    def acquire(self) -> int:
+        """
+        Block until a call may start. Returns a token to pass to release.
+        """
+        with self._cond:
+            while True:
+                generation = self._try_acquire()
+                if generation is not None:
+                    return generation
+                self._cond.wait()
+
+    async def acquire_async(self) -> int:
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                generation = self._try_acquire()
+                if generation is not None:
+                    return generation
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            await waiter
+
+    def release(self, generation: int, kind: str, success: bool, latency: Optional[float]) -> None:
+        """
+        Record the outcome of a call started with acquire and let waiting
+        calls through if the limit allows. Pass latency=None for calls whose
+        duration says nothing about load, such as transfers of varying size.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            average = self._latency.get(kind)
+            slow = (self.latency_factor is not None and average is not None and latency is not None
+                    and latency > average * self.latency_factor)
+            if success and latency is not None:
+                self._latency[kind] = latency if average is None else \
+                    average + self.LATENCY_SMOOTHING * (latency - average)
+            if not success or slow:
+                if generation == self._generation:
+                    self.limit = max(self.min_limit, self.limit * self.decrease)
+                    self._generation += 1
+            else:
+                self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+            self._cond.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(_wake, waiter)
+
+
+def _wake(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class _Call(object):
+    """
+    Handle for a throttled call. Set failed to report an overload signal,
+    such as a 429 response, that did not raise.
+    """
+    __slots__ = ('failed',)
+
+    def __init__(self) -> None:
+        self.failed = False
+
+
+class Throttle(object):
+    """
+    Client side throttling of Harvester calls: a TokenBucket per kind of
+    command (create, find, delete and getfile) and an optional
+    AdaptiveConcurrency limit over all of them. Pass the same Throttle to
+    every client in a process to share the budget between them.
+    """
+    CREATE = 'create'
+    FIND = 'find'
+    DELETE = 'delete'
+    GETFILE = 'getfile'
+    # Kinds whose duration grows with the size of the transfer, so their
+    # latency is not reported to the concurrency limit.
+    SIZE_DEPENDENT = frozenset([GETFILE])
+
+    def __init__(self, rates: Optional[Dict[str, Tuple[float, Optional[float]]]] = None,
+                 concurrency: Optional[AdaptiveConcurrency] = None) -> None:
+        """
+        rates maps a kind of command to its (rate per second, burst); kinds
+        without a rate are not rate limited.
+        """
+        self.buckets = {kind: TokenBucket(rate, burst) for kind, (rate, burst) in (rates or {}).items()}
+        self.concurrency = concurrency
+
+    def _reserve(self, kinds: Tuple[str, ...]) -> float:
+        delay = 0.0
+        for kind, count in Counter(kinds).items():
+            bucket = self.buckets.get(kind)
+            if bucket is not None:
+                delay = max(delay, bucket.reserve(count))
+        return delay
+
+    def wait(self, *kinds: str) -> None:
+        """
+        Wait for a token for each kind, without taking a concurrency slot.
+        For streamed calls whose duration depends on the consumer.
+        """
+        delay = self._reserve(kinds)
+        if delay:
+            time.sleep(delay)
+
+    async def wait_async(self, *kinds: str) -> None:
+        delay = self._reserve(kinds)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def _release(self, generation: int, kinds: Tuple[str, ...], call: _Call, started: float) -> None:
+        latency = None if self.SIZE_DEPENDENT.issuperset(kinds) else time.monotonic() - started
+        self.concurrency.release(generation, ','.join(sorted(set(kinds))), not call.failed, latency)
+
+    @contextmanager
+    def limit(self, *kinds: str) -> Iterator[_Call]:
+        """
+        Wait for a token for each of the commands sent in a single request
+        (one kind per command) and for a concurrency slot, then run the body,
+        reporting its outcome and latency to the concurrency limit.
+        """
+        delay = self._reserve(kinds)
+        if delay:
+            time.sleep(delay)
+        call = _Call()
+        if self.concurrency is None:
+            yield call
+            return
+        generation = self.concurrency.acquire()
+        started = time.monotonic()
+        try:
+            yield call
+        except BaseException:
+            call.failed = True
+            raise
+        finally:
+            self._release(generation, kinds, call, started)
+
+    @asynccontextmanager
+    async def limit_async(self, *kinds: str) -> AsyncIterator[_Call]:
+        delay = self._reserve(kinds)
+        if delay:
+            await asyncio.sleep(delay)
+        call = _Call()
+        if self.concurrency is None:
+            yield call
+            return
+        generation = await self.concurrency.acquire_async()
+        started = time.monotonic()
+        try:
+            yield call
+        except BaseException:
+            call.failed = True
+            raise
+        finally:
+            self._release(generation, kinds, call, started)
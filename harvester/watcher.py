@@ -0,0 +1,276 @@
+import asyncio
+import random
+import time
+from concurrent.futures import Future, as_completed
+from threading import Event, Lock, Thread
+from typing import AsyncIterator, Iterable, Iterator, Optional
+
+
+class _TaskWatcherBase(object):
+    """
+    Shared bookkeeping for the task watchers. A single polling loop serves
+    every waiter: each poll streams the finished task list, keeping only the
+    watched tasks, and diffs their statuses against the previous poll. The
+    poll interval backs off (with jitter) while none of them changes and
+    snaps back to min_interval as soon as one does, so unrelated tasks on the
+    account finishing do not keep the interval short. Finished tasks are
+    handed to waiters as dicts of their HarvesterTask fields.
+    """
+    DEFAULT_MIN_INTERVAL = 2.0
+    DEFAULT_MAX_INTERVAL = 60.0
+    DEFAULT_BACKOFF = 1.5
+    DEFAULT_JITTER = 0.1
+
+    def __init__(self, client, min_interval: float = DEFAULT_MIN_INTERVAL, max_interval: float = DEFAULT_MAX_INTERVAL,
+                 backoff: float = DEFAULT_BACKOFF, jitter: float = DEFAULT_JITTER) -> None:
+        if min_interval <= 0 or max_interval < min_interval:
+            raise ValueError('Poll intervals must satisfy 0 < min_interval <= max_interval')
+        self._client = client
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._backoff = backoff
+        self._jitter = jitter
+        self._interval = min_interval
+        # task_id -> status as of the last poll.
+        self._statuses = {}
+        # task_id -> [future, number of waiters].
+        self._pending = {}
+
+    def _next_delay(self, changed: bool) -> float:
+        if changed:
+            self._interval = self._min_interval
+        else:
+            self._interval = min(self._interval * self._backoff, self._max_interval)
+        return self._interval * random.uniform(1 - self._jitter, 1 + self._jitter)
+
+    def _diff(self, tasks: list, task_ids: Iterable[str]) -> bool:
+        """
+        Update the task index from a poll of the watched task_ids. Returns
+        whether any of them appeared, disappeared or changed status since the
+        previous poll.
+        """
+        key_task_id, key_status = self._client.KEY_TASK_ID, self._client.KEY_STATUS
+        statuses = {task.get(key_task_id): task.get(key_status) for task in tasks}
+        previous = {task_id: self._statuses[task_id] for task_id in task_ids if task_id in self._statuses}
+        self._statuses = statuses
+        return statuses != previous
+
+    def _completed(self, tasks: list) -> list:
+        """
+        Pop the pending entries for every finished task with a waiter,
+        returning (future, task) pairs to resolve.
+        """
+        if not self._pending:
+            return []
+        key_task_id = self._client.KEY_TASK_ID
+        completed = []
+        for task in tasks:
+            entry = self._pending.pop(task.get(key_task_id), None)
+            if entry:
+                completed.append((entry[0], task))
+        return completed
+
+    def _release(self, task_id: str) -> None:
+        entry = self._pending.get(task_id)
+        if entry:
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._pending[task_id]
+
+
+class TaskWatcher(_TaskWatcherBase):
+    """
+    Waits for Harvester tasks to finish using one background polling thread
+    shared by every caller. The thread only runs while somebody is waiting.
+    """
+
+    def __init__(self, client, min_interval: float = _TaskWatcherBase.DEFAULT_MIN_INTERVAL,
+                 max_interval: float = _TaskWatcherBase.DEFAULT_MAX_INTERVAL,
+                 backoff: float = _TaskWatcherBase.DEFAULT_BACKOFF,
+                 jitter: float = _TaskWatcherBase.DEFAULT_JITTER) -> None:
+        super().__init__(client, min_interval, max_interval, backoff, jitter)
+        self._lock = Lock()
+        self._wake = Event()
+        self._thread = None
+
+    def _register(self, task_id: str) -> Future:
+        with self._lock:
+            entry = self._pending.get(task_id)
+            if entry is None:
+                entry = self._pending[task_id] = [Future(), 0]
+            entry[1] += 1
+            # New work, so the next poll shouldn't wait out a backed off interval.
+            self._interval = self._min_interval
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name='harvester-task-watcher', daemon=True)
+                self._thread.start()
+            else:
+                self._wake.set()
+            return entry[0]
+
+    def _release(self, task_id: str) -> None:
+        with self._lock:
+            super()._release(task_id)
+
+    def _run(self) -> None:
+        last_poll = None
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._thread = None
+                    return
+            if last_poll is not None:
+                remaining = last_poll + self._min_interval - time.monotonic()
+                if remaining > 0:
+                    time.sleep(remaining)
+            last_poll = time.monotonic()
+            with self._lock:
+                task_ids = list(self._pending)
+                # Cleared with the snapshot, so a task registered after it
+                # always leaves the event set and is polled without delay.
+                self._wake.clear()
+            try:
+                tasks = [task._asdict() for task in self._client.iter_tasks(finished=True, task_ids=task_ids)]
+            except Exception:
+                # Treat a failed poll like an unchanged one so we back off.
+                tasks = None
+            with self._lock:
+                changed = tasks is not None and self._diff(tasks, task_ids)
+                completed = self._completed(tasks) if tasks else []
+                delay = self._next_delay(changed)
+            for future, task in completed:
+                future.set_result(task)
+            self._wake.wait(delay)
+
+    def wait_for(self, task_id: str, timeout: Optional[float] = None) -> dict:
+        """
+        Block until the task is finished and return it. Raises
+        concurrent.futures.TimeoutError if timeout seconds elapse first.
+        """
+        future = self._register(task_id)
+        try:
+            return future.result(timeout)
+        finally:
+            self._release(task_id)
+
+    def watch(self, task_ids: Iterable[str], timeout: Optional[float] = None) -> Iterator[dict]:
+        """
+        Yield each task as it finishes, in completion order. Raises
+        concurrent.futures.TimeoutError if they have not all finished within
+        timeout seconds.
+        """
+        task_ids = list(dict.fromkeys(task_ids))
+        futures = [self._register(task_id) for task_id in task_ids]
+        try:
+            for future in as_completed(futures, timeout):
+                yield future.result()
+        finally:
+            for task_id in task_ids:
+                self._release(task_id)
+
+    def stop(self) -> None:
+        """
+        Cancel every outstanding wait and let the polling thread exit.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._wake.set()
+        for future, _ in pending.values():
+            future.cancel()
+
+
+class AsyncTaskWatcher(_TaskWatcherBase):
+    """
+    asyncio counterpart of TaskWatcher for HarvesterAioClient. One polling
+    task on the event loop serves every waiter.
+    """
+
+    def __init__(self, client, min_interval: float = _TaskWatcherBase.DEFAULT_MIN_INTERVAL,
+                 max_interval: float = _TaskWatcherBase.DEFAULT_MAX_INTERVAL,
+                 backoff: float = _TaskWatcherBase.DEFAULT_BACKOFF,
+                 jitter: float = _TaskWatcherBase.DEFAULT_JITTER) -> None:
+        super().__init__(client, min_interval, max_interval, backoff, jitter)
+        self._wake = None
+        self._runner = None
+
+    def _register(self, task_id: str) -> asyncio.Future:
+        entry = self._pending.get(task_id)
+        if entry is None:
+            entry = self._pending[task_id] = [asyncio.get_running_loop().create_future(), 0]
+        entry[1] += 1
+        self._interval = self._min_interval
+        if self._runner is None or self._runner.done():
+            self._wake = asyncio.Event()
+            self._runner = asyncio.create_task(self._run())
+        else:
+            self._wake.set()
+        return entry[0]
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        last_poll = None
+        while self._pending:
+            if last_poll is not None:
+                remaining = last_poll + self._min_interval - loop.time()
+                if remaining > 0:
+                    await asyncio.sleep(remaining)
+            last_poll = loop.time()
+            task_ids = list(self._pending)
+            try:
+                tasks = [task._asdict() async for task in self._client.iter_tasks(finished=True, task_ids=task_ids)]
+            except Exception:
+                tasks = None
+            changed = tasks is not None and self._diff(tasks, task_ids)
+            for future, task in (self._completed(tasks) if tasks else []):
+                if not future.done():
+                    future.set_result(task)
+            delay = self._next_delay(changed)
+            if not self._pending:
+                break
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def wait_for(self, task_id: str, timeout: Optional[float] = None) -> dict:
+        """
+        Wait until the task is finished and return it. Raises
+        asyncio.TimeoutError if timeout seconds elapse first.
+        """
+        future = self._register(task_id)
+        try:
+            # Shield the shared future so one waiter timing out doesn't cancel it for the others.
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        finally:
+            self._release(task_id)
+
+    async def watch(self, task_ids: Iterable[str], timeout: Optional[float] = None) -> AsyncIterator[dict]:
+        """
+        Yield each task as it finishes, in completion order. Raises
+        asyncio.TimeoutError if they have not all finished within timeout
+        seconds.
+        """
+        task_ids = list(dict.fromkeys(task_ids))
+        futures = [asyncio.shield(self._register(task_id)) for task_id in task_ids]
+        try:
+            for next_done in asyncio.as_completed(futures, timeout=timeout):
+                yield await next_done
+        finally:
+            for task_id in task_ids:
+                self._release(task_id)
+
+    async def stop(self) -> None:
+        """
+        Cancel every outstanding wait and stop the polling task.
+        """
+        pending, self._pending = self._pending, {}
+        for future, _ in pending.values():
+            future.cancel()
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
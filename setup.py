@@ -18,8 +18,11 @@ setup(
     description='Python library to dispatch/retrieve/status Harvester downloads.',
     long_description=long_description,
     url='https://github.com/gdcorp-infosec/dcu-harvester-library.git',
-    packages=find_packages(exclude=['tests']),
+    packages=find_packages(exclude=['tests', 'benchmarks', 'benchmarks.*']),
     install_requires=install_reqs,
+    extras_require={
+        'aio': ['aiohttp==3.14.5']
+    },
     tests_require=testing_reqs,
     test_suite='nose.collector',
     classifiers=[
@@ -0,0 +1,187 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from harvester import (AdaptiveConcurrency, CountryCode, HarvesterAioClient,
+                       HarvesterTask, HistogramInstrumentation, Throttle)
+from harvester.metrics import (ERRORS, GETFILE, REQUEST_BYTES, RESPONSE_BYTES,
+                               ROUND_TRIP_SECONDS)
+
+
+class TestHarvesterAioClient(IsolatedAsyncioTestCase):
+    GODADDY_URL = 'https://godaddy.com'
+    TEST_AUTH_STR = 'test auth'
+    TEST_FILE_AUTH = 'test file auth'
+    TEST_TASK = 'test task'
+    TEST_FILE_DATA = b'test file' * 1024
+
+    async def asyncSetUp(self):
+        self.requests = []
+        self.responses = []
+        self.getfile_statuses = []
+        app = web.Application()
+        app.router.add_post('/api/', self._api)
+        app.router.add_post('/getfile/', self._getfile)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        self.client = HarvesterAioClient(
+            self.TEST_AUTH_STR, self.TEST_FILE_AUTH, 'test bucket', '/test-path',
+            str(self.server.make_url('')).rstrip('/'), backoff_factor=0
+        )
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.server.close()
+
+    async def _api(self, request):
+        payload = await request.json()
+        self.requests.append(payload)
+        response = self.responses.pop(0)
+        if isinstance(response, int):
+            return web.Response(status=response)
+        if callable(response):
+            response = response(payload)
+        return web.Response(text=json.dumps(response))
+
+    async def _getfile(self, request):
+        self.requests.append(dict(await request.post()))
+        if self.getfile_statuses:
+            return web.Response(status=self.getfile_statuses.pop(0))
+        return web.Response(body=self.TEST_FILE_DATA)
+
+    async def test_create_capture_task_success(self):
+        self.responses.append([{}, {self.client.KEY_RESULT: {self.client.KEY_TASK_ID: self.TEST_TASK}}])
+        task_id = await self.client.create_capture_task(self.GODADDY_URL, CountryCode.US)
+        self.assertEqual(task_id, self.TEST_TASK)
+        self.assertEqual(self.requests[0][0], {
+            self.client.KEY_COMMAND: self.client.SET_AUTH_COMMAND,
+            self.client.KEY_DATA: self.TEST_AUTH_STR
+        })
+        self.assertEqual(self.requests[0][1][self.client.KEY_TASK_PARAMS][self.client.KEY_URLS], [self.GODADDY_URL])
+
+    async def test_create_capture_task_one_response(self):
+        self.responses.append([{}])
+        with self.assertRaises(Exception):
+            await self.client.create_capture_task(self.GODADDY_URL, CountryCode.US)
+
+    async def test_create_capture_tasks(self):
+        def respond(payload):
+            if 'https://c.com' in payload[1][self.client.KEY_TASK_PARAMS][self.client.KEY_URLS]:
+                return [{}, {}]
+            return [{}, {self.client.KEY_RESULT: {self.client.KEY_TASK_ID: 'task1'}}]
+        self.responses = [respond, respond]
+        urls = ['https://a.com', 'https://b.com', 'https://c.com']
+        result = await self.client.create_capture_tasks(urls, CountryCode.DE, urls_per_task=2)
+        self.assertEqual(len(self.requests), 2)
+        self.assertEqual(result.task_ids, {'https://a.com': 'task1', 'https://b.com': 'task1'})
+        self.assertEqual(list(result.errors), ['https://c.com'])
+
+    async def test_get_tasks_success(self):
+        self.responses.append([{}, {self.client.KEY_RESULT: [{'test': '1'}]}])
+        result = await self.client.get_tasks(finished=True)
+        self.assertEqual(result, [{'test': '1'}])
+        self.assertEqual(self.requests[0][1], {
+            self.client.KEY_COMMAND: self.client.FIND_TASK_COMMAND,
+            self.client.KEY_FINISHED: True
+        })
+
+    async def test_iter_tasks(self):
+        self.responses.append([{}, {self.client.KEY_RESULT: [
+            {'task_id': 't1', 'status': 'done'}, {'task_id': 't2', 'status': 'running'}
+        ]}])
+        metrics = HistogramInstrumentation()
+        self.client._metrics = metrics
+        tasks = [task async for task in self.client.iter_tasks(status='running', chunk_size=4)]
+        self.assertEqual(tasks, [HarvesterTask('t2', 'running')])
+        command = self.client.FIND_TASK_COMMAND
+        self.assertEqual(metrics.histogram(ROUND_TRIP_SECONDS, command).count, 1)
+        self.assertEqual(metrics.histogram(REQUEST_BYTES, command).sum, len(json.dumps(self.requests[0])))
+        self.assertGreater(metrics.histogram(RESPONSE_BYTES, command).sum, 0)
+
+        self.responses.append(500)
+        with self.assertRaises(Exception):
+            [task async for task in self.client.iter_tasks()]
+        self.assertEqual(metrics.counter(ERRORS, command), 1)
+
+    async def test_iter_tasks_backs_off_on_overload(self):
+        throttle = Throttle(concurrency=AdaptiveConcurrency(initial=8))
+        self.client._throttle = throttle
+        self.client._max_retries = 0
+        self.responses.append(429)
+        with self.assertRaises(Exception):
+            [task async for task in self.client.iter_tasks()]
+        self.assertEqual(throttle.concurrency.limit, 4)
+        self.assertEqual(throttle.concurrency.in_flight, 0)
+
+    async def test_delete_task_and_file(self):
+        self.responses.append([{}, {self.client.KEY_RESULT: {self.client.KEY_DELETED: True}}])
+        self.responses.append([{}, {self.client.KEY_ERROR: self.client.ALREADY_DELETED_ERROR}])
+        self.assertTrue(await self.client.delete_task(self.TEST_TASK))
+        self.assertEqual(await self.client.delete_file('file1'), 'deleted file file1')
+        self.assertEqual(self.requests[1][0][self.client.KEY_DATA], self.TEST_FILE_AUTH)
+
+    async def test_download_file_retries_server_errors(self):
+        self.getfile_statuses = [503, 429]
+        data = await self.client.download_file('file1')
+        self.assertEqual(data, self.TEST_FILE_DATA)
+        self.assertEqual(len(self.requests), 3)
+        self.assertEqual(self.requests[0], {self.client.KEY_ID: 'file1', self.client.KEY_AUTH: self.TEST_FILE_AUTH})
+
+    async def test_create_task_only_retried_on_429(self):
+        created = [{}, {self.client.KEY_RESULT: {self.client.KEY_TASK_ID: self.TEST_TASK}}]
+        self.responses.extend([429, created])
+        self.assertEqual(await self.client.create_capture_task(self.GODADDY_URL, CountryCode.US), self.TEST_TASK)
+        self.assertEqual(len(self.requests), 2)
+        # The create may have run before the 503, so it is not resent.
+        self.responses.extend([503, created])
+        with self.assertRaises(Exception):
+            await self.client.create_capture_task(self.GODADDY_URL, CountryCode.US)
+        self.assertEqual(len(self.requests), 3)
+        self.responses.pop()
+        self.responses.extend([503, [{}, {self.client.KEY_RESULT: []}]])
+        self.assertEqual(await self.client.get_tasks(), [])
+        self.assertEqual(len(self.requests), 5)
+
+    async def test_download_file_gives_up(self):
+        self.getfile_statuses = [500] * (self.client.DEFAULT_MAX_RETRIES + 1)
+        with self.assertRaises(Exception):
+            await self.client.download_file('file1')
+
+    async def test_save_file_to_disk(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            dst = os.path.join(tmp, 'capture.zip')
+            result = await self.client.save_file_to_disk('file1', dst, chunk_size=1024)
+            with open(dst, 'rb') as f:
+                self.assertEqual(f.read(), self.TEST_FILE_DATA)
+            self.assertEqual(result.size, len(self.TEST_FILE_DATA))
+            self.assertEqual(os.listdir(tmp), ['capture.zip'])
+
+    async def test_instrumentation(self):
+        metrics = HistogramInstrumentation()
+        self.client._metrics = metrics
+        self.responses.append([{}, {self.client.KEY_RESULT: {self.client.KEY_TASK_ID: self.TEST_TASK}}])
+        self.responses.append([{}])
+        await self.client.create_capture_task(self.GODADDY_URL, CountryCode.US)
+        with self.assertRaises(Exception):
+            await self.client.delete_task(self.TEST_TASK)
+        await self.client.download_file('test file')
+
+        command = self.client.CREATE_TASK_COMMAND
+        self.assertEqual(metrics.histogram(ROUND_TRIP_SECONDS, command).count, 1)
+        self.assertEqual(metrics.histogram(REQUEST_BYTES, command).sum, len(json.dumps(self.requests[0])))
+        self.assertEqual(metrics.counter(ERRORS, self.client.DELETE_TASK_COMMAND), 1)
+        self.assertEqual(metrics.histogram(RESPONSE_BYTES, GETFILE).sum, len(self.TEST_FILE_DATA))
+
+
+class TestOptionalAiohttp(TestCase):
+    def test_sync_client_without_aiohttp(self):
+        # A None entry in sys.modules makes importing aiohttp raise ImportError.
+        code = ("import sys; sys.modules['aiohttp'] = None; import harvester; harvester.HarvesterAsyncClient\n"
+                "try:\n    harvester.HarvesterAioClient\nexcept ImportError:\n    sys.exit(0)\nsys.exit(1)")
+        subprocess.run([sys.executable, '-c', code], check=True)
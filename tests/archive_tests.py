@@ -0,0 +1,117 @@
+import mmap
+import os
+import tempfile
+import zipfile
+from io import BytesIO
+from unittest import TestCase
+from unittest.mock import patch
+
+from harvester import HarvesterArchive, HarvesterAsyncClient
+from harvester.archive import extract_member, open_archive
+from harvester.mhtml import find_html_content
+
+
+class TestArchive(TestCase):
+    IMAGE_TEST_DATA = os.urandom(1024 * 64)
+    MHTML_TEST_DATA = b'mhtml data' * 1024
+
+    def setUp(self):
+        self.client = HarvesterAsyncClient('test auth', 'test file auth', 'test bucket', '/test-path', 'http://test')
+        self.tmp = tempfile.TemporaryDirectory()
+        self.zip_path = os.path.join(self.tmp.name, 'capture.zip')
+        with zipfile.ZipFile(self.zip_path, mode='w', compression=zipfile.ZIP_DEFLATED) as z:
+            z.writestr(self.client.PNG_ARCHIVE_PATH, self.IMAGE_TEST_DATA)
+            z.writestr(self.client.MHTML_ARCHIVE_PATH, self.MHTML_TEST_DATA)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_extract_image_to_path(self):
+        dst = os.path.join(self.tmp.name, 'output.png')
+        written = self.client.extract_image(self.zip_path, dst, buffer_size=1024)
+        self.assertEqual(written, len(self.IMAGE_TEST_DATA))
+        with open(dst, 'rb') as f:
+            self.assertEqual(f.read(), self.IMAGE_TEST_DATA)
+
+    def test_extract_mhtml_to_file_object(self):
+        dst = BytesIO()
+        with open(self.zip_path, 'rb') as f:
+            written = self.client.extract_mhtml(f, dst)
+        self.assertEqual(written, len(self.MHTML_TEST_DATA))
+        self.assertEqual(dst.getvalue(), self.MHTML_TEST_DATA)
+
+    def test_extract_from_mmap(self):
+        dst = BytesIO()
+        with open(self.zip_path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                extract_member(mapped, self.client.PNG_ARCHIVE_PATH, dst)
+                self.assertEqual(self.client.image_from_zip(mapped), self.IMAGE_TEST_DATA)
+        self.assertEqual(dst.getvalue(), self.IMAGE_TEST_DATA)
+
+    def test_extract_missing_member(self):
+        self.assertIsNone(extract_member(self.zip_path, 'contents/missing.txt', BytesIO()))
+
+    def test_open_archive_bytes(self):
+        with open(self.zip_path, 'rb') as f:
+            data = f.read()
+        with open_archive(data) as zip:
+            self.assertEqual(zip.read(self.client.MHTML_ARCHIVE_PATH), self.MHTML_TEST_DATA)
+        self.assertEqual(self.client.image_from_zip(self.zip_path), self.IMAGE_TEST_DATA)
+
+
+class TestHarvesterArchive(TestCase):
+    IMAGE_TEST_STR = b'test image'
+    CSS = b'body { color: red; }'
+
+    def setUp(self):
+        with open('tests/output.mhtml', 'rb') as f:
+            self.mhtml = f.read()
+        # The fixture ends on a part delimiter, so add a stylesheet part and close the multipart body.
+        boundary = b'------MultipartBoundary--roN2ZDf70xMNnd5PtuVNgI3zwpq3sqKsT35tuTvVKb----'
+        self.mhtml += (
+            b'Content-Type: text/css\r\nContent-Location: https://test.com/style.css\r\n\r\n' + self.CSS +
+            b'\r\n' + boundary + b'--\r\n'
+        )
+        self.bytes_zip = BytesIO()
+        with zipfile.ZipFile(self.bytes_zip, mode='w', compression=zipfile.ZIP_DEFLATED) as z:
+            z.writestr(HarvesterArchive.PNG_ARCHIVE_PATH, self.IMAGE_TEST_STR)
+            z.writestr(HarvesterArchive.MHTML_ARCHIVE_PATH, self.mhtml)
+            z.writestr('contents/other.txt', b'other')
+
+    def test_properties(self):
+        with HarvesterArchive(self.bytes_zip.getvalue()) as archive:
+            self.assertEqual(set(archive.members), {
+                HarvesterArchive.PNG_ARCHIVE_PATH, HarvesterArchive.MHTML_ARCHIVE_PATH, 'contents/other.txt'
+            })
+            self.assertEqual(archive.image, self.IMAGE_TEST_STR)
+            self.assertEqual(archive.mhtml, self.mhtml)
+            self.assertEqual(archive.html, 'test')
+            self.assertEqual(archive.resources, {'https://test.com/style.css': self.CSS})
+            self.assertIsNone(archive.read('contents/missing.txt'))
+
+    def test_opens_and_parses_once(self):
+        with patch('harvester.archive.open_archive', wraps=open_archive) as mock_open:
+            with patch('harvester.archive.find_html_content', wraps=find_html_content) as mock_find:
+                with HarvesterArchive(self.bytes_zip.getvalue()) as archive:
+                    for _ in range(3):
+                        self.assertEqual(archive.html, 'test')
+                        self.assertEqual(len(archive.resources), 1)
+        self.assertEqual(mock_open.call_count, 1)
+        self.assertEqual(mock_find.call_count, 1)
+
+    def test_missing_members(self):
+        empty = BytesIO()
+        with zipfile.ZipFile(empty, mode='w') as z:
+            z.writestr('contents/other.txt', b'other')
+        with HarvesterArchive(empty) as archive:
+            self.assertIsNone(archive.image)
+            self.assertIsNone(archive.mhtml)
+            self.assertIsNone(archive.html)
+            self.assertEqual(archive.resources, {})
+
+    def test_extract(self):
+        dst = BytesIO()
+        with HarvesterArchive(self.bytes_zip) as archive:
+            self.assertEqual(archive.extract(HarvesterArchive.PNG_ARCHIVE_PATH, dst), len(self.IMAGE_TEST_STR))
+            self.assertIsNone(archive.extract('contents/missing.txt', dst))
+        self.assertEqual(dst.getvalue(), self.IMAGE_TEST_STR)
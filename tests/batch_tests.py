@@ -0,0 +1,97 @@
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from harvester import CountryCode, HarvesterAsyncClient
+
+
+class TestHarvesterBatch(TestCase):
+    BASE_URL = 'http://test'
+    GODADDY_URL = 'https://godaddy.com'
+    TEST_AUTH_STR = 'test auth'
+    TEST_FILE_AUTH = 'test file auth'
+    KEY_JSON = 'json'
+
+    def setUp(self):
+        self.client = HarvesterAsyncClient(
+            self.TEST_AUTH_STR, self.TEST_FILE_AUTH, 'test bucket', '/test-path', self.BASE_URL
+        )
+
+    @patch('requests.Session.post')
+    def test_batch_single_round_trip_per_token(self, mock_post):
+        mock_post.return_value.json = Mock(side_effect=[
+            [{}, {self.client.KEY_RESULT: {self.client.KEY_TASK_ID: 'task1'}},
+             {self.client.KEY_RESULT: {self.client.KEY_DELETED: True}},
+             {self.client.KEY_RESULT: {self.client.KEY_DELETED: False}}],
+            [{}, {self.client.KEY_RESULT: 'success'}, {self.client.KEY_ERROR: self.client.ALREADY_DELETED_ERROR}]
+        ])
+        with self.client.batch() as batch:
+            create = batch.create_capture_task(self.GODADDY_URL, CountryCode.US)
+            delete1 = batch.delete_task('task2')
+            file1 = batch.delete_file('file1')
+            delete2 = batch.delete_task('task3')
+            file2 = batch.delete_file('file2')
+
+        self.assertEqual(mock_post.call_count, 2)
+        api_payload = mock_post.call_args_list[0][1][self.KEY_JSON]
+        self.assertEqual(len(api_payload), 4)
+        self.assertEqual(api_payload[0][self.client.KEY_DATA], self.TEST_AUTH_STR)
+        self.assertEqual(api_payload[2], {
+            self.client.KEY_COMMAND: self.client.DELETE_TASK_COMMAND,
+            self.client.KEY_TASK_ID: 'task2'
+        })
+        file_payload = mock_post.call_args_list[1][1][self.KEY_JSON]
+        self.assertEqual(len(file_payload), 3)
+        self.assertEqual(file_payload[0][self.client.KEY_DATA], self.TEST_FILE_AUTH)
+
+        self.assertEqual(create.result(), 'task1')
+        self.assertTrue(delete1.result())
+        self.assertFalse(delete2.result())
+        self.assertEqual(file1.result(), 'success')
+        self.assertEqual(file2.result(), 'deleted file file2')
+
+    @patch('requests.Session.post')
+    def test_batch_per_call_exception(self, mock_post):
+        mock_post.return_value.json = Mock(side_effect=[
+            [{}, {self.client.KEY_RESULT: {self.client.KEY_DELETED: True}}, {self.client.KEY_RESULT: {}}]
+        ])
+        batch = self.client.batch()
+        ok = batch.delete_task('task1')
+        bad = batch.delete_task('task2')
+        futures = batch.execute()
+        self.assertEqual(futures, [ok, bad])
+        self.assertTrue(ok.result())
+        with self.assertRaises(Exception):
+            bad.result()
+
+    @patch('requests.Session.post')
+    def test_batch_wrong_response_count_fails_all(self, mock_post):
+        mock_post.return_value.json = Mock(side_effect=[
+            [{}, {self.client.KEY_RESULT: {self.client.KEY_DELETED: True}}]
+        ])
+        batch = self.client.batch()
+        futures = [batch.delete_task('task1'), batch.delete_task('task2')]
+        batch.execute()
+        for future in futures:
+            with self.assertRaises(Exception):
+                future.result()
+
+    @patch('requests.Session.post')
+    def test_batch_respects_max_batch_size(self, mock_post):
+        mock_post.return_value.json = Mock(side_effect=[
+            [{}] + [{self.client.KEY_RESULT: {self.client.KEY_DELETED: True}}] * 2,
+            [{}, {self.client.KEY_RESULT: {self.client.KEY_DELETED: True}}]
+        ])
+        batch = self.client.batch(max_batch_size=2)
+        futures = [batch.delete_task(f'task{i}') for i in range(3)]
+        batch.execute()
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertTrue(all(future.result() for future in futures))
+
+    @patch('requests.Session.post')
+    def test_batch_cancelled_on_error(self, mock_post):
+        with self.assertRaises(ValueError):
+            with self.client.batch() as batch:
+                future = batch.delete_task('task1')
+                raise ValueError()
+        self.assertEqual(mock_post.call_count, 0)
+        self.assertTrue(future.cancelled())
@@ -0,0 +1,108 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from benchmarks import run
+from benchmarks.fake_server import FakeHarvester, build_mhtml
+from harvester import CountryCode, HarvesterAsyncClient
+from harvester.mhtml import find_html_content, iter_parts
+
+
+class TestFakeHarvester(TestCase):
+    def setUp(self):
+        self.fake = FakeHarvester(image_size=1024, mhtml_size=4096).start()
+        self.client = HarvesterAsyncClient('test auth', 'test file auth', 'test bucket', '/test-path', self.fake.url,
+                                           backoff_factor=0)
+
+    def tearDown(self):
+        self.client.close()
+        self.fake.stop()
+
+    def test_capture_round_trip(self):
+        archive = self.client.capture('https://godaddy.com', CountryCode.US)
+        self.assertEqual(len(self.client.image_from_zip(archive)), 1024)
+        self.assertIn('Lorem ipsum', self.client.html_from_zip(archive))
+        self.assertEqual(self.fake.tasks, {})
+        self.assertEqual(self.fake.files, set())
+
+    def test_task_lifecycle(self):
+        self.fake.task_duration = 60
+        task_id = self.client.create_capture_task('https://godaddy.com', CountryCode.US)
+        self.assertEqual(self.client.get_tasks(finished=True), [])
+        self.assertEqual([task.status for task in self.client.iter_tasks()], [FakeHarvester.STATUS_RUNNING])
+        self.assertTrue(self.client.delete_task(task_id))
+        self.assertFalse(self.client.delete_task(task_id))
+
+    def test_error_injection(self):
+        self.fake.error_rate = 1.0
+        with self.assertRaises(Exception):
+            self.client.get_tasks()
+        # The transport retried the request before giving up.
+        self.assertEqual(self.fake.requests['/api/'], self.client.DEFAULT_MAX_RETRIES + 1)
+        with self.assertRaises(Exception):
+            self.client.create_capture_task('https://godaddy.com', CountryCode.US)
+        # A create may already have run on a 5xx, so it is not resent.
+        self.assertEqual(self.fake.requests['/api/'], self.client.DEFAULT_MAX_RETRIES + 2)
+
+    def test_ranged_download(self):
+        self.fake.add_tasks(1)
+        file_id = next(iter(self.fake.files))
+        self.assertEqual(self.client.download_file(file_id), self.fake.archive)
+
+
+class TestBenchmarks(TestCase):
+    def test_build_mhtml(self):
+        document = build_mhtml(64 * 1024)
+        self.assertGreaterEqual(len(document), 64 * 1024)
+        self.assertGreater(len(list(iter_parts(document))), 1)
+        self.assertIn(b'Lorem ipsum', find_html_content(document).content)
+
+    def test_run(self):
+        config = dict(run.QUICK_CONFIG, repeat=1, submit_count=5, poll_tasks=[10], download_size=1024 * 64,
+                      archive_sizes=[1024 * 64], mhtml_sizes=[1024 * 64])
+        results = json.loads(json.dumps(run.run(config)))
+        names = {record['name'] for record in results['results']}
+        self.assertTrue({'submit.sequential', 'poll.iter_tasks', 'download.disk', 'extract.html',
+                         'mhtml.parse'} <= names)
+        for record in results['results']:
+            self.assertNotIn('skipped', record)
+            self.assertEqual(record['seconds']['iterations'], 1)
+            self.assertEqual(record['seconds']['failures'], 0)
+        lines = run.compare(results, results)
+        self.assertEqual(len(lines), len(results['results']))
+        self.assertTrue(all(line.endswith('(+0.0%)') for line in lines))
+
+    def test_missing_api_skipped(self):
+        results = []
+        run._run(results, 'poll.iter_tasks', {'tasks': 10},
+                 lambda: run._measure(run._api(object(), 'iter_tasks'), 1))
+        run._run(results, 'mhtml.parse', {'bytes': 10},
+                 lambda: run._measure(run._module_api('harvester.missing', 'html_from_mhtml'), 1))
+        self.assertEqual([record['skipped'] for record in results],
+                         ['object.iter_tasks is not available', 'harvester.missing is not available'])
+        ran = {'results': [run._record('poll.iter_tasks', {'tasks': 10}, run._measure(lambda: None, 1))]}
+        self.assertEqual(run.compare(ran, {'results': results}), [])
+        self.assertEqual(run.compare({'results': results}, ran), [])
+
+    def test_failures_counted(self):
+        def fail():
+            raise Exception('injected error')
+        self.assertEqual(run._measure(fail, 3)['failures'], 3)
+        self.assertEqual(run._measure(lambda: sum(run._failures(fail) for _ in range(4)), 2,
+                                      counts_failures=True)['failures'], 8)
+        self.assertEqual(run._measure(lambda: 1024, 2)['failures'], 0)
+
+    @patch('benchmarks.run.run')
+    def test_cli_config(self, mock_run):
+        mock_run.return_value = {'results': []}
+        with tempfile.TemporaryDirectory() as tmp:
+            run.main(['download', '--quick', '--error-rate', '0.1', '--download-size', '0.5', '--archive-sizes', '1',
+                      '2', '--output', os.path.join(tmp, 'results.json')])
+        config, names = mock_run.call_args[0]
+        self.assertEqual(names, ['download'])
+        self.assertEqual(config['error_rate'], 0.1)
+        self.assertEqual(config['download_size'], run.MB // 2)
+        self.assertEqual(config['archive_sizes'], [run.MB, 2 * run.MB])
+        self.assertEqual(config['repeat'], run.QUICK_CONFIG['repeat'])
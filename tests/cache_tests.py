@@ -0,0 +1,99 @@
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+from harvester import CaptureCache, CountryCode
+
+
+class TestCaptureCache(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = CaptureCache(self.tmp.name, ttl=60, max_size=1000)
+        self.key = self.cache.key('https://test.com', CountryCode.US)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _age(self, key, seconds, access=None):
+        path = self.cache._path(key, CaptureCache.ARCHIVE_SUFFIX)
+        mtime = time.time() - seconds
+        os.utime(path, (access if access is not None else mtime, mtime))
+
+    def test_key(self):
+        self.assertEqual(self.key, self.cache.key('https://test.com', CountryCode.USA))
+        self.assertNotEqual(self.key, self.cache.key('https://test.com', CountryCode.DE))
+        self.assertNotEqual(self.key, self.cache.key('https://test.com', CountryCode.US, html=False))
+        self.assertNotEqual(self.key, self.cache.key('https://test.org', CountryCode.US))
+
+    def test_put_get(self):
+        self.assertIsNone(self.cache.get(self.key))
+        path = self.cache.put(self.key, b'archive')
+        self.assertEqual(self.cache.get(self.key), path)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'archive')
+
+    def test_put_moves_file(self):
+        src = os.path.join(self.tmp.name, 'download.zip')
+        with open(src, 'wb') as f:
+            f.write(b'archive')
+        path = self.cache.put(self.key, src, move=True)
+        self.assertFalse(os.path.exists(src))
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'archive')
+
+    def test_artifacts(self):
+        self.assertIsNone(self.cache.get_artifact(self.key, 'png'))
+        self.cache.put(self.key, b'archive')
+        self.cache.put_artifact(self.key, 'png', b'image')
+        self.assertEqual(self.cache.get_artifact(self.key, 'png'), b'image')
+        with self.assertRaises(ValueError):
+            self.cache.put_artifact(self.key, '../png', b'image')
+        # A new archive invalidates the artifacts of the old one.
+        self.cache.put(self.key, b'new archive')
+        self.assertIsNone(self.cache.get_artifact(self.key, 'png'))
+
+    def test_ttl(self):
+        self.cache.put(self.key, b'archive')
+        self.cache.put_artifact(self.key, 'png', b'image')
+        self._age(self.key, 61)
+        self.assertIsNone(self.cache.get_artifact(self.key, 'png'))
+        self.assertIsNone(self.cache.get(self.key))
+        self.assertEqual(self.cache.size(), 0)
+
+    def test_lru_eviction(self):
+        self.cache.max_size = 1300
+        keys = [self.cache.key(f'https://{i}.com', CountryCode.US) for i in range(3)]
+        for i, key in enumerate(keys):
+            self.cache.put(key, b'x' * 400)
+            self._age(key, 10, access=time.time() - 10 + i)
+        # Reading the oldest entry makes it the most recently used.
+        self.cache.get(keys[0])
+        self.cache.put(self.key, b'x' * 400)
+        self.assertIsNotNone(self.cache.get(keys[0]))
+        self.assertIsNone(self.cache.get(keys[1]))
+        self.assertIsNotNone(self.cache.get(keys[2]))
+        self.assertIsNotNone(self.cache.get(self.key))
+        self.assertEqual(self.cache.size(), 1200)
+
+    def test_concurrent_writers(self):
+        cache = CaptureCache(self.tmp.name, ttl=60, max_size=4000)
+        keys = [cache.key(f'https://{i % 20}.com', CountryCode.US) for i in range(200)]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda key: cache.put(key, key.encode() * 4), keys))
+        self.assertLessEqual(cache.evict() + cache.size(), 20 * 256)
+        self.assertLessEqual(cache.size(), 4000)
+        for key in set(keys):
+            path = cache.get(key)
+            if path is not None:
+                with open(path, 'rb') as f:
+                    self.assertEqual(f.read(), key.encode() * 4)
+        self.assertFalse([name for _, _, names in os.walk(self.tmp.name) for name in names
+                          if name.startswith(CaptureCache.TMP_PREFIX)])
+
+    def test_clear(self):
+        self.cache.put(self.key, b'archive')
+        self.cache.put_artifact(self.key, 'png', b'image')
+        self.cache.clear()
+        self.assertEqual(self.cache.size(), 0)
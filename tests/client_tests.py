@@ -1,9 +1,13 @@
+import tempfile
+import time
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
+from threading import Event
 from unittest import TestCase
 from unittest.mock import MagicMock, Mock, patch
 
-from harvester import CountryCode, HarvesterAsyncClient
+from harvester import CaptureCache, CountryCode, HarvesterAsyncClient
 
 
 class TestHarvesterAsyncClient(TestCase):
@@ -25,7 +29,7 @@ class TestHarvesterAsyncClient(TestCase):
         )
         self.bytes_zip = BytesIO()
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_create_capture_task_success(self, mock_post):
         mock_post.return_value.json = Mock(side_effect=[
             [{}, {self.client.KEY_RESULT: {self.client.KEY_TASK_ID: self.TEST_TASK}}]
@@ -39,7 +43,7 @@ class TestHarvesterAsyncClient(TestCase):
         })
         self.assertEqual(taskId, self.TEST_TASK)
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_create_capture_task_one_response(self, mock_post):
         mock_post.return_value.json = Mock(side_effect=[
             [{}]
@@ -47,7 +51,7 @@ class TestHarvesterAsyncClient(TestCase):
         with self.assertRaises(Exception):
             self.client.create_capture_task(self.GODADDY_URL, CountryCode.US)
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_create_capture_task_missing_field(self, mock_post):
         mock_post.return_value.json = Mock(side_effect=[
             [{}, {self.client.KEY_RESULT: {}}]
@@ -55,7 +59,7 @@ class TestHarvesterAsyncClient(TestCase):
         with self.assertRaises(Exception):
             self.client.create_capture_task(self.GODADDY_URL, CountryCode.US)
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_get_tasks_success(self, mock_post):
         mock_post.return_value.json = Mock(side_effect=[
             [{}, {self.client.KEY_RESULT: self.TEST_DICT}]
@@ -65,7 +69,7 @@ class TestHarvesterAsyncClient(TestCase):
         self.assertEqual(mock_post.call_args[1][self.KEY_URL], f'{self.BASE_URL}/api/')
         self.assertEqual(result, self.TEST_DICT)
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_get_tasks_success_finished_false(self, mock_post):
         mock_post.return_value.json = Mock(side_effect=[
             [{}, {self.client.KEY_RESULT: self.TEST_DICT}]
@@ -79,7 +83,7 @@ class TestHarvesterAsyncClient(TestCase):
         })
         self.assertEqual(result, self.TEST_DICT)
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_get_tasks_success_finished_true(self, mock_post):
         mock_post.return_value.json = Mock(side_effect=[
             [{}, {self.client.KEY_RESULT: self.TEST_DICT}]
@@ -93,7 +97,7 @@ class TestHarvesterAsyncClient(TestCase):
         })
         self.assertEqual(result, self.TEST_DICT)
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_get_tasks_malformed(self, mock_post):
         mock_post.return_value.json = Mock(side_effect=[
             [{}, {}]
@@ -101,7 +105,7 @@ class TestHarvesterAsyncClient(TestCase):
         with self.assertRaises(Exception):
             self.client.get_tasks()
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_delete_task_success(self, mock_post):
         mock_post.return_value.json = Mock(side_effect=[
             [{}, {
@@ -117,7 +121,7 @@ class TestHarvesterAsyncClient(TestCase):
         })
         self.assertTrue(result)
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_delete_task_failed(self, mock_post):
         mock_post.return_value.json = Mock(side_effect=[
             [{}, {self.client.KEY_RESULT: {self.client.KEY_DELETED: False}}]
@@ -131,7 +135,7 @@ class TestHarvesterAsyncClient(TestCase):
         })
         self.assertFalse(result)
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_delete_task_malformed(self, mock_post):
         mock_post.return_value.json = Mock(side_effect=[
             [{}, {self.client.KEY_RESULT: {}}]
@@ -139,7 +143,7 @@ class TestHarvesterAsyncClient(TestCase):
         with self.assertRaises(Exception):
             self.client.delete_task(self.TEST_TASK)
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_delete_file_success(self, mock_post):
         mock_post.return_value.json = Mock(side_effect=[
             [{}, {self.client.KEY_RESULT: 'success'}]
@@ -157,7 +161,7 @@ class TestHarvesterAsyncClient(TestCase):
         })
         self.assertTrue(result)
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_delete_file_does_not_exist(self, mock_post):
         mock_post.return_value.json = Mock(side_effect=[
             [{}, {self.client.KEY_ERROR: self.client.ALREADY_DELETED_ERROR}]
@@ -175,7 +179,7 @@ class TestHarvesterAsyncClient(TestCase):
         })
         self.assertEqual(result, f'deleted file {self.TEST_FILE_STR}')
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_delete_file_malformed(self, mock_post):
         mock_post.return_value.json = Mock(side_effect=[
             [{}, {}]
@@ -183,7 +187,7 @@ class TestHarvesterAsyncClient(TestCase):
         with self.assertRaises(Exception):
             self.client.delete_file(self.TEST_FILE_STR)
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_download_file_success(self, mock_post):
         mock_post.return_value = MagicMock(side_effect=[self.client.KEY_DATA])
         mock_post.return_value.content = self.client.KEY_DATA
@@ -196,6 +200,69 @@ class TestHarvesterAsyncClient(TestCase):
         })
         self.assertEqual(result, self.client.KEY_DATA)
 
+    def test_session_pool_and_retries(self):
+        client = HarvesterAsyncClient(
+            self.TEST_AUTH_STR, self.TEST_FILE_AUTH, 'test bucket', '/test-path', self.BASE_URL,
+            pool_maxsize=32, max_retries=5
+        )
+        adapter = client._session.get_adapter(f'{self.BASE_URL}/api/')
+        self.assertEqual(adapter._pool_maxsize, 32)
+        self.assertEqual(adapter.max_retries.total, 5)
+        self.assertIn(429, adapter.max_retries.status_forcelist)
+        self.assertIn('POST', adapter.max_retries.allowed_methods)
+        self.assertEqual(adapter.max_retries.connect, 5)
+        self.assertEqual(adapter.max_retries.read, 0)
+        create_adapter = client._create_task_session.get_adapter(f'{self.BASE_URL}/api/')
+        self.assertEqual(create_adapter.max_retries.status_forcelist, (429,))
+        self.assertEqual(create_adapter.max_retries.read, 0)
+
+    def test_create_task_uses_create_session(self):
+        response = Mock()
+        response.json.return_value = [{}, {self.client.KEY_RESULT: {self.client.KEY_TASK_ID: self.TEST_TASK}}]
+        with patch.object(self.client._create_task_session, 'post', return_value=response) as create_post, \
+                patch.object(self.client._session, 'post') as post:
+            self.assertEqual(self.client.create_capture_task(self.GODADDY_URL, CountryCode.US), self.TEST_TASK)
+        create_post.assert_called_once()
+        post.assert_not_called()
+
+    @patch('requests.Session.post')
+    def test_timeout_passed_to_session(self, mock_post):
+        mock_post.return_value.json = Mock(side_effect=[
+            [{}, {self.client.KEY_RESULT: self.TEST_DICT}]
+        ])
+        self.client.get_tasks()
+        self.assertEqual(mock_post.call_args[1]['timeout'], self.client.DEFAULT_TIMEOUT)
+
+    @patch('requests.Session.close')
+    def test_context_manager_closes_session(self, mock_close):
+        with HarvesterAsyncClient(
+            self.TEST_AUTH_STR, self.TEST_FILE_AUTH, 'test bucket', '/test-path', self.BASE_URL
+        ) as client:
+            self.assertIsInstance(client, HarvesterAsyncClient)
+        self.assertEqual(mock_close.call_count, 2)
+
+    @patch('requests.Session.post')
+    def test_create_capture_tasks_chunks_urls(self, mock_post):
+        def respond(url, json, timeout):
+            urls = json[1][self.client.KEY_TASK_PARAMS][self.client.KEY_URLS]
+            response = Mock()
+            if 'https://bad.com' in urls:
+                response.json.return_value = [{}, {self.client.KEY_RESULT: {}}]
+            else:
+                response.json.return_value = [{}, {self.client.KEY_RESULT: {self.client.KEY_TASK_ID: urls[0]}}]
+            return response
+        mock_post.side_effect = respond
+        urls = ['https://a.com', 'https://b.com', 'https://c.com', 'https://bad.com', 'https://a.com']
+        result = self.client.create_capture_tasks(urls, CountryCode.US, urls_per_task=2)
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertEqual(result.task_ids, {'https://a.com': 'https://a.com', 'https://b.com': 'https://a.com'})
+        self.assertEqual(set(result.errors), {'https://c.com', 'https://bad.com'})
+
+    def test_create_capture_tasks_empty(self):
+        result = self.client.create_capture_tasks([], CountryCode.US)
+        self.assertEqual(result.task_ids, {})
+        self.assertEqual(result.errors, {})
+
     def test_image_from_zip(self):
         with zipfile.ZipFile(self.bytes_zip, mode='w', compression=zipfile.ZIP_DEFLATED) as z:
             z.writestr(self.client.PNG_ARCHIVE_PATH, self.IMAGE_TEST_STR)
@@ -221,3 +288,70 @@ class TestHarvesterAsyncClient(TestCase):
             z.writestr(self.client.MHTML_ARCHIVE_PATH, data)
         ret_data = self.client.html_from_zip(self.bytes_zip.getvalue())
         self.assertEqual(ret_data, 'test')
+
+    def test_html_from_zip_decodes_quoted_printable(self):
+        with open('tests/output.mhtml', 'r') as f:
+            data = f.read().replace('\ntest\n', '\n<p class=3D"a">caf=C3=A9</p>\n')
+        with zipfile.ZipFile(self.bytes_zip, mode='w', compression=zipfile.ZIP_DEFLATED) as z:
+            z.writestr(self.client.MHTML_ARCHIVE_PATH, data)
+        ret_data = self.client.html_from_zip(self.bytes_zip.getvalue())
+        self.assertEqual(ret_data, '<p class="a">café</p>')
+
+    def _patch_capture(self, release=None):
+        def wait_for(task_id, timeout=None):
+            if release is not None:
+                release.wait()
+            return {self.client.KEY_TASK_ID: task_id, self.client.KEY_STATUS: self.client.TASK_STATUS_DONE,
+                    self.client.KEY_RESULT_FILE_ID: self.TEST_FILE_STR}
+
+        for name, kwargs in (
+            ('create_capture_task', {'return_value': self.TEST_TASK}),
+            ('wait_for', {'side_effect': wait_for}),
+            ('download_file', {'return_value': b'archive'}),
+            ('delete_file', {'return_value': 'deleted'}),
+            ('delete_task', {'return_value': True}),
+        ):
+            patcher = patch.object(self.client, name, **kwargs)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_capture(self):
+        self._patch_capture()
+        self.assertEqual(self.client.capture(self.GODADDY_URL, CountryCode.US), b'archive')
+        self.client.download_file.assert_called_once_with(self.TEST_FILE_STR)
+        self.client.delete_file.assert_called_once_with(self.TEST_FILE_STR)
+        self.client.delete_task.assert_called_once_with(self.TEST_TASK)
+
+    def test_capture_failed_task(self):
+        self._patch_capture()
+        self.client.wait_for.side_effect = None
+        self.client.wait_for.return_value = {self.client.KEY_TASK_ID: self.TEST_TASK, self.client.KEY_STATUS: 'failed'}
+        with self.assertRaises(Exception):
+            self.client.capture(self.GODADDY_URL, CountryCode.US)
+        self.client.download_file.assert_not_called()
+        self.client.delete_task.assert_called_once_with(self.TEST_TASK)
+
+    def test_capture_deduplicates_concurrent_calls(self):
+        release = Event()
+        self._patch_capture(release)
+        with ThreadPoolExecutor(max_workers=9) as executor:
+            futures = [executor.submit(self.client.capture, self.GODADDY_URL, CountryCode.US) for _ in range(8)]
+            other = executor.submit(self.client.capture, self.GODADDY_URL, CountryCode.US, html=False)
+            while self.client.wait_for.call_count < 2:
+                time.sleep(0.01)
+            time.sleep(0.1)
+            release.set()
+        self.assertEqual({future.result() for future in futures + [other]}, {b'archive'})
+        # One task for the eight identical calls, one for the call without html.
+        self.assertEqual(self.client.create_capture_task.call_count, 2)
+
+    def test_capture_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.client = HarvesterAsyncClient(
+                self.TEST_AUTH_STR, self.TEST_FILE_AUTH, 'test bucket', '/test-path', self.BASE_URL,
+                cache=CaptureCache(tmp)
+            )
+            self._patch_capture()
+            self.assertEqual(self.client.capture(self.GODADDY_URL, CountryCode.US), b'archive')
+            self.assertEqual(self.client.capture(self.GODADDY_URL, CountryCode.USA), b'archive')
+            self.assertEqual(self.client.create_capture_task.call_count, 1)
@@ -0,0 +1,149 @@
+import os
+import re
+import tempfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from unittest import TestCase
+from unittest.mock import patch
+
+from harvester import AdaptiveConcurrency, HarvesterAsyncClient, Throttle
+from harvester.download import FileDownloader
+
+
+class _GetFileHandler(BaseHTTPRequestHandler):
+    """
+    Serves server.payload for any POST, honouring Range headers when
+    server.ranges is set and cutting the first server.failures responses
+    short.
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        server = self.server
+        payload = server.payload
+        server.requests.append(self.headers.get('Range'))
+        match = re.match(r'bytes=(\d+)-(\d+)', self.headers.get('Range') or '')
+        if server.ranges and match:
+            start, end = int(match.group(1)), min(int(match.group(2)), len(payload) - 1)
+            if start >= len(payload):
+                self.send_response(416)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = payload[start:end + 1]
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(payload)}')
+        else:
+            body = payload
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if server.failures > 0:
+            server.failures -= 1
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+class TestFileDownloader(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _GetFileHandler)
+        self.server.payload = os.urandom(1024 * 100 + 7)
+        self.server.ranges = True
+        self.server.failures = 0
+        self.server.requests = []
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = HarvesterAsyncClient(
+            'test auth', 'test file auth', 'test bucket', '/test-path',
+            f'http://127.0.0.1:{self.server.server_address[1]}', max_retries=0
+        )
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dst = os.path.join(self.tmp.name, 'capture.zip')
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def _read(self):
+        with open(self.dst, 'rb') as f:
+            return f.read()
+
+    def test_parallel_ranged_download(self):
+        result = self.client.save_file_to_disk('file1', self.dst, chunk_size=1000, segment_size=1024 * 16)
+        self.assertEqual(self._read(), self.server.payload)
+        self.assertEqual(result.size, len(self.server.payload))
+        self.assertEqual(result.segments, 7)
+        self.assertEqual(len(self.server.requests), 7)
+        self.assertGreater(result.bytes_per_second, 0)
+        self.assertEqual(os.listdir(self.tmp.name), ['capture.zip'])
+
+    def test_each_range_throttled(self):
+        throttle = Throttle(rates={Throttle.GETFILE: (1000, 1000)},
+                            concurrency=AdaptiveConcurrency(initial=2, max_limit=2))
+        client = HarvesterAsyncClient('test auth', 'test file auth', 'test bucket', '/test-path',
+                                      f'http://127.0.0.1:{self.server.server_address[1]}', throttle=throttle)
+        self.addCleanup(client.close)
+        with patch.object(throttle.concurrency, 'release', wraps=throttle.concurrency.release) as release:
+            client.save_file_to_disk('file1', self.dst, segment_size=1024 * 16, max_workers=4)
+        self.assertEqual(self._read(), self.server.payload)
+        self.assertEqual(release.call_count, 7)
+        self.assertEqual({c.args[3] for c in release.call_args_list}, {None})
+        self.assertEqual(throttle.concurrency.in_flight, 0)
+
+    def test_sequential_without_range_support(self):
+        self.server.ranges = False
+        result = self.client.save_file_to_disk('file1', self.dst, segment_size=1024)
+        self.assertEqual(self._read(), self.server.payload)
+        self.assertEqual(result.segments, 1)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_segment_retried_after_dropped_connection(self):
+        self.server.failures = 2
+        self.client.save_file_to_disk('file1', self.dst, segment_size=1024 * 64, max_workers=1)
+        self.assertEqual(self._read(), self.server.payload)
+
+    def test_resume_from_part_file(self):
+        self.server.failures = 100
+        downloader = FileDownloader(self.client._session, self.client._getfile_url, {}, buffer_size=1024,
+                                    segment_size=1024 * 16, max_retries=0)
+        with self.assertRaises(Exception):
+            downloader.download(self.dst)
+        self.assertTrue(os.path.exists(self.dst + FileDownloader.PART_SUFFIX))
+        self.assertTrue(os.path.exists(self.dst + FileDownloader.STATE_SUFFIX))
+
+        self.server.failures = 0
+        self.server.requests = []
+        result = downloader.download(self.dst)
+        self.assertEqual(self._read(), self.server.payload)
+        self.assertGreater(result.resumed_bytes, 0)
+        # The resumed requests only ask for the missing tail of each segment.
+        self.assertNotIn('bytes=0-16383', self.server.requests)
+        self.assertFalse(os.path.exists(self.dst + FileDownloader.STATE_SUFFIX))
+
+    def test_part_file_of_other_file_discarded(self):
+        self.server.failures = 100
+        downloader = FileDownloader(self.client._session, self.client._getfile_url, {}, file_id='file1',
+                                    buffer_size=1024, segment_size=1024 * 16, max_retries=0)
+        with self.assertRaises(Exception):
+            downloader.download(self.dst)
+
+        self.server.failures = 0
+        self.server.requests = []
+        downloader = FileDownloader(self.client._session, self.client._getfile_url, {}, file_id='file2',
+                                    buffer_size=1024, segment_size=1024 * 16, max_retries=0)
+        result = downloader.download(self.dst)
+        self.assertEqual(self._read(), self.server.payload)
+        self.assertEqual(result.resumed_bytes, 0)
+        self.assertIn('bytes=0-16383', self.server.requests)
+
+    def test_empty_file(self):
+        self.server.payload = b''
+        result = self.client.save_file_to_disk('file1', self.dst)
+        self.assertEqual(result.size, 0)
+        self.assertEqual(self._read(), b'')
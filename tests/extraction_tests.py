@@ -0,0 +1,143 @@
+import asyncio
+import os
+import tempfile
+import zipfile
+from concurrent.futures import CancelledError, Future
+from unittest import TestCase
+
+from harvester import (CapturePipeline, CaptureRequest, CountryCode,
+                       ExtractionExecutor, HarvesterArchive,
+                       HarvesterAsyncClient)
+from harvester.extraction import _chain, extract_archive
+from harvester.mhtml import iter_resources
+
+
+class TestExtractionExecutor(TestCase):
+    IMAGE_TEST_DATA = os.urandom(1024 * 64)
+
+    @classmethod
+    def setUpClass(cls):
+        cls.executor = ExtractionExecutor(max_workers=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.executor.shutdown()
+
+    def setUp(self):
+        with open('tests/output.mhtml', 'rb') as f:
+            self.mhtml = f.read()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.zip_path = os.path.join(self.tmp.name, 'capture.zip')
+        with zipfile.ZipFile(self.zip_path, mode='w', compression=zipfile.ZIP_DEFLATED) as z:
+            z.writestr(HarvesterArchive.PNG_ARCHIVE_PATH, self.IMAGE_TEST_DATA)
+            z.writestr(HarvesterArchive.MHTML_ARCHIVE_PATH, self.mhtml)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_extract_archive(self):
+        result = extract_archive(self.zip_path, metadata=True)
+        self.assertEqual(result.path, self.zip_path)
+        self.assertEqual(result.image, self.IMAGE_TEST_DATA)
+        self.assertEqual(result.html, 'test')
+        self.assertEqual(result.metadata, {
+            'members': {
+                HarvesterArchive.PNG_ARCHIVE_PATH: len(self.IMAGE_TEST_DATA),
+                HarvesterArchive.MHTML_ARCHIVE_PATH: len(self.mhtml),
+            },
+            'url': 'https://test.com',
+            'encoding': 'utf-8',
+            'resources': sum(1 for _ in iter_resources(self.mhtml)),
+        })
+
+    def test_submit(self):
+        result = self.executor.submit(self.zip_path).result()
+        self.assertEqual(result.image, self.IMAGE_TEST_DATA)
+        self.assertEqual(result.html, 'test')
+        self.assertIsNone(result.metadata)
+
+    def test_image_html_and_metadata(self):
+        image = self.executor.image(self.zip_path)
+        html = self.executor.html(self.zip_path)
+        metadata = self.executor.metadata(self.zip_path)
+        self.assertEqual(image.result(), self.IMAGE_TEST_DATA)
+        self.assertEqual(html.result(), 'test')
+        self.assertEqual(metadata.result()['url'], 'https://test.com')
+
+    def test_image_dst(self):
+        dst = os.path.join(self.tmp.name, 'output.png')
+        result = self.executor.submit(self.zip_path, html=False, image_dst=dst).result()
+        self.assertIsNone(result.image)
+        self.assertIsNone(result.html)
+        with open(dst, 'rb') as f:
+            self.assertEqual(f.read(), self.IMAGE_TEST_DATA)
+
+    def test_missing_members(self):
+        path = os.path.join(self.tmp.name, 'empty.zip')
+        with zipfile.ZipFile(path, mode='w'):
+            pass
+        result = self.executor.submit(path, metadata=True).result()
+        self.assertIsNone(result.image)
+        self.assertIsNone(result.html)
+        self.assertEqual(result.metadata, {'members': {}})
+
+    def test_error(self):
+        with self.assertRaises(FileNotFoundError):
+            self.executor.image(os.path.join(self.tmp.name, 'missing.zip')).result()
+
+    def test_cancelled(self):
+        source = Future()
+        chained = _chain(source, lambda result: result.image)
+        source.cancel()
+        with self.assertRaises(CancelledError):
+            chained.result(timeout=1)
+
+    def test_cancelled_async(self):
+        async def extract():
+            source = Future()
+            chained = asyncio.wrap_future(_chain(source, lambda result: result.image))
+            source.cancel()
+            return await asyncio.wait_for(chained, 1)
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(extract())
+
+    def test_transform_error(self):
+        source = Future()
+        chained = _chain(source, lambda result: result.image)
+        source.set_result(None)
+        with self.assertRaises(AttributeError):
+            chained.result(timeout=1)
+
+    def test_async(self):
+        async def extract():
+            return await asyncio.gather(
+                self.executor.image_async(self.zip_path),
+                self.executor.html_async(self.zip_path),
+                self.executor.metadata_async(self.zip_path),
+                self.executor.extract_async(self.zip_path, image=False),
+            )
+        image, html, metadata, result = asyncio.run(extract())
+        self.assertEqual(image, self.IMAGE_TEST_DATA)
+        self.assertEqual(html, 'test')
+        self.assertEqual(metadata['encoding'], 'utf-8')
+        self.assertEqual(result.html, 'test')
+        self.assertIsNone(result.image)
+
+    def _save_file_to_disk(self, file_id, path):
+        with zipfile.ZipFile(path, mode='w') as z:
+            z.writestr(HarvesterArchive.PNG_ARCHIVE_PATH, self.IMAGE_TEST_DATA)
+
+    def test_pipeline(self):
+        client = HarvesterAsyncClient('test auth', 'test file auth', 'test bucket', '/test-path', 'http://test')
+        client.create_capture_task = lambda url, proxy, **kwargs: f'task-{url}'
+        client.wait_for = lambda task_id, timeout=None: {'status': 'done', 'result_file_id': f'file-{task_id}'}
+        client.save_file_to_disk = self._save_file_to_disk
+        client.delete_file = client.delete_task = lambda item_id: True
+        pipeline = CapturePipeline(client, extract_workers=2, work_dir=self.tmp.name, extractor=self.executor)
+        results = list(pipeline.run([CaptureRequest(f'https://{i}.com', CountryCode.US, html=False)
+                                     for i in range(4)]))
+        self.assertEqual(len(results), 4)
+        for result in results:
+            self.assertIsNone(result.error)
+            self.assertEqual(result.image, self.IMAGE_TEST_DATA)
+        self.assertEqual(os.listdir(self.tmp.name), ['capture.zip'])
@@ -0,0 +1,161 @@
+import asyncio
+import os
+import tempfile
+from multiprocessing import get_context
+from unittest import TestCase
+
+from benchmarks.fake_server import FakeHarvester
+from harvester import (CountryCode, HarvesterAioClient, HarvesterAsyncClient,
+                       TaskJournal)
+
+
+def _record_tasks(path, prefix, count):
+    with TaskJournal(path) as journal:
+        for i in range(count):
+            journal.record_created(f'{prefix}-{i}', [f'https://{i}.com'])
+            journal.record(f'{prefix}-{i}', TaskJournal.FINISHED, f'file-{prefix}-{i}')
+
+
+class TestTaskJournal(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'journal.db')
+        self.journal = TaskJournal(self.path)
+
+    def tearDown(self):
+        self.journal.close()
+        self.tmp.cleanup()
+
+    def test_lifecycle(self):
+        self.journal.record_created('task', ['https://test.com'], CountryCode.US.name, 'note')
+        entry = self.journal.get('task')
+        self.assertEqual(entry.urls, ['https://test.com'])
+        self.assertEqual(entry.proxy, 'US')
+        self.assertEqual(entry.note, 'note')
+        self.assertEqual(entry.status, TaskJournal.CREATED)
+        self.assertIsNone(entry.file_id)
+
+        self.assertTrue(self.journal.record('task', TaskJournal.FINISHED, 'file'))
+        self.assertEqual(self.journal.get('task').file_id, 'file')
+        self.assertTrue(self.journal.record_file_deleted('file'))
+        self.assertTrue(self.journal.record('task', TaskJournal.DELETED))
+        entry = self.journal.get('task')
+        self.assertEqual(entry.status, TaskJournal.DELETED)
+        self.assertEqual(entry.file_id, 'file')
+        self.assertGreaterEqual(entry.updated, entry.created)
+        self.assertEqual([status for status, _, _ in self.journal.history('task')], [
+            TaskJournal.CREATED, TaskJournal.FINISHED, TaskJournal.FILE_DELETED, TaskJournal.DELETED
+        ])
+
+    def test_unknown_tasks_ignored(self):
+        self.assertFalse(self.journal.record('missing', TaskJournal.DELETED))
+        self.assertFalse(self.journal.record_file_deleted('missing'))
+        self.assertIsNone(self.journal.get('missing'))
+        self.assertEqual(self.journal.history('missing'), [])
+
+    def test_outstanding(self):
+        for task_id in ('a', 'b', 'c', 'd'):
+            self.journal.record_created(task_id, [])
+        self.journal.record('b', TaskJournal.FAILED)
+        self.journal.record('c', TaskJournal.DELETED)
+        self.assertEqual([entry.task_id for entry in self.journal.outstanding()], ['a', 'b', 'd'])
+        self.assertEqual([entry.task_id for entry in self.journal.find(TaskJournal.FAILED)], ['b'])
+
+    def test_compact(self):
+        self.journal.record_created('a', [])
+        self.journal.record_created('b', [])
+        self.journal.record('a', TaskJournal.DELETED)
+        self.assertEqual(self.journal.compact(older_than=60), 0)
+        self.assertEqual(self.journal.compact(), 1)
+        self.assertIsNone(self.journal.get('a'))
+        self.assertEqual(self.journal.history('a'), [])
+        self.assertEqual(self.journal.get('b').status, TaskJournal.CREATED)
+
+    def test_persistent(self):
+        self.journal.record_created('task', ['https://test.com'])
+        self.journal.close()
+        self.journal = TaskJournal(self.path)
+        self.assertEqual([entry.task_id for entry in self.journal.outstanding()], ['task'])
+
+    def test_shared_between_processes(self):
+        context = get_context('fork')
+        processes = [context.Process(target=_record_tasks, args=(self.path, n, 50)) for n in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+        self.assertEqual(len(self.journal.find(TaskJournal.FINISHED)), 200)
+
+
+class TestClientJournal(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.journal = TaskJournal(os.path.join(self.tmp.name, 'journal.db'))
+        self.fake = FakeHarvester(image_size=16, mhtml_size=16).start()
+        self.client = HarvesterAsyncClient('test auth', 'test file auth', 'test bucket', '/test-path', self.fake.url,
+                                           max_retries=0, journal=self.journal)
+
+    def tearDown(self):
+        self.client.close()
+        self.fake.stop()
+        self.journal.close()
+        self.tmp.cleanup()
+
+    def test_capture(self):
+        self.client.capture('https://test.com', CountryCode.US, note='note')
+        entry, = self.journal.find(TaskJournal.DELETED)
+        self.assertEqual(entry.urls, ['https://test.com'])
+        self.assertEqual(entry.note, 'note')
+        self.assertEqual([status for status, _, _ in self.journal.history(entry.task_id)], [
+            TaskJournal.CREATED, TaskJournal.FINISHED, TaskJournal.FILE_DELETED, TaskJournal.DELETED
+        ])
+        self.assertEqual(self.journal.outstanding(), [])
+
+    def test_resume(self):
+        task_ids = self.client.create_capture_tasks([f'https://{i}.com' for i in range(6)], CountryCode.US,
+                                                    urls_per_task=2).task_ids
+        self.client.wait_for(task_ids['https://0.com'])
+        with self.client.batch() as batch:
+            batch.create_capture_task('https://batch.com', CountryCode.DE)
+        self.client.close()
+        self.fake.add_tasks(10)
+
+        # A restarted worker only deals with its own outstanding tasks.
+        self.client = HarvesterAsyncClient('test auth', 'test file auth', 'test bucket', '/test-path', self.fake.url,
+                                           max_retries=0, journal=self.journal)
+        outstanding = self.journal.outstanding()
+        self.assertEqual(len(outstanding), 4)
+        self.assertEqual(self.journal.find(TaskJournal.FINISHED)[0].task_id, task_ids['https://0.com'])
+        self.assertEqual(self.journal.get(outstanding[-1].task_id).urls, ['https://batch.com'])
+        self.assertEqual(self.journal.get(outstanding[-1].task_id).proxy, 'DE')
+        created = [entry.task_id for entry in self.journal.find(TaskJournal.CREATED)]
+        self.assertEqual(len(list(self.client.watch_tasks(created))), 3)
+        for entry in self.journal.find(TaskJournal.FINISHED):
+            self.client.delete_file(entry.file_id)
+        for entry in self.journal.outstanding():
+            self.client.delete_task(entry.task_id)
+        self.assertEqual(self.journal.outstanding(), [])
+        self.assertEqual(len(self.fake.tasks), 10)
+
+    def test_delete_not_deleted(self):
+        task_id = self.client.create_capture_task('https://test.com', CountryCode.US)
+        self.fake.tasks.pop(task_id)
+        self.assertFalse(self.client.delete_task(task_id))
+        self.assertEqual([entry.task_id for entry in self.journal.outstanding()], [task_id])
+        self.assertEqual(self.journal.get(task_id).status, TaskJournal.CREATED)
+
+    def test_aio_client(self):
+        async def capture():
+            async with HarvesterAioClient('test auth', 'test file auth', 'test bucket', '/test-path', self.fake.url,
+                                          max_retries=0, journal=self.journal) as client:
+                task_id = await client.create_capture_task('https://test.com', CountryCode.US)
+                self.assertEqual(self.journal.get(task_id).status, TaskJournal.CREATED)
+                async for task in client.watch_tasks([task_id]):
+                    self.assertEqual(self.journal.get(task_id).file_id, task[client.KEY_RESULT_FILE_ID])
+                await client.delete_task(task_id)
+                return task_id
+        task_id = asyncio.run(capture())
+        self.assertEqual(self.journal.get(task_id).status, TaskJournal.DELETED)
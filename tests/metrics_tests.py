@@ -0,0 +1,133 @@
+import zipfile
+from io import BytesIO
+from threading import Thread
+from unittest import TestCase
+from unittest.mock import patch
+
+from harvester import (CountryCode, HarvesterAsyncClient,
+                       HistogramInstrumentation, Instrumentation)
+from harvester.metrics import (DECODE_SECONDS, DOWNLOAD_BYTES_PER_SECOND,
+                               ERRORS, EXTRACT_HTML, EXTRACT_IMAGE,
+                               EXTRACT_SECONDS, GETFILE, REQUEST_BYTES,
+                               RESPONSE_BYTES, ROUND_TRIP_SECONDS, Histogram)
+
+
+class TestHistogram(TestCase):
+    def test_summary(self):
+        histogram = Histogram()
+        self.assertIsNone(histogram.percentile(50))
+        for i in range(1, 101):
+            histogram.add(i / 1000)
+        summary = histogram.summary()
+        self.assertEqual(summary['count'], 100)
+        self.assertAlmostEqual(summary['mean'], 0.0505)
+        self.assertEqual(summary['min'], 0.001)
+        self.assertEqual(summary['max'], 0.1)
+        # Percentiles are bucket bounds, accurate to within a factor of two.
+        self.assertTrue(0.05 <= summary['p50'] <= 0.1)
+        self.assertTrue(0.09 <= summary['p99'] <= 0.1)
+        self.assertLessEqual(summary['p50'], summary['p90'])
+
+
+class TestInstrumentation(TestCase):
+    def test_noop(self):
+        metrics = Instrumentation()
+        self.assertFalse(metrics.enabled)
+        # Disabled timers share a single context manager.
+        self.assertIs(metrics.timer(ROUND_TRIP_SECONDS, 'a'), metrics.timer(DECODE_SECONDS, 'b'))
+        with metrics.timer(ROUND_TRIP_SECONDS, 'a'):
+            metrics.observe(REQUEST_BYTES, 'a', 1)
+            metrics.increment(ERRORS, 'a')
+
+    def test_histogram_instrumentation(self):
+        metrics = HistogramInstrumentation()
+        with metrics.timer(ROUND_TRIP_SECONDS, 'a'):
+            pass
+
+        def record():
+            for _ in range(1000):
+                metrics.observe(REQUEST_BYTES, 'a', 10)
+                metrics.increment(ERRORS, 'b')
+
+        threads = [Thread(target=record) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['histograms'][ROUND_TRIP_SECONDS]['a']['count'], 1)
+        self.assertEqual(snapshot['histograms'][REQUEST_BYTES]['a']['sum'], 40000)
+        self.assertEqual(snapshot['counters'][ERRORS]['b'], 4000)
+        self.assertEqual(metrics.commands(), ['a', 'b'])
+        metrics.reset()
+        self.assertEqual(metrics.snapshot(), {'histograms': {}, 'counters': {}})
+
+
+class TestClientInstrumentation(TestCase):
+    def setUp(self):
+        self.metrics = HistogramInstrumentation()
+        self.client = HarvesterAsyncClient('test auth', 'test file auth', 'test bucket', '/test-path', 'http://test',
+                                           instrumentation=self.metrics)
+
+    @patch('requests.Session.post')
+    def test_api_command(self, mock_post):
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.request.body = b'x' * 100
+        mock_post.return_value.content = b'y' * 50
+        mock_post.return_value.json.return_value = [{}, {self.client.KEY_RESULT: {self.client.KEY_TASK_ID: 'task'}}]
+        self.client.create_capture_task('https://godaddy.com', CountryCode.US)
+        command = self.client.CREATE_TASK_COMMAND
+        self.assertEqual(self.metrics.histogram(ROUND_TRIP_SECONDS, command).count, 1)
+        self.assertEqual(self.metrics.histogram(DECODE_SECONDS, command).count, 1)
+        self.assertEqual(self.metrics.histogram(REQUEST_BYTES, command).sum, 100)
+        self.assertEqual(self.metrics.histogram(RESPONSE_BYTES, command).sum, 50)
+
+        mock_post.return_value.json.return_value = [{}]
+        with self.assertRaises(Exception):
+            self.client.delete_task('task')
+        self.assertEqual(self.metrics.counter(ERRORS, self.client.DELETE_TASK_COMMAND), 1)
+
+    @patch('requests.Session.post')
+    def test_batch_command_name(self, mock_post):
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.request.body = b''
+        mock_post.return_value.content = b''
+        mock_post.return_value.json.return_value = [{}, {self.client.KEY_RESULT: {self.client.KEY_TASK_ID: 'task'}},
+                                                    {self.client.KEY_RESULT: {self.client.KEY_DELETED: True}}]
+        with self.client.batch() as batch:
+            batch.create_capture_task('https://godaddy.com', CountryCode.US)
+            batch.delete_task('task')
+        command = f'{self.client.CREATE_TASK_COMMAND},{self.client.DELETE_TASK_COMMAND}'
+        self.assertEqual(self.metrics.histogram(ROUND_TRIP_SECONDS, command).count, 1)
+
+    @patch('requests.Session.post')
+    def test_iter_tasks(self, mock_post):
+        body = b'[{}, {"result": [{"task_id": "t1", "status": "done"}]}]'
+        mock_post.return_value.request.body = b'x' * 100
+        mock_post.return_value.iter_content.return_value = [body[:10], body[10:]]
+        self.assertEqual(len(list(self.client.iter_tasks())), 1)
+        command = self.client.FIND_TASK_COMMAND
+        self.assertEqual(self.metrics.histogram(ROUND_TRIP_SECONDS, command).count, 1)
+        self.assertEqual(self.metrics.histogram(REQUEST_BYTES, command).sum, 100)
+        self.assertEqual(self.metrics.histogram(RESPONSE_BYTES, command).sum, len(body))
+
+        mock_post.return_value.iter_content.return_value = [b'[{}, {"error": "bad"}]']
+        with self.assertRaises(Exception):
+            list(self.client.iter_tasks())
+        self.assertEqual(self.metrics.counter(ERRORS, command), 1)
+
+    @patch('requests.Session.post')
+    def test_download(self, mock_post):
+        mock_post.return_value.content = b'z' * 1000
+        self.client.download_file('file')
+        self.assertEqual(self.metrics.histogram(RESPONSE_BYTES, GETFILE).sum, 1000)
+        self.assertEqual(self.metrics.histogram(DOWNLOAD_BYTES_PER_SECOND, GETFILE).count, 1)
+
+    def test_extraction(self):
+        archive = BytesIO()
+        with zipfile.ZipFile(archive, mode='w') as z:
+            z.writestr(self.client.PNG_ARCHIVE_PATH, b'image')
+        self.client.image_from_zip(archive.getvalue())
+        self.assertIsNone(self.client.html_from_zip(b'not a zip'))
+        self.assertEqual(self.metrics.histogram(EXTRACT_SECONDS, EXTRACT_IMAGE).count, 1)
+        self.assertEqual(self.metrics.counter(ERRORS, EXTRACT_HTML), 1)
@@ -0,0 +1,127 @@
+import base64
+from email.parser import Parser
+from unittest import TestCase
+
+from harvester import mhtml
+
+BOUNDARY = '----MultipartBoundary--abc----'
+
+
+def build_mhtml(parts: list, snapshot: str = 'https://test.com') -> bytes:
+    """
+    Build a Blink style MHTML document from (headers, body) pairs.
+    """
+    lines = [
+        'From: <Saved by Blink>',
+        f'Snapshot-Content-Location: {snapshot}',
+        'MIME-Version: 1.0',
+        'Content-Type: multipart/related;',
+        '\ttype="text/html";',
+        f'\tboundary="{BOUNDARY}"',
+        '',
+        '',
+    ]
+    for headers, body in parts:
+        lines.append(f'--{BOUNDARY}')
+        lines.extend(f'{key}: {value}' for key, value in headers.items())
+        lines.append('')
+        lines.append(body)
+    lines.append(f'--{BOUNDARY}--')
+    lines.append('')
+    return '\r\n'.join(lines).encode()
+
+
+class TestMhtml(TestCase):
+    CSS = {'Content-Type': 'text/css', 'Content-Location': 'https://test.com/a.css'}
+    FRAME = {'Content-Type': 'text/html', 'Content-Location': 'https://frame.com'}
+    PAGE = {'Content-Type': 'text/html', 'Content-Transfer-Encoding': 'quoted-printable',
+            'Content-Location': 'https://test.com'}
+    IMAGE = {'Content-Type': 'image/png', 'Content-Transfer-Encoding': 'base64',
+             'Content-Location': 'https://test.com/a.png'}
+
+    def setUp(self):
+        self.image = bytes(range(256))
+        self.data = build_mhtml([
+            (self.CSS, 'body {\r\n  color: red;\r\n}'),
+            (self.FRAME, '<html>frame</html>'),
+            (self.PAGE, '<html>page =3D</html>'),
+            (self.IMAGE, base64.encodebytes(self.image).decode().replace('\n', '\r\n')),
+        ])
+
+    def test_read_root(self):
+        headers, delimiter, _ = mhtml.read_root(self.data)
+        self.assertEqual(headers[mhtml.SNAPSHOT_CONTENT_LOCATION], 'https://test.com')
+        self.assertEqual(delimiter, f'--{BOUNDARY}'.encode())
+
+    def test_iter_parts(self):
+        parts = list(mhtml.iter_parts(self.data))
+        self.assertEqual([part.content_location for part in parts], [
+            'https://test.com/a.css', 'https://frame.com', 'https://test.com', 'https://test.com/a.png'
+        ])
+        self.assertEqual(parts[0].body, b'body {\r\n  color: red;\r\n}')
+        self.assertEqual(parts[0].content_type, 'text/css')
+        self.assertEqual(parts[3].decode(), self.image)
+
+    def test_find_html_part(self):
+        part = mhtml.find_html_part(self.data)
+        self.assertEqual(part.body, b'<html>page =3D</html>')
+        self.assertEqual(part.decode(), b'<html>page =</html>')
+
+    def test_find_html_part_matches_email_parser(self):
+        with open('tests/output.mhtml', 'rb') as f:
+            data = f.read()
+        email = Parser().parsestr(data.decode('utf-8'))
+        expected = [portion.get_payload() for portion in email.get_payload()
+                    if portion.get('Content-Location') == email.get('Snapshot-Content-Location')][0]
+        self.assertEqual(mhtml.find_html_part(data).body.decode(), expected)
+
+    def test_iter_resources(self):
+        resources = list(mhtml.iter_resources(self.data))
+        self.assertEqual([part.content_location for part in resources], [
+            'https://test.com/a.css', 'https://frame.com', 'https://test.com/a.png'
+        ])
+
+    def test_no_matching_part(self):
+        self.assertIsNone(mhtml.find_html_part(build_mhtml([(self.CSS, 'css')])))
+
+    def test_empty_body(self):
+        part = mhtml.find_html_part(build_mhtml([(self.PAGE, '')]))
+        self.assertEqual(part.body, b'')
+
+    def test_not_multipart(self):
+        self.assertIsNone(mhtml.find_html_part(b'test html'))
+        self.assertEqual(list(mhtml.iter_parts(b'Content-Type: text/html\r\n\r\ntest')), [])
+
+    def test_find_html_content_decodes_quoted_printable(self):
+        content = mhtml.find_html_content(self.data)
+        self.assertEqual(content, mhtml.HtmlContent(b'<html>page =</html>', 'utf-8'))
+        self.assertEqual(mhtml.html_from_mhtml(self.data), '<html>page =</html>')
+
+    def test_html_from_mhtml_soft_line_breaks_and_utf8(self):
+        data = build_mhtml([(self.PAGE, '<p>caf=C3=A9 and a very long =\r\nline</p>')])
+        self.assertEqual(mhtml.html_from_mhtml(data), '<p>café and a very long line</p>')
+
+    def test_html_from_mhtml_base64(self):
+        headers = dict(self.PAGE, **{'Content-Transfer-Encoding': 'base64'})
+        data = build_mhtml([(headers, base64.b64encode('<p>☃</p>'.encode()).decode())])
+        self.assertEqual(mhtml.html_from_mhtml(data), '<p>☃</p>')
+
+    def test_declared_charset(self):
+        headers = dict(self.PAGE, **{'Content-Type': 'text/html; charset="windows-1252"'})
+        data = build_mhtml([(headers, '<p>caf=E9 =80</p>')])
+        content = mhtml.find_html_content(data)
+        self.assertEqual(content.encoding, 'cp1252')
+        self.assertEqual(content.text(), '<p>café €</p>')
+
+    def test_meta_charset(self):
+        data = build_mhtml([(self.PAGE, '<meta charset=3D"iso-8859-1"><p>caf=E9</p>')])
+        self.assertEqual(mhtml.find_html_content(data).encoding, 'iso8859-1')
+        self.assertEqual(mhtml.html_from_mhtml(data), '<meta charset="iso-8859-1"><p>café</p>')
+
+    def test_detect_charset_fallback(self):
+        self.assertEqual(mhtml.detect_charset(b'<p>x</p>', 'not-a-charset'), mhtml.DEFAULT_CHARSET)
+        self.assertEqual(mhtml.detect_charset(b'<p>x</p>'), mhtml.DEFAULT_CHARSET)
+
+    def test_invalid_bytes_replaced(self):
+        data = build_mhtml([(self.PAGE, '<p>=FF</p>')])
+        self.assertEqual(mhtml.html_from_mhtml(data), '<p>\ufffd</p>')
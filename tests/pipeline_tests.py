@@ -0,0 +1,113 @@
+import os
+import tempfile
+import zipfile
+from threading import Lock
+from unittest import TestCase
+from unittest.mock import patch
+
+from harvester import (CaptureCache, CapturePipeline, CaptureRequest,
+                       CountryCode, HarvesterAsyncClient)
+
+
+class TestCapturePipeline(TestCase):
+    IMAGE_TEST_STR = b'test image'
+
+    def setUp(self):
+        self.client = HarvesterAsyncClient('test auth', 'test file auth', 'test bucket', '/test-path', 'http://test')
+        self.tmp = tempfile.TemporaryDirectory()
+        self.lock = Lock()
+        self.deleted_tasks = []
+        self.deleted_files = []
+        self.failed_urls = set()
+        patchers = [
+            patch.object(self.client, 'create_capture_task', side_effect=lambda url, proxy, **kwargs: f'task-{url}'),
+            patch.object(self.client, 'wait_for', side_effect=self._wait_for),
+            patch.object(self.client, 'save_file_to_disk', side_effect=self._save_file_to_disk),
+            patch.object(self.client, 'delete_file', side_effect=self._delete(self.deleted_files)),
+            patch.object(self.client, 'delete_task', side_effect=self._delete(self.deleted_tasks)),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.pipeline = CapturePipeline(self.client, submit_workers=2, wait_workers=4, download_workers=2,
+                                        extract_workers=1, cleanup_workers=1, queue_size=2, work_dir=self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _wait_for(self, task_id, timeout=None):
+        status = 'failed' if task_id[len('task-'):] in self.failed_urls else 'done'
+        return {'task_id': task_id, 'status': status, 'result_file_id': f'file-{task_id}'}
+
+    def _save_file_to_disk(self, file_id, path):
+        with zipfile.ZipFile(path, mode='w') as z:
+            z.writestr(self.client.PNG_ARCHIVE_PATH, self.IMAGE_TEST_STR)
+
+    def _delete(self, deleted):
+        def delete(item_id):
+            with self.lock:
+                deleted.append(item_id)
+            return True
+        return delete
+
+    def _requests(self, count):
+        return [CaptureRequest(f'https://{i}.com', CountryCode.US, html=False) for i in range(count)]
+
+    def test_run(self):
+        results = list(self.pipeline.run(self._requests(20)))
+        self.assertEqual(len(results), 20)
+        self.assertEqual({result.request.url for result in results}, {f'https://{i}.com' for i in range(20)})
+        for result in results:
+            self.assertIsNone(result.error)
+            self.assertIsNone(result.cleanup_error)
+            self.assertEqual(result.image, self.IMAGE_TEST_STR)
+            self.assertIsNone(result.html)
+        self.assertEqual(len(self.deleted_tasks), 20)
+        self.assertEqual(len(self.deleted_files), 20)
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+    def test_failed_capture_still_cleaned_up(self):
+        self.failed_urls.add('https://3.com')
+        results = {result.request.url: result for result in self.pipeline.run(self._requests(5))}
+        self.assertIsNotNone(results['https://3.com'].error)
+        self.assertIsNone(results['https://3.com'].image)
+        self.assertIn('task-https://3.com', self.deleted_tasks)
+        self.assertIn('file-task-https://3.com', self.deleted_files)
+        self.assertIsNone(results['https://2.com'].error)
+
+    def test_cleanup_error_reported(self):
+        self.client.delete_file.side_effect = Exception('delete failed')
+        results = list(self.pipeline.run(self._requests(2)))
+        for result in results:
+            self.assertIsNone(result.error)
+            self.assertIsNotNone(result.cleanup_error)
+        # The task is still deleted when deleting the file fails.
+        self.assertEqual(len(self.deleted_tasks), 2)
+
+    def test_closing_early_cleans_up_submitted_captures(self):
+        results = self.pipeline.run(iter(self._requests(100)))
+        next(results)
+        results.close()
+        submitted = self.client.create_capture_task.call_count
+        self.assertLess(submitted, 100)
+        self.assertEqual(len(self.deleted_tasks), submitted)
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+    def test_cache(self):
+        cache = CaptureCache(os.path.join(self.tmp.name, 'cache'))
+        pipeline = CapturePipeline(self.client, work_dir=self.tmp.name, cache=cache)
+        first = list(pipeline.run(self._requests(3)))
+        self.assertFalse(any(result.cached for result in first))
+        self.assertEqual(self.client.create_capture_task.call_count, 3)
+
+        second = list(pipeline.run(self._requests(3)))
+        self.assertTrue(all(result.cached for result in second))
+        self.assertEqual({result.image for result in second}, {self.IMAGE_TEST_STR})
+        self.assertEqual(self.client.create_capture_task.call_count, 3)
+        self.assertEqual(self.client.save_file_to_disk.call_count, 3)
+        self.assertEqual(len(self.deleted_tasks), 3)
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ['cache'])
+
+        # A different egress region is a different capture.
+        third = list(pipeline.run([CaptureRequest('https://0.com', CountryCode.DE, html=False)]))
+        self.assertFalse(third[0].cached)
@@ -0,0 +1,114 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from benchmarks.fake_server import FakeHarvester
+from harvester import HarvesterAsyncClient, HarvesterTask
+from harvester.tasks import parse_timestamp
+
+
+class TestPurge(TestCase):
+    DAY = 60 * 60 * 24
+
+    def setUp(self):
+        self.fake = FakeHarvester(image_size=16, mhtml_size=16).start()
+        self.client = HarvesterAsyncClient('test auth', 'test file auth', 'test bucket', '/test-path', self.fake.url,
+                                           max_retries=0)
+
+    def tearDown(self):
+        self.client.close()
+        self.fake.stop()
+
+    def test_purge_expired(self):
+        stale = set(self.fake.add_tasks(25, age=2 * self.DAY))
+        fresh = set(self.fake.add_tasks(5))
+        running = set(self.fake.add_tasks(3, finished=False, age=2 * self.DAY))
+        result = self.client.purge(older_than=self.DAY, batch_size=4, max_workers=2)
+        self.assertFalse(result.dry_run)
+        self.assertEqual(result.scanned, 33)
+        self.assertEqual(set(result.task_ids), stale | running)
+        self.assertEqual(result.tasks_deleted, 28)
+        # Running tasks have no result file yet.
+        self.assertEqual(result.files_deleted, 25)
+        self.assertEqual(result.errors, {})
+        self.assertEqual(set(self.fake.tasks), fresh)
+        self.assertEqual(len(self.fake.files), 5 + 3)
+
+    def test_purge_by_status(self):
+        self.fake.add_tasks(4, age=2 * self.DAY)
+        running = set(self.fake.add_tasks(3, finished=False, age=2 * self.DAY))
+        result = self.client.purge(older_than=self.DAY, status=self.client.TASK_STATUS_DONE)
+        self.assertEqual(result.tasks_deleted, 4)
+        self.assertEqual(set(self.fake.tasks), running)
+
+    def test_dry_run(self):
+        stale = set(self.fake.add_tasks(5, age=2 * self.DAY))
+        result = self.client.purge(older_than=self.DAY, dry_run=True)
+        self.assertTrue(result.dry_run)
+        self.assertEqual(set(result.task_ids), stale)
+        self.assertEqual(result.tasks_deleted, 0)
+        self.assertEqual(set(self.fake.tasks), stale)
+
+    def test_requires_selection(self):
+        self.fake.add_tasks(3, finished=False)
+        with self.assertRaises(ValueError):
+            self.client.purge()
+        self.assertEqual(len(self.fake.tasks), 3)
+
+    def test_all_tasks(self):
+        self.fake.add_tasks(2)
+        self.fake.add_tasks(3, finished=False)
+        result = self.client.purge(all_tasks=True)
+        self.assertEqual((result.scanned, result.tasks_deleted, result.undated), (5, 5, 0))
+        self.assertEqual(self.fake.tasks, {})
+
+    def test_undated_tasks(self):
+        stale = set(self.fake.add_tasks(2, age=2 * self.DAY))
+        undated = set(self.fake.add_tasks(3, age=2 * self.DAY))
+        for task_id in undated:
+            self.fake.tasks[task_id]['created'] = None
+        result = self.client.purge(older_than=self.DAY)
+        self.assertEqual((result.scanned, result.undated), (5, 3))
+        self.assertEqual(set(result.task_ids), stale)
+        self.assertEqual(set(self.fake.tasks), undated)
+
+    def test_already_deleted_file(self):
+        task_id = self.fake.add_tasks(1, age=2 * self.DAY)[0]
+        self.fake.files.discard(self.fake.tasks[task_id]['file_id'])
+        result = self.client.purge(older_than=self.DAY)
+        self.assertEqual((result.tasks_deleted, result.files_deleted, result.errors), (1, 1, {}))
+
+    def test_failed_file_deletes_keep_tasks(self):
+        stale = set(self.fake.add_tasks(3, age=2 * self.DAY))
+        run_api_commands = self.client._run_api_commands
+
+        def fail_file_deletes(commands, token):
+            if commands[0][self.client.KEY_COMMAND] == self.client.DELETE_FILE_COMMAND:
+                raise Exception('deletefile failed')
+            return run_api_commands(commands, token)
+
+        with patch.object(self.client, '_run_api_commands', side_effect=fail_file_deletes):
+            result = self.client.purge(older_than=self.DAY)
+        self.assertEqual((result.tasks_deleted, result.files_deleted), (0, 0))
+        self.assertEqual(set(result.errors), stale)
+        # The tasks are kept so their files can still be found and purged later.
+        self.assertEqual(set(self.fake.tasks), stale)
+
+    def test_already_deleted_task(self):
+        self.assertFalse(self.client._parse_delete_task_result(
+            {self.client.KEY_ERROR: self.client.ALREADY_DELETED_ERROR}, 'task'))
+
+
+class TestTaskTimestamps(TestCase):
+    def test_parse_timestamp(self):
+        self.assertEqual(parse_timestamp(1700000000), 1700000000.0)
+        self.assertEqual(parse_timestamp('1700000000.5'), 1700000000.5)
+        self.assertEqual(parse_timestamp('2023-11-14T22:13:20Z'), 1700000000.0)
+        self.assertEqual(parse_timestamp('2023-11-14T22:13:20'), 1700000000.0)
+        self.assertEqual(parse_timestamp('2023-11-14T23:13:20+01:00'), 1700000000.0)
+        self.assertIsNone(parse_timestamp('yesterday'))
+        self.assertIsNone(parse_timestamp(None))
+
+    def test_created_at(self):
+        task = HarvesterTask.from_dict({'task_id': 't1', 'created': '2023-11-14T22:13:20Z'})
+        self.assertEqual(task.created_at, 1700000000.0)
+        self.assertIsNone(HarvesterTask('t2').created_at)
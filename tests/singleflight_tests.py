@@ -0,0 +1,231 @@
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+from threading import Barrier, Event, Lock, Thread
+from unittest import IsolatedAsyncioTestCase, TestCase, skipIf
+from unittest.mock import patch
+
+from harvester.singleflight import (AsyncSingleFlight, SingleFlight, fcntl,
+                                    file_lock)
+
+
+def _locked_append(lock_dir, log_path, name):
+    def append():
+        with open(log_path, 'a') as f:
+            f.write(f'{name} start\n')
+            f.flush()
+            time.sleep(0.2)
+            f.write(f'{name} end\n')
+    SingleFlight(lock_dir).do('key', append)
+
+
+class TestSingleFlight(TestCase):
+    def _run_concurrently(self, flight, key, func, count):
+        results, errors = [], []
+        lock = Lock()
+
+        def call():
+            try:
+                result = flight.do(key, func)
+                with lock:
+                    results.append(result)
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+
+        threads = [Thread(target=call) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads, results, errors
+
+    def test_shares_result(self):
+        flight = SingleFlight()
+        release = Event()
+        calls = []
+
+        def func():
+            calls.append(1)
+            release.wait()
+            return object()
+
+        threads, results, errors = self._run_concurrently(flight, 'key', func, 8)
+        while flight.in_flight() == 0:
+            time.sleep(0.01)
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 8)
+        self.assertEqual(len({id(result) for result in results}), 1)
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_shares_error(self):
+        flight = SingleFlight()
+        release = Event()
+
+        def func():
+            release.wait()
+            raise ValueError('capture failed')
+
+        threads, results, errors = self._run_concurrently(flight, 'key', func, 4)
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [])
+        self.assertEqual(len(errors), 4)
+        self.assertTrue(all(isinstance(e, ValueError) for e in errors))
+
+    def test_distinct_keys(self):
+        flight = SingleFlight()
+        barrier = Barrier(2, timeout=5)
+
+        def func():
+            # Deadlocks unless both keys run at the same time.
+            barrier.wait()
+            return True
+
+        threads = [Thread(target=flight.do, args=(key, func)) for key in ('a', 'b')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertFalse(barrier.broken)
+
+    def test_not_cached(self):
+        flight = SingleFlight()
+        self.assertEqual(flight.do('key', lambda: 1), 1)
+        self.assertEqual(flight.do('key', lambda: 2), 2)
+
+    @skipIf(fcntl is None, 'fcntl is not available')
+    def test_lock_file_across_processes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            log_path = os.path.join(tmp, 'log')
+            context = multiprocessing.get_context('fork')
+            processes = [context.Process(target=_locked_append, args=(tmp, log_path, name)) for name in 'ab']
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            with open(log_path) as f:
+                lines = f.read().splitlines()
+            self.assertEqual(len(lines), 4)
+            self.assertEqual(lines[0].split()[0], lines[1].split()[0])
+            self.assertEqual([line.split()[1] for line in lines], ['start', 'end', 'start', 'end'])
+
+    @skipIf(fcntl is None, 'fcntl is not available')
+    def test_lock_file_removed(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            flight = SingleFlight(tmp)
+            for i in range(10):
+                self.assertEqual(flight.do(f'key {i}', lambda: len(os.listdir(tmp))), 1)
+            self.assertEqual(os.listdir(tmp), [])
+
+    @skipIf(fcntl is None, 'fcntl is not available')
+    def test_lock_file_exclusive_while_removed(self):
+        holders, overlaps = [], []
+        lock = Lock()
+
+        def hold(path, delay):
+            # Staggered so that some threads wait on a file that gets removed
+            # while others create a new one.
+            time.sleep(delay)
+            with file_lock(path):
+                with lock:
+                    holders.append(1)
+                    overlaps.append(len(holders))
+                time.sleep(0.02)
+                with lock:
+                    holders.pop()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'key.lock')
+            threads = [Thread(target=hold, args=(path, i * 0.015)) for i in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(overlaps, [1] * 8)
+            self.assertEqual(os.listdir(tmp), [])
+
+
+class TestAsyncSingleFlight(IsolatedAsyncioTestCase):
+    async def test_shares_result(self):
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def func():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return len(calls)
+
+        results = await asyncio.gather(*[flight.do('key', func) for _ in range(10)])
+        self.assertEqual(results, [1] * 10)
+        self.assertEqual(flight.in_flight(), 0)
+
+    async def test_shares_error(self):
+        flight = AsyncSingleFlight()
+
+        async def func():
+            await asyncio.sleep(0.05)
+            raise ValueError('capture failed')
+
+        results = await asyncio.gather(*[flight.do('key', func) for _ in range(3)], return_exceptions=True)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+
+    async def test_cancelling_a_caller(self):
+        flight = AsyncSingleFlight()
+
+        async def func():
+            await asyncio.sleep(0.05)
+            return 'archive'
+
+        first = asyncio.ensure_future(flight.do('key', func))
+        second = asyncio.ensure_future(flight.do('key', func))
+        await asyncio.sleep(0)
+        first.cancel()
+        self.assertEqual(await second, 'archive')
+        with self.assertRaises(asyncio.CancelledError):
+            await first
+
+    async def test_lock_dir(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            flight = AsyncSingleFlight(tmp)
+
+            async def func():
+                return 'archive'
+
+            self.assertEqual(await flight.do('key', func), 'archive')
+            self.assertEqual(os.listdir(tmp), [])
+
+    async def test_cancelled_while_waiting_for_lock(self):
+        free, exited = Event(), Event()
+
+        class BlockingLock(object):
+            def __init__(self, path):
+                pass
+
+            def __enter__(self):
+                free.wait(5)
+
+            def __exit__(self, *args):
+                exited.set()
+
+        with tempfile.TemporaryDirectory() as tmp, patch('harvester.singleflight.file_lock', BlockingLock):
+            flight = AsyncSingleFlight(tmp)
+
+            async def func():
+                return 'archive'
+
+            caller = asyncio.ensure_future(flight.do('key', func))
+            await asyncio.sleep(0.05)
+            flight._calls['key'].cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await caller
+            self.assertFalse(exited.is_set())
+            # The worker thread gets the lock once it is free and hands it back.
+            free.set()
+            self.assertTrue(await asyncio.to_thread(exited.wait, 5))
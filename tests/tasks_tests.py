@@ -0,0 +1,78 @@
+import json
+from unittest import TestCase
+from unittest.mock import patch
+
+from harvester import HarvesterAsyncClient, HarvesterTask
+from harvester.tasks import TaskStreamParser
+
+
+class TestTaskStreamParser(TestCase):
+    TASKS = [
+        {'task_id': 't1', 'status': 'done', 'result_file_id': 'f1', 'size': 12345},
+        {'task_id': 't2', 'status': 'running', 'notes': 'café ☃', 'nested': {'a': [1, 2]}},
+    ]
+
+    def _parse(self, body: bytes, chunk_size: int) -> list:
+        parser = TaskStreamParser()
+        items = []
+        for i in range(0, len(body), chunk_size):
+            items.extend(parser.feed(body[i:i + chunk_size]))
+        items.extend(parser.close())
+        return items
+
+    def test_parse_any_chunk_size(self):
+        body = json.dumps([{'result': 'ok'}, {'id': 17, 'result': self.TASKS, 'count': 12345}]).encode()
+        for chunk_size in (1, 2, 3, 7, 64, len(body)):
+            self.assertEqual(self._parse(body, chunk_size), self.TASKS)
+
+    def test_parse_whitespace(self):
+        body = b' [ {} ,\n { "result" : [ {"task_id": "t1"} , {"task_id": "t2"} ] } ] \n'
+        self.assertEqual(self._parse(body, 5), [{'task_id': 't1'}, {'task_id': 't2'}])
+
+    def test_parse_empty_result(self):
+        self.assertEqual(self._parse(b'[{}, {"result": []}]', 1), [])
+
+    def test_yields_before_end_of_body(self):
+        parser = TaskStreamParser()
+        self.assertEqual(parser.feed(b'[{}, {"result": [{"task_id": "t1"}, {"task_'), [{'task_id': 't1'}])
+
+    def test_malformed(self):
+        for body in (b'[{}, {}]', b'[{}, {"error": "bad"}]', b'[{}, {"result": {}}]', b'[{}, {"result": [',
+                     b'[{}]', b'{}', b'not json'):
+            with self.assertRaises(Exception, msg=body):
+                self._parse(body, 3)
+
+
+class TestIterTasks(TestCase):
+    BODY = json.dumps([{}, {'result': [
+        {'task_id': 't1', 'status': 'done', 'result_file_id': 'f1'},
+        {'task_id': 't2', 'status': 'running'},
+        {'task_id': 't3', 'status': 'done', 'result_file_id': 'f3'},
+    ]}]).encode()
+
+    def setUp(self):
+        self.client = HarvesterAsyncClient('test auth', 'test file auth', 'test bucket', '/test-path', 'http://test')
+
+    def _response(self, mock_post):
+        mock_post.return_value.iter_content.side_effect = lambda chunk_size: (
+            self.BODY[i:i + chunk_size] for i in range(0, len(self.BODY), chunk_size)
+        )
+
+    @patch('requests.Session.post')
+    def test_iter_tasks(self, mock_post):
+        self._response(mock_post)
+        tasks = list(self.client.iter_tasks(finished=True, chunk_size=8))
+        self.assertEqual(tasks, [
+            HarvesterTask('t1', 'done', 'f1'), HarvesterTask('t2', 'running'), HarvesterTask('t3', 'done', 'f3')
+        ])
+        self.assertTrue(mock_post.call_args[1]['stream'])
+        self.assertEqual(mock_post.call_args[1]['json'][1], {
+            self.client.KEY_COMMAND: self.client.FIND_TASK_COMMAND,
+            self.client.KEY_FINISHED: True
+        })
+
+    @patch('requests.Session.post')
+    def test_iter_tasks_filters(self, mock_post):
+        self._response(mock_post)
+        self.assertEqual([task.task_id for task in self.client.iter_tasks(status='done')], ['t1', 't3'])
+        self.assertEqual([task.task_id for task in self.client.iter_tasks(task_ids=['t2', 't9'])], ['t2'])
@@ -0,0 +1,178 @@
+import asyncio
+import time
+from threading import Thread
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import patch
+
+from harvester import (AdaptiveConcurrency, CountryCode, HarvesterAsyncClient,
+                       Throttle, TokenBucket)
+
+
+class TestTokenBucket(TestCase):
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(rate=10, burst=2)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertAlmostEqual(bucket.reserve(), 0.1, places=2)
+        # Reservations queue up behind each other.
+        self.assertAlmostEqual(bucket.reserve(), 0.2, places=2)
+
+    def test_acquire_waits(self):
+        bucket = TokenBucket(rate=50, burst=1)
+        started = time.monotonic()
+        for _ in range(6):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+    def test_invalid_rate(self):
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=0)
+
+
+class TestAdaptiveConcurrency(TestCase):
+    def test_additive_increase(self):
+        concurrency = AdaptiveConcurrency(initial=4, max_limit=5)
+        for _ in range(4):
+            concurrency.release(concurrency.acquire(), 'create', True, 0.1)
+        # About one more slot per round of calls.
+        self.assertTrue(4.9 < concurrency.limit < 5)
+        for _ in range(100):
+            concurrency.release(concurrency.acquire(), 'create', True, 0.1)
+        self.assertEqual(concurrency.limit, 5)
+
+    def test_multiplicative_decrease_once_per_burst(self):
+        concurrency = AdaptiveConcurrency(initial=8)
+        generations = [concurrency.acquire() for _ in range(4)]
+        for generation in generations:
+            concurrency.release(generation, 'create', False, 0.1)
+        self.assertEqual(concurrency.limit, 4)
+        concurrency.release(concurrency.acquire(), 'create', False, 0.1)
+        self.assertEqual(concurrency.limit, 2)
+        for _ in range(3):
+            concurrency.release(concurrency.acquire(), 'create', False, 0.1)
+        self.assertEqual(concurrency.limit, 1)
+
+    def test_latency_spike(self):
+        concurrency = AdaptiveConcurrency(initial=8, latency_factor=3)
+        concurrency.release(concurrency.acquire(), 'find', True, 0.1)
+        limit = concurrency.limit
+        # Slow for a create is only judged against other creates.
+        concurrency.release(concurrency.acquire(), 'create', True, 1.0)
+        self.assertGreater(concurrency.limit, limit)
+        concurrency.release(concurrency.acquire(), 'find', True, 1.0)
+        self.assertLess(concurrency.limit, limit)
+
+    def test_release_without_latency(self):
+        concurrency = AdaptiveConcurrency(initial=8, latency_factor=3)
+        concurrency.release(concurrency.acquire(), 'getfile', True, None)
+        concurrency.release(concurrency.acquire(), 'getfile', True, 0.1)
+        limit = concurrency.limit
+        concurrency.release(concurrency.acquire(), 'getfile', True, None)
+        self.assertGreater(concurrency.limit, limit)
+
+    def test_acquire_blocks_at_limit(self):
+        concurrency = AdaptiveConcurrency(initial=1, max_limit=1)
+        generation = concurrency.acquire()
+        acquired = []
+        thread = Thread(target=lambda: acquired.append(concurrency.acquire()))
+        thread.start()
+        time.sleep(0.05)
+        self.assertEqual(acquired, [])
+        concurrency.release(generation, 'create', True, 0.1)
+        thread.join(1)
+        self.assertEqual(len(acquired), 1)
+        self.assertEqual(concurrency.in_flight, 1)
+
+
+class TestThrottle(TestCase):
+    def test_limit_reports_failures(self):
+        throttle = Throttle(concurrency=AdaptiveConcurrency(initial=8))
+        with self.assertRaises(ValueError):
+            with throttle.limit(Throttle.CREATE):
+                raise ValueError()
+        self.assertEqual(throttle.concurrency.limit, 4)
+        with throttle.limit(Throttle.CREATE) as call:
+            call.failed = True
+        self.assertEqual(throttle.concurrency.limit, 2)
+        self.assertEqual(throttle.concurrency.in_flight, 0)
+
+    def test_size_dependent_kinds_not_timed(self):
+        throttle = Throttle(concurrency=AdaptiveConcurrency(initial=8, latency_factor=3))
+        with throttle.limit(Throttle.GETFILE):
+            pass
+        with throttle.limit(Throttle.GETFILE):
+            time.sleep(0.05)
+        self.assertGreater(throttle.concurrency.limit, 8)
+
+    def test_rate_per_kind(self):
+        throttle = Throttle(rates={Throttle.CREATE: (1, 2)})
+        started = time.monotonic()
+        # The delete tokens are not limited, and two creates fit in the burst.
+        with throttle.limit(Throttle.CREATE, Throttle.CREATE, Throttle.DELETE, Throttle.DELETE):
+            pass
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertGreater(throttle.buckets[Throttle.CREATE].reserve(), 0.5)
+
+    @patch('requests.Session.post')
+    def test_client_backs_off_on_overload(self, mock_post):
+        throttle = Throttle(concurrency=AdaptiveConcurrency(initial=8))
+        client = HarvesterAsyncClient('test auth', 'test file auth', 'test bucket', '/test-path', 'http://test',
+                                      throttle=throttle)
+        mock_post.return_value.status_code = 429
+        mock_post.return_value.json.return_value = [{}, {}]
+        with self.assertRaises(Exception):
+            client.create_capture_task('https://godaddy.com', CountryCode.US)
+        self.assertEqual(throttle.concurrency.limit, 4)
+
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = [{}, {client.KEY_RESULT: {client.KEY_TASK_ID: 'test task'}}]
+        client.create_capture_task('https://godaddy.com', CountryCode.US)
+        self.assertEqual(throttle.concurrency.limit, 4.25)
+
+    @patch('requests.Session.post')
+    def test_iter_tasks_backs_off_on_overload(self, mock_post):
+        throttle = Throttle(concurrency=AdaptiveConcurrency(initial=8))
+        client = HarvesterAsyncClient('test auth', 'test file auth', 'test bucket', '/test-path', 'http://test',
+                                      throttle=throttle)
+        mock_post.return_value.status_code = 429
+        mock_post.return_value.raise_for_status.side_effect = Exception('429 Too Many Requests')
+        with self.assertRaises(Exception):
+            list(client.iter_tasks())
+        self.assertEqual(throttle.concurrency.limit, 4)
+        # The slot is released before the tasks are read.
+        self.assertEqual(throttle.concurrency.in_flight, 0)
+
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.raise_for_status.side_effect = None
+        mock_post.return_value.iter_content.return_value = [b'[{}, {"result": [{"task_id": "t1"}]}]']
+        for _ in client.iter_tasks():
+            self.assertEqual(throttle.concurrency.in_flight, 0)
+        self.assertEqual(throttle.concurrency.limit, 4.25)
+
+
+class TestAsyncThrottle(IsolatedAsyncioTestCase):
+    async def test_async_waiter_woken_from_thread(self):
+        concurrency = AdaptiveConcurrency(initial=1, max_limit=1)
+        generation = concurrency.acquire()
+        waiter = asyncio.ensure_future(concurrency.acquire_async())
+        await asyncio.sleep(0.05)
+        self.assertFalse(waiter.done())
+        thread = Thread(target=concurrency.release, args=(generation, 'create', True, 0.1))
+        thread.start()
+        thread.join()
+        await asyncio.wait_for(waiter, 1)
+        self.assertEqual(concurrency.in_flight, 1)
+
+    async def test_limit_async(self):
+        throttle = Throttle(rates={Throttle.FIND: (20, 1)}, concurrency=AdaptiveConcurrency(initial=2, max_limit=2))
+        in_flight = []
+
+        async def call():
+            async with throttle.limit_async(Throttle.FIND):
+                in_flight.append(throttle.concurrency.in_flight)
+                await asyncio.sleep(0.01)
+
+        started = time.monotonic()
+        await asyncio.gather(*[call() for _ in range(5)])
+        self.assertGreaterEqual(time.monotonic() - started, 0.19)
+        self.assertLessEqual(max(in_flight), 2)
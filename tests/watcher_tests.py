@@ -0,0 +1,138 @@
+from concurrent.futures import TimeoutError
+from threading import Thread
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import Mock, patch
+
+from harvester import HarvesterAsyncClient, HarvesterTask
+from harvester.watcher import AsyncTaskWatcher, TaskWatcher
+
+
+def _task(task_id, status='done'):
+    return HarvesterTask(task_id, status)._asdict()
+
+
+def _polls(*polls):
+    """
+    An iter_tasks side effect returning each poll in turn, filtered to the
+    requested task IDs, then repeating the last one.
+    """
+    polls = list(polls)
+
+    def iter_tasks(finished, task_ids):
+        tasks = polls.pop(0) if len(polls) > 1 else polls[0]
+        if isinstance(tasks, Exception):
+            raise tasks
+        return iter([HarvesterTask(task_id, status) for task_id, status in tasks if task_id in task_ids])
+    return iter_tasks
+
+
+class TestTaskWatcher(TestCase):
+    def setUp(self):
+        self.client = Mock(KEY_TASK_ID='task_id', KEY_STATUS='status')
+        self.watcher = TaskWatcher(self.client, min_interval=0.01, max_interval=0.02, jitter=0)
+
+    def tearDown(self):
+        self.watcher.stop()
+
+    def test_wait_for(self):
+        self.client.iter_tasks.side_effect = _polls([], [('other', 'done')], [('other', 'done'), ('t1', 'done')])
+        self.assertEqual(self.watcher.wait_for('t1', timeout=5), _task('t1'))
+        self.assertEqual(self.client.iter_tasks.call_count, 3)
+        self.client.iter_tasks.assert_called_with(finished=True, task_ids=['t1'])
+        self.client.get_tasks.assert_not_called()
+
+    def test_waiters_share_polling_loop(self):
+        def poll(finished, task_ids):
+            return iter([HarvesterTask('t1', 'done')] if self.client.iter_tasks.call_count > 2 else [])
+        self.client.iter_tasks.side_effect = poll
+        results = []
+        threads = [Thread(target=lambda: results.append(self.watcher.wait_for('t1', timeout=5))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [_task('t1')] * 5)
+        self.assertLess(self.client.iter_tasks.call_count, 5)
+
+    def test_watch_yields_in_completion_order(self):
+        self.client.iter_tasks.side_effect = _polls([('t2', 'done')], [('t2', 'done'), ('t1', 'done')])
+        tasks = list(self.watcher.watch(['t1', 't2', 't1'], timeout=5))
+        self.assertEqual(tasks, [_task('t2'), _task('t1')])
+
+    def test_poll_errors_back_off(self):
+        self.client.iter_tasks.side_effect = _polls(Exception(), [('t1', 'done')])
+        self.assertEqual(self.watcher.wait_for('t1', timeout=5), _task('t1'))
+
+    def test_task_registered_during_poll_not_delayed(self):
+        watcher = TaskWatcher(self.client, min_interval=0.01, max_interval=30, backoff=1000, jitter=0)
+        futures = []
+
+        def poll(finished, task_ids):
+            if not futures:
+                # Registered after the poll's snapshot, with a long back off to come.
+                futures.append(watcher._register('t2'))
+                return iter([])
+            return iter([HarvesterTask(task_id, 'done') for task_id in task_ids])
+        self.client.iter_tasks.side_effect = poll
+        try:
+            self.assertEqual(watcher.wait_for('t1', timeout=5), _task('t1'))
+            self.assertEqual(futures[0].result(timeout=0), _task('t2'))
+        finally:
+            watcher.stop()
+
+    def test_wait_for_timeout(self):
+        self.client.iter_tasks.side_effect = _polls([])
+        with self.assertRaises(TimeoutError):
+            self.watcher.wait_for('t1', timeout=0.05)
+
+    def test_next_delay_backs_off_and_resets(self):
+        watcher = TaskWatcher(self.client, min_interval=1, max_interval=4, backoff=2, jitter=0)
+        self.assertEqual([watcher._next_delay(False) for _ in range(3)], [2, 4, 4])
+        self.assertEqual(watcher._next_delay(True), 1)
+
+    def test_diff(self):
+        self.assertTrue(self.watcher._diff([_task('t1', 'running')], ['t1']))
+        self.assertFalse(self.watcher._diff([_task('t1', 'running')], ['t1']))
+        self.assertTrue(self.watcher._diff([_task('t1')], ['t1']))
+        # t1 finished and is no longer watched, so its absence is no change.
+        self.assertFalse(self.watcher._diff([], ['t2']))
+
+    @patch('harvester.watcher.TaskWatcher.wait_for')
+    def test_client_shares_watcher(self, mock_wait_for):
+        client = HarvesterAsyncClient('auth', 'file auth', 'bucket', '/path', 'http://test')
+        self.assertIs(client.watcher, client.watcher)
+        client.wait_for('t1')
+        mock_wait_for.assert_called_once_with('t1', None)
+
+
+def _async_polls(*polls):
+    poll = _polls(*polls)
+
+    async def iter_tasks(finished, task_ids):
+        for task in poll(finished, task_ids):
+            yield task
+    return iter_tasks
+
+
+class TestAsyncTaskWatcher(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.client = Mock(KEY_TASK_ID='task_id', KEY_STATUS='status')
+        self.watcher = AsyncTaskWatcher(self.client, min_interval=0.01, max_interval=0.02, jitter=0)
+
+    async def asyncTearDown(self):
+        await self.watcher.stop()
+
+    async def test_wait_for(self):
+        self.client.iter_tasks.side_effect = _async_polls([], [('t1', 'done')])
+        self.assertEqual(await self.watcher.wait_for('t1', timeout=5), _task('t1'))
+
+    async def test_watch(self):
+        self.client.iter_tasks.side_effect = _async_polls([('t2', 'done')], [('t2', 'done'), ('t1', 'done')])
+        tasks = [task async for task in self.watcher.watch(['t1', 't2'], timeout=5)]
+        self.assertEqual(tasks, [_task('t2'), _task('t1')])
+
+    async def test_timeout_does_not_cancel_other_waiters(self):
+        self.client.iter_tasks.side_effect = _async_polls([], [], [], [], [('t1', 'done')])
+        with self.assertRaises(Exception):
+            await self.watcher.wait_for('t1', timeout=0)
+        self.assertEqual(await self.watcher.wait_for('t1', timeout=5), _task('t1'))